@@ -0,0 +1,74 @@
+#
+# Benchmark suite of the model runners, run with pytest-benchmark
+# (``pip install -e .[bench]``) from the repository root with
+#
+#   python -m pytest benchmarks
+#
+# If a baseline is stored in benchmarks/baselines for the machine (platform
+# and Python version), every run is compared against it, and fails if the
+# fastest round of a benchmark, which is the least affected by noise, is more
+# than COMPARE_FAIL slower. Without one the benchmarks are only timed.
+# Timings depend on the hardware, so a baseline is only stored for the
+# machine that runs the comparison: the CI runner, recorded by running the
+# benchmarks workflow by hand with save_baseline and committing its
+# artifact. Until that baseline is committed the CI gate is pending. A local
+# baseline can be recorded with
+#
+#   python -m pytest benchmarks --benchmark-save=baseline
+#
+# but should not be committed. Passing any of the --benchmark-compare or
+# --benchmark-save options overrides these defaults. Without
+# pytest-benchmark the suite is skipped.
+#
+import os
+
+import numpy as np
+import pytest
+
+import pkmodel as pk
+
+try:
+    from pytest_benchmark.utils import get_machine_id, parse_compare_fail
+except ImportError:
+    collect_ignore_glob = ['test_*.py']
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'baselines')
+BASELINE = '0001'
+COMPARE_FAIL = 'min:50%'
+
+
+def pytest_configure(config):
+    """Compares against the stored baseline of the machine by default."""
+    option = config.option
+    if getattr(option, 'benchmark_storage', None) != 'file://./.benchmarks':
+        return
+    option.benchmark_storage = 'file://' + BASELINES
+    stored = os.path.isdir(os.path.join(BASELINES, get_machine_id()))
+    if stored and not (option.benchmark_compare or option.benchmark_save
+                       or option.benchmark_autosave):
+        option.benchmark_compare = BASELINE
+        if not option.benchmark_compare_fail:
+            option.benchmark_compare_fail = [
+                parse_compare_fail(COMPARE_FAIL)]
+
+
+# (t_end, number of dose spikes) of the regimens
+REGIMENS = {
+    'short': (12, 3),
+    'long': (240, 20),
+    'many_spikes': (24, 100),
+}
+
+
+def model_input(spikes):
+    """Default parameters with a regimen of spikes of 5 ng."""
+    return dict(pk.set_model_args(), dose_shape=0, dose_spikes=spikes,
+                dose_strength=5.0)
+
+
+@pytest.fixture(params=sorted(REGIMENS))
+def regimen(request):
+    """(t_eval with 10 points per hour, model_input) of every regimen."""
+    t_end, spikes = REGIMENS[request.param]
+    return np.linspace(0, t_end, 10 * t_end + 1), model_input(spikes)
@@ -0,0 +1,47 @@
+#
+# Benchmark: start-up time of ``import pkmodel``.
+#
+# Runs ``python -X importtime -c "import pkmodel"`` in a fresh interpreter,
+# prints the slowest imports and exits with an error if the cumulative time
+# of ``import pkmodel`` is above the budget (in milliseconds).
+#
+# Run from the repository root with
+# ``python -m benchmarks.import_time [budget_ms]``.
+#
+import subprocess
+import sys
+
+BUDGET_MS = 250
+REPEATS = 5
+
+
+def import_times():
+    """Returns {module: cumulative import time in ms} of one fresh import.
+    """
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import pkmodel'],
+        capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(cumulative) / 1000
+    return times
+
+
+if __name__ == '__main__':
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else BUDGET_MS
+    # the best of several runs, to reduce noise from the file system cache
+    runs = [import_times() for _ in range(REPEATS)]
+    best = min(runs, key=lambda times: times['pkmodel'])
+    for module, ms in sorted(best.items(), key=lambda x: -x[1])[:10]:
+        print('{:>10.1f} ms  {}'.format(ms, module))
+    heavy = [m for m in ('scipy', 'matplotlib') if m in best]
+    if heavy:
+        sys.exit('import pkmodel imported ' + ', '.join(heavy))
+    if best['pkmodel'] > budget:
+        sys.exit('import pkmodel took {:.1f} ms, budget is {:.1f} ms'.format(
+            best['pkmodel'], budget))
+    print('import pkmodel: {:.1f} ms (budget {:.1f} ms)'.format(
+        best['pkmodel'], budget))
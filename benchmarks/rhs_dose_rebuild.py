@@ -0,0 +1,60 @@
+#
+# Benchmark: cost of rebuilding the dosing function inside the RHS.
+#
+# Compares the number of RHS evaluations and the wall time of a solve when
+# the dosing function is rebuilt on every RHS call (the old behaviour, still
+# what happens when ``dose`` is not passed to an ``rhs_*`` function) against
+# building it once per solve and reusing it.
+#
+# Run from the repository root with
+# ``python -m benchmarks.rhs_dose_rebuild``.
+#
+import time
+
+import numpy as np
+import scipy.integrate
+
+import pkmodel as pk
+
+
+def solve(rhs, t_eval, y0, model_input, prebuilt):
+    """Solves a model with `rhs` and returns (number of RHS calls, seconds).
+    """
+    calls = [0]
+    dose = None
+    if prebuilt:
+        dose = pk.create_dosis_function(t_eval,
+                                        model_input['dose_shape'],
+                                        model_input['dose_spikes'],
+                                        model_input['dose_strength'])
+
+    def fun(t, y):
+        calls[0] += 1
+        return rhs(t, y, model_input, t_eval, dose)
+
+    start = time.perf_counter()
+    scipy.integrate.solve_ivp(fun, t_span=[t_eval[0], t_eval[-1]], y0=y0,
+                              t_eval=t_eval, max_step=t_eval[1] - t_eval[0])
+    return calls[0], time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    t_eval = np.linspace(0, 12, 1201)
+    model_input = pk.set_model_args()
+    model_input['dose_shape'] = 0
+    model_input['dose_spikes'] = 10
+    model_input['dose_strength'] = 5.0
+
+    models = [
+        ('iv_one_compartment', pk.rhs_iv_one_compartment, [0.0]),
+        ('iv_two_compartments', pk.rhs_iv_two_compartments, [0.0, 0.0]),
+        ('subcutaneous', pk.rhs_subcutaneous, [0.0, 0.0, 0.0]),
+    ]
+    print('{:<22}{:>10}{:>14}{:>14}{:>10}'.format(
+        'model', 'RHS calls', 'rebuild [s]', 'once [s]', 'speedup'))
+    for name, rhs, y0 in models:
+        n_before, t_before = solve(rhs, t_eval, y0, model_input, False)
+        n_after, t_after = solve(rhs, t_eval, y0, model_input, True)
+        assert n_before == n_after
+        print('{:<22}{:>10}{:>14.4f}{:>14.4f}{:>9.1f}x'.format(
+            name, n_after, t_before, t_after, t_before / t_after))
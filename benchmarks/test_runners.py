@@ -0,0 +1,67 @@
+#
+# Benchmarks of the model runners, the population solver, the dose schedule
+# and the import of the package. See conftest.py for how to run them.
+#
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import pkmodel as pk
+from conftest import model_input
+
+RUNNERS = [
+    (pk.iv_one_compartment, 1),
+    (pk.iv_two_compartments, 2),
+    (pk.subcutaneous, 3),
+]
+
+
+@pytest.mark.parametrize('method', ['RK45', 'exact'])
+@pytest.mark.parametrize('runner, n', RUNNERS,
+                         ids=[r.__name__ for r, _ in RUNNERS])
+def test_runner(benchmark, regimen, runner, n, method):
+    t_eval, inputs = regimen
+    sol = benchmark(runner, t_eval, np.zeros(n), inputs, method=method)
+    assert sol.success
+
+
+@pytest.mark.parametrize('points', [121, 1201, 12001])
+def test_resolution(benchmark, points):
+    t_eval = np.linspace(0, 12, points)
+    sol = benchmark(pk.subcutaneous, t_eval, np.zeros(3), model_input(3))
+    assert sol.success
+
+
+@pytest.mark.parametrize('method, size', [('RK45', 100), ('exact', 1000)])
+def test_population(benchmark, method, size):
+    t_eval = np.linspace(0, 24, 241)
+    parameters = dict(model_input(4), CL=np.linspace(0.5, 2.0, size))
+    y = benchmark(pk.simulate_population, 'subcutaneous', t_eval,
+                  parameters, method=method)
+    assert y.shape == (size, 3, len(t_eval))
+
+
+def test_dose_build(benchmark):
+    t_eval = np.linspace(0, 240, 2401)
+    benchmark(pk.create_dosis_function, t_eval, 0, 100, 5.0)
+
+
+def test_dose_scalar(benchmark):
+    t_eval = np.linspace(0, 240, 2401)
+    dose = pk.create_dosis_function(t_eval, 0, 100, 5.0)
+    benchmark(lambda: [dose(t) for t in t_eval])
+
+
+def test_dose_vector(benchmark):
+    t = np.linspace(0, 240, 100001)
+    dose = pk.create_dosis_function(t, 0, 100, 5.0)
+    benchmark(dose, t)
+
+
+def test_import(benchmark):
+    # a fresh interpreter, so this includes its start-up time
+    benchmark.pedantic(subprocess.run,
+                       args=([sys.executable, '-c', 'import pkmodel'],),
+                       kwargs={'check': True}, rounds=5)
@@ -3,11 +3,80 @@
 It contains functionality for creating, solving, and visualising the solution
 of Parmokinetic (PK) models
 
+The solvers (which need scipy) and the plotting functions (which need
+matplotlib) are only imported when they are first used, so that
+``import pkmodel`` stays cheap for processes that never solve or plot.
+
 """
+import importlib
+import sys
+import types
+
 # Import version info
 from .version_info import VERSION_INT, VERSION  # noqa
 
 # Import main classes
-from .model import *  # noqa
 from .protocol import *  # noqa
-from .solution import *  # noqa
\ No newline at end of file
+
+# Names provided by the modules that are imported on first use
+_LAZY_MODULES = {
+    'linear': ['rate_matrix', 'propagate', 'periodic_state',
+               'solve_exact'],
+    'cache': ['solution_key', 'SolutionCache'],
+    'fitting': ['sensitivities', 'fit'],
+    'kernels': ['SPARSE_STATES', 'LinearModel', 'IVOneCompartmentModel',
+                'IVTwoCompartmentsModel', 'SubcutaneousModel'],
+    'metrics': ['concentration', 'cmax', 'tmax', 'auc',
+                'terminal_half_life', 'troughs', 'summary'],
+    'montecarlo': ['sample_parameters', 'QuantileSketch', 'monte_carlo'],
+    'model': ['SOLVERS', 'rhs_iv_one_compartment', 'iv_one_compartment',
+              'rhs_iv_two_compartments', 'iv_two_compartments',
+              'rhs_subcutaneous', 'subcutaneous', 'compartment_model',
+              'integrate_piecewise'],
+    'parallel': ['RUNNERS', 'n_states', 'FailedRun', 'run_model',
+                 'iter_runs', 'run_many'],
+    'population': ['POPULATION_MODELS', 'PopulationDose',
+                   'simulate_population', 'iter_population'],
+    'profiling': ['Profile', 'profile'],
+    'service': ['BATCH_OPTIONS', 'SimulationService', 'simulate'],
+    'solution': ['LINES_LIMIT', 'solution', 'plot_drug', 'decimate',
+                 'plot_collection', 'plot_envelope', 'plot_bands'],
+    'superposition': ['grid_regimen', 'UnitResponse'],
+    'store': ['ResultWriter', 'write_results', 'ResultStore',
+              'open_results'],
+}
+_LAZY = {name: module for module, names in _LAZY_MODULES.items()
+         for name in names}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        if name in _LAZY_MODULES:
+            return importlib.import_module('.' + name, __name__)
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name))
+    module_name = _LAZY[name]
+    module = importlib.import_module('.' + module_name, __name__)
+    # bind all names of the module, as a star import would. This also
+    # replaces the submodule attribute set by the import system where a
+    # name and its module coincide (pkmodel.solution)
+    for attribute in _LAZY_MODULES[module_name]:
+        globals()[attribute] = getattr(module, attribute)
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY) | set(_LAZY_MODULES))
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name, value):
+        # the import system binds a submodule to the package once it is
+        # loaded, also by 'import pkmodel.solution'. Where a public name and
+        # its module coincide, keep the name.
+        if isinstance(value, types.ModuleType) and _LAZY.get(name) == name:
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
@@ -0,0 +1,230 @@
+#
+# Memoization of model solutions
+#
+
+# Packages
+import collections
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+from .protocol import DoseSchedule, Protocol
+
+
+def _canonical(value):
+    """Converts numpy scalars and arrays, and dosing schedules, to plain
+    Python values, so that equal inputs give the same JSON."""
+    if isinstance(value, Protocol):
+        return {'Protocol': _canonical([
+            value.bolus_times, value.bolus_amounts, value._times,
+            value._rates])}
+    if isinstance(value, DoseSchedule):
+        return {'DoseSchedule': _canonical([value.starts, value.ends,
+                                            value.strength])}
+    if callable(value):
+        raise TypeError('{!r} cannot be part of a solution key'.format(
+            value))
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (np.ndarray, np.generic)):
+        return _canonical(value.tolist())
+    if isinstance(value, float) and not np.isfinite(value):
+        # JSON has no infinity, as in the always-on DoseSchedule
+        return repr(value)
+    if isinstance(value, float) and value.is_integer():
+        # 1 and 1.0 give the same solution
+        return int(value)
+    return value
+
+
+def solution_key(runner, t_eval, y0, model_input, options=None):
+    """Function that gives a stable hash of everything a solution depends on.
+
+    Inputs
+    ------
+    runner (str or callable): Name of the runner (see RUNNERS) or the
+                              runner itself.
+    t_eval (array): Times at which the solution is returned.
+    y0 (array): Initial conditions
+    model_input (dict): Model parameters and dose settings
+    options (dict): Keyword arguments of the runner, e.g. method, rtol,
+                    protocol. A callback does not change the solution and
+                    is left out; other functions raise a TypeError.
+
+    Outputs
+    -------
+    key (str): Hexadecimal SHA-256 digest. It does not depend on the order
+               of the dicts, nor on the dtype of integer valued numbers.
+    """
+    name = runner if isinstance(runner, str) else '{}.{}'.format(
+        runner.__module__, runner.__qualname__)
+    # the name of a run does not change its solution
+    parameters = {k: v for k, v in model_input.items() if k != 'name'}
+    digest = hashlib.sha256()
+    options = {k: v for k, v in (options or {}).items() if k != 'callback'}
+    digest.update(json.dumps([name, _canonical(parameters),
+                              _canonical(options)],
+                             sort_keys=True).encode())
+    for array in (t_eval, y0):
+        array = np.ascontiguousarray(array, dtype=float)
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+class SolutionCache:
+    """Opt-in cache of model solutions, keyed on the runner, the model
+    parameters and dose settings, the time grid, the initial conditions and
+    the solver options (see solution_key).
+
+    The most recently used solutions are kept in memory, up to maxsize.
+    With a directory, solutions are also written to disk as .npz files, so
+    that they survive the process and can be shared between processes.
+    Cached solutions are returned as new OptimizeResult objects with
+    read-only arrays, which are shared between all hits, and their own
+    copies of dicts such as .diagnostics. A callback option is only called
+    by the solves that run the model.
+
+    Input
+    -----
+    maxsize: int, number of solutions kept in memory
+    directory: str, optional directory of the on-disk tier, created if
+        needed
+
+    Attributes
+    ----------
+    hits: int, number of solves answered from memory or disk
+    disk_hits: int, number of the hits that were read from disk
+    misses: int, number of solves that ran the model
+    """
+
+    def __init__(self, maxsize=128, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._solutions = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._solutions)
+
+    def solve(self, runner, t_eval, y0, model_input, **options):
+        """Returns the solution of a runner, from the cache if possible.
+
+        Input
+        -----
+        runner: str or callable, a key of RUNNERS or a runner with the
+            signature of iv_one_compartment
+        t_eval, y0, model_input, options: passed on to the runner
+
+        Output
+        ------
+        sol: OdeResult with read-only arrays
+        """
+        # an omitted method and the default share one entry
+        options.setdefault('method', 'RK45')
+        key = solution_key(runner, t_eval, y0, model_input, options)
+        sol = self._get(key)
+        if sol is None:
+            if isinstance(runner, str):
+                from .parallel import RUNNERS
+                runner = RUNNERS[runner]
+            sol = runner(t_eval, y0, model_input, **options)
+            sol = self._put(key, sol)
+        return OptimizeResult({k: copy.deepcopy(v) if isinstance(v, dict)
+                               else v for k, v in sol.items()})
+
+    def wrap(self, runner):
+        """Returns a runner with the signature of runner that goes through
+        this cache."""
+        def cached(t_eval, y0, model_input, **options):
+            return self.solve(runner, t_eval, y0, model_input, **options)
+        cached.__name__ = getattr(runner, '__name__', str(runner))
+        cached.__doc__ = getattr(runner, '__doc__', None)
+        return cached
+
+    def clear(self):
+        """Empties the memory tier and resets the counters. Files on disk
+        are kept."""
+        with self._lock:
+            self._solutions.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            if key in self._solutions:
+                self._solutions.move_to_end(key)
+                self.hits += 1
+                return self._solutions[key]
+        sol = self._load(key)
+        with self._lock:
+            if sol is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+        self._remember(key, sol)
+        return sol
+
+    def _put(self, key, sol):
+        sol = OptimizeResult(sol)
+        for name, value in sol.items():
+            if isinstance(value, np.ndarray):
+                value = value.copy()
+                value.flags.writeable = False
+                sol[name] = value
+        self._remember(key, sol)
+        self._save(key, sol)
+        return sol
+
+    def _remember(self, key, sol):
+        with self._lock:
+            self._solutions[key] = sol
+            self._solutions.move_to_end(key)
+            while len(self._solutions) > self.maxsize:
+                self._solutions.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def _save(self, key, sol):
+        """Writes the arrays and the JSON scalars and dicts, such as
+        .diagnostics, of a solution to disk. Other fields, such as dense
+        output, are not kept."""
+        if self.directory is None:
+            return
+        arrays = {k: v for k, v in sol.items() if isinstance(v, np.ndarray)}
+        scalars = {k: _canonical(v) for k, v in sol.items()
+                   if k not in arrays and (
+                       v is None or isinstance(v, (bool, int, float, str,
+                                                   dict, np.generic)))}
+        arrays['__scalars__'] = np.array(json.dumps(scalars))
+        # write to a temporary file first, so that readers never see a
+        # partly written solution
+        fd, tmp = tempfile.mkstemp(suffix='.npz', dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, self._path(key))
+
+    def _load(self, key):
+        if self.directory is None or not os.path.exists(self._path(key)):
+            return None
+        with np.load(self._path(key)) as data:
+            sol = OptimizeResult(json.loads(str(data['__scalars__'])))
+            for name in data.files:
+                if name != '__scalars__':
+                    sol[name] = data[name]
+                    sol[name].flags.writeable = False
+        return sol
@@ -0,0 +1,269 @@
+#
+# Command line interface for running many models without prompts
+#
+# Usage: pkmodel run models.json --workers 8 --format csv --output out.csv
+#
+
+# Packages
+import argparse
+import csv
+import json
+import os
+import sys
+
+import numpy as np
+
+from .protocol import create_dosis_function, set_model_args
+
+# keys of a model specification that are not model parameters
+RUN_KEYS = ('name', 'model', 'y0', 't_eval', 't_start', 't_end', 'n_times')
+OPTION_KEYS = ('method', 'rtol', 'atol', 'no_peripheral', 'dose_comp',
+               'dose_width')
+DEFAULT_TIMES = {'t_start': 0.0, 't_end': 12.0, 'n_times': 121}
+
+
+def read_specs(path):
+    """Function that reads model specifications from a JSON, TOML or CSV
+    file, depending on its extension.
+
+    A JSON file holds a list of specifications, or an object with a list
+    under 'models' and shared values under 'defaults'. A TOML file holds a
+    [defaults] table and a [[models]] array. A CSV file has one model per
+    row and one key per column; empty cells are left out.
+
+    Every specification is a flat dict with the model parameters (as in
+    set_model_args), the dose settings ('dose_shape', 'dose_spikes',
+    'dose_strength'), and optionally 'name', 'model' (a key of RUNNERS,
+    'compartment_model' by default), 'no_peripheral', 'dose_comp',
+    'dose_width', 'method', 'rtol', 'atol', 'y0', and either 't_eval' or
+    't_start', 't_end' and 'n_times'.
+
+    Input
+    -----
+    path: str, path of the file
+
+    Output
+    ------
+    specs: list of dict, model specifications with the defaults applied
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        with open(path, newline='') as f:
+            return [{k: _parse(v) for k, v in row.items() if v != ''}
+                    for row in csv.DictReader(f)]
+
+    if extension == '.toml':
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ImportError('Reading .toml files needs Python 3.11 '
+                                  'or the tomli package (pip install '
+                                  'tomli)') from None
+        with open(path, 'rb') as f:
+            data = tomllib.load(f)
+    elif extension == '.json':
+        with open(path) as f:
+            data = json.load(f)
+    else:
+        raise ValueError('Unknown file type ' + extension
+                         + ', use .json, .toml or .csv')
+
+    if isinstance(data, list):
+        return data
+    defaults = data.get('defaults', {})
+    return [dict(defaults, **spec) for spec in data['models']]
+
+
+def _parse(value):
+    """Converts a CSV cell to a bool, int or float where possible."""
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+
+def make_config(spec, index=0):
+    """Function that turns a model specification (see read_specs) into a
+    configuration for run_model.
+
+    Input
+    -----
+    spec: dict, model specification
+    index: int, position of the specification, used for the default name
+
+    Output
+    ------
+    config: dict, configuration for run_model, with the name of the run
+        under 'name'
+    """
+    model = spec.get('model', 'compartment_model')
+    if 't_eval' in spec:
+        t_eval = np.asarray(spec['t_eval'], dtype=float)
+    else:
+        times = dict(DEFAULT_TIMES, **spec)
+        t_eval = np.linspace(times['t_start'], times['t_end'],
+                             int(times['n_times']))
+
+    options = {k: spec[k] for k in OPTION_KEYS if k in spec}
+    if model != 'compartment_model':
+        options.pop('no_peripheral', None)
+        options.pop('dose_comp', None)
+    if 'dose_comp' in options:
+        options['dose_comp'] = bool(options['dose_comp'])
+
+    model_input = set_model_args()
+    model_input.update({k: v for k, v in spec.items()
+                        if k not in RUN_KEYS + OPTION_KEYS})
+    model_input['name'] = str(spec.get('name', 'model ' + str(index)))
+    return {'name': model_input['name'], 'model': model, 't_eval': t_eval,
+            'y0': spec.get('y0'), 'model_input': model_input,
+            'options': options}
+
+
+def dose_series(config):
+    """Dosing rate of a configuration at its output times."""
+    model_input = config['model_input']
+    dose = create_dosis_function(config['t_eval'], model_input['dose_shape'],
+                                 model_input['dose_spikes'],
+                                 model_input['dose_strength'],
+                                 config['options'].get('dose_width'))
+    return np.broadcast_to(dose(config['t_eval']), config['t_eval'].shape)
+
+
+def _n_compartments(config):
+    """Number of central and peripheral compartments of a configuration."""
+    from .parallel import n_states
+
+    model, options = config['model'], config['options']
+    dose_comp = model == 'subcutaneous' or options.get('dose_comp', False)
+    return n_states(model, options) - bool(dose_comp)
+
+
+def write_json(path, configs, runs):
+    """Writes one JSON object per run, with its times, solution, dose,
+    status and solver diagnostics, as the results arrive."""
+    failed = []
+    with open(path, 'w') as f:
+        f.write('[')
+        for count, (index, sol) in enumerate(runs):
+            config = configs[index]
+            run = {'name': config['name'], 'model': config['model']}
+            if not isinstance(sol, dict):
+                failed.append(sol)
+                run.update(success=False, message=sol.error)
+            else:
+                run.update(success=bool(sol.success), message=sol.message,
+                           diagnostics=sol.get('diagnostics'),
+                           t=sol.t.tolist(), y=sol.y.tolist(),
+                           dose=dose_series(config).tolist())
+                if 'dose_comp' in sol:
+                    run['dose_comp'] = sol.dose_comp.tolist()
+            f.write(',\n' if count else '')
+            json.dump(run, f)
+        f.write(']\n')
+    return failed
+
+
+def write_csv(path, configs, runs):
+    """Writes one row per run and time point: name, t, dose, dose_comp,
+    central and peripheral compartments, as the results arrive. Failed
+    runs are left out."""
+    no_peripheral = max([_n_compartments(c) for c in configs],
+                        default=1) - 1
+    header = (['name', 't', 'dose', 'dose_comp', 'central']
+              + ['peripheral' + str(i) for i in range(1, no_peripheral + 1)])
+    failed = []
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for index, sol in runs:
+            if not isinstance(sol, dict):
+                failed.append(sol)
+                continue
+            config = configs[index]
+            dose = dose_series(config)
+            dose_comp = sol.get('dose_comp')
+            for i, t in enumerate(sol.t):
+                row = [config['name'], t, dose[i],
+                       '' if dose_comp is None else dose_comp[i]]
+                row += list(sol.y[:, i])
+                writer.writerow(row + [''] * (len(header) - len(row)))
+    return failed
+
+
+def write_store(path, configs, runs):
+    """Writes the results to a columnar result store (see ResultWriter),
+    which can be memory mapped on reading, as they arrive. Failed runs are
+    left out."""
+    from .store import ResultWriter
+
+    n_compartments = max([_n_compartments(c) for c in configs], default=1)
+    n_times = max([len(c['t_eval']) for c in configs], default=0)
+
+    def with_dose():
+        for index, sol in runs:
+            if isinstance(sol, dict):
+                sol.dose = dose_series(configs[index])
+            yield index, sol
+
+    with ResultWriter(path, n_compartments, n_times) as writer:
+        return writer.write_runs(with_dose(), configs)
+
+
+WRITERS = {'json': write_json, 'csv': write_csv, 'store': write_store}
+
+
+def run(args):
+    """Runs the models of a specification file and writes every result as
+    soon as it is solved, so memory use does not grow with the number of
+    runs."""
+    from .parallel import iter_runs
+
+    configs = [make_config(spec, i)
+               for i, spec in enumerate(read_specs(args.config))]
+    runs = iter_runs(configs, workers=args.workers,
+                     chunksize=args.chunksize)
+    output = args.output or 'results.' + args.format
+    failed = WRITERS[args.format](output, configs, runs)
+
+    for failure in failed:
+        print('{} failed: {}'.format(configs[failure.index]['name'],
+                                     failure.error), file=sys.stderr)
+    print('{} runs, {} failed, results written to {}'.format(
+        len(configs), len(failed), output), file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    """Entry point of the pkmodel command."""
+    parser = argparse.ArgumentParser(
+        prog='pkmodel', description='Pharmacokinetic model runs.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser(
+        'run', help='Solve the models of a JSON, TOML or CSV file.')
+    run_parser.add_argument('config', help='File with model specifications')
+    run_parser.add_argument('-w', '--workers', type=int, default=None,
+                            help='Number of worker processes '
+                                 '(default: number of CPUs)')
+    run_parser.add_argument('-c', '--chunksize', type=int, default=None,
+                            help='Number of models sent to a worker at once '
+                                 '(default: about 4 chunks per worker)')
+    run_parser.add_argument('-f', '--format', choices=sorted(WRITERS),
+                            default='csv',
+                            help='Output format; store is a directory of '
+                                 'memory mappable columns')
+    run_parser.add_argument('-o', '--output', default=None,
+                            help='Output file (default: results.<format>)')
+    args = parser.parse_args(argv)
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
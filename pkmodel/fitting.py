@@ -0,0 +1,177 @@
+#
+# Estimation of model parameters from observed concentrations
+#
+
+# Packages
+import numpy as np
+from scipy.optimize import least_squares
+
+from .linear import propagate, rate_matrix
+from .protocol import create_dosis_function, spike_width
+
+
+def _log_derivative(model_input, name, no_peripheral, dose_comp):
+    """Derivative of the rate matrix with respect to the logarithm of one
+    parameter, theta dA/dtheta.
+
+    Every entry of the rate matrix is proportional to a parameter, to its
+    inverse, or does not depend on it, so A = A0 + P + M with P the entries
+    proportional to theta and M those proportional to 1/theta. The
+    derivative P - M follows exactly from the matrices at 2 theta and
+    theta / 2, which only differ from A by powers of two.
+    """
+    matrix, _ = rate_matrix(model_input, no_peripheral, dose_comp)
+    value = model_input[name]
+    double, _ = rate_matrix(dict(model_input, **{name: 2 * value}),
+                            no_peripheral, dose_comp)
+    half, _ = rate_matrix(dict(model_input, **{name: value / 2}),
+                          no_peripheral, dose_comp)
+    return 2 * ((double - matrix) - (half - matrix)) / 3
+
+
+def sensitivities(t_eval, y0, model_input, dose, parameters,
+                  no_peripheral=1, dose_comp=False):
+    """Function that solves a compartment model together with its forward
+    sensitivities to the logarithms of some parameters.
+
+    The sensitivities S_j = dq/dlog(theta_j) satisfy
+    dS_j/dt = A S_j + theta_j dA/dtheta_j q, with S_j(0) = 0. The model and
+    all sensitivities form one linear block system, which is solved exactly
+    with propagate, so the gradient costs a single solve.
+
+    Inputs
+    ------
+    t_eval (array): Sorted times at which the solution is returned.
+    y0 (array): Initial condition, shape (n,)
+    model_input (dict): Model parameters, see rate_matrix.
+    dose (DoseSchedule): Dosing rate in time
+    parameters (list): Names of the parameters, e.g. ['V_c', 'CL'].
+    no_peripheral (int): Number of peripheral compartments.
+    dose_comp (bool): Whether a dosing compartment is used.
+
+    Outputs
+    -------
+    y (array): Solution, shape (n, len(t_eval))
+    s (array): Sensitivities, shape (len(parameters), n, len(t_eval))
+    """
+
+    matrix, input_vector = rate_matrix(model_input, no_peripheral, dose_comp)
+    n, p = len(input_vector), len(parameters)
+    block = np.zeros(((p + 1) * n, (p + 1) * n))
+    for j in range(p + 1):
+        block[j * n:(j + 1) * n, j * n:(j + 1) * n] = matrix
+    for j, name in enumerate(parameters, start=1):
+        block[j * n:(j + 1) * n, :n] = _log_derivative(
+            model_input, name, no_peripheral, dose_comp)
+    block_input = np.zeros((p + 1) * n)
+    block_input[:n] = input_vector
+    block_y0 = np.zeros((p + 1) * n)
+    block_y0[:n] = y0
+
+    z = propagate(t_eval, block_y0, block, block_input, dose)
+    return z[:n], z[n:].reshape(p, n, -1)
+
+
+def _default_dose(t_eval, model_input, dose_width):
+    """Dose built from the settings of model_input over t_eval, whose
+    first time is the start of the model and the others are observations,
+    as the runners build it with a t_span."""
+    if dose_width is None and not model_input['dose_shape']:
+        dose_width = spike_width(t_eval[1:], (t_eval[0], t_eval[-1]))
+    return create_dosis_function(t_eval, model_input['dose_shape'],
+                                 model_input['dose_spikes'],
+                                 model_input['dose_strength'], dose_width)
+
+
+def fit(t_obs, c_obs, model_input, parameters=('V_c', 'CL'),
+        no_peripheral=1, dose_comp=False, y0=None, dose=None, t0=0.0,
+        dose_width=None, weights=None, **options):
+    """Function that estimates model parameters by least squares on the
+    concentration in the central compartment.
+
+    The parameters are fitted on a log scale, which keeps them positive.
+    The Jacobian of the residuals comes from the forward sensitivities
+    (see sensitivities), so every optimiser iteration needs one solve of
+    the model instead of one per parameter.
+
+    Inputs
+    ------
+    t_obs (array): Sorted observation times, after t0.
+    c_obs (array): Observed concentrations q_c / V_c at t_obs.
+    model_input (dict): Model parameters and dose settings as in
+                        set_model_args; the fitted ones give the initial
+                        guess.
+    parameters (list): Names of the fitted parameters, any of 'V_c', 'CL',
+                       'Q_pi', 'V_pi' and 'k_a'.
+    no_peripheral (int): Number of peripheral compartments.
+    dose_comp (bool): Whether a dosing compartment is used.
+    y0 (array): Initial condition at t0, zero by default.
+    dose (DoseSchedule or Protocol): Dosing in time. By default it is
+                                     built from the dose settings of
+                                     model_input over (t0, t_obs[-1]), as
+                                     the runners would with that t_span.
+    t0 (float): Start time of the model.
+    dose_width (float): Duration of a dose spike, which needs to be given
+                        for spiked doses built from model_input, as for
+                        the runners with a t_span (see spike_width).
+    weights (array): Optional weights of the residuals, e.g. 1 / sigma.
+    options: Passed on to scipy.optimize.least_squares, e.g. bounds on
+             the log parameters, ftol, loss.
+
+    Outputs
+    -------
+    result (OptimizeResult): The result of least_squares, with the fitted
+                             parameters in .parameters, the full model
+                             input in .model_input and the fitted
+                             concentrations in .c.
+    """
+
+    parameters = list(parameters)
+    t_obs = np.asarray(t_obs, dtype=float)
+    c_obs = np.asarray(c_obs, dtype=float)
+    weights = 1.0 if weights is None else np.asarray(weights, dtype=float)
+    t_eval = np.concatenate([[t0], t_obs])
+    if dose is None:
+        dose = _default_dose(t_eval, model_input, dose_width)
+    if y0 is None:
+        y0 = np.zeros(1 + no_peripheral + dose_comp)
+    central = 1 if dose_comp else 0
+
+    def model(log_theta):
+        values = dict(zip(parameters, np.exp(log_theta)))
+        return dict(model_input, **values)
+
+    def solve(log_theta):
+        current = model(log_theta)
+        y, s = sensitivities(t_eval, y0, current, dose, parameters,
+                             no_peripheral, dose_comp)
+        c = y[central, 1:] / current['V_c']
+        dc = s[:, central, 1:] / current['V_c']
+        if 'V_c' in parameters:
+            dc[parameters.index('V_c')] -= c
+        return c, dc.T
+
+    # least_squares asks for the residuals and the Jacobian separately, at
+    # the same points, so keep the last solve
+    last = {}
+
+    def solved(log_theta):
+        key = log_theta.tobytes()
+        if key not in last:
+            last.clear()
+            last[key] = solve(log_theta)
+        return last[key]
+
+    def residuals(log_theta):
+        return (solved(log_theta)[0] - c_obs) * weights
+
+    def jacobian(log_theta):
+        return solved(log_theta)[1] * np.reshape(weights, (-1, 1))
+
+    x0 = np.log([float(model_input[name]) for name in parameters])
+    result = least_squares(residuals, x0, jac=jacobian, **options)
+    result.model_input = model(result.x)
+    result.parameters = {name: result.model_input[name]
+                         for name in parameters}
+    result.c = solved(result.x)[0]
+    return result
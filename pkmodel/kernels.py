@@ -0,0 +1,114 @@
+#
+# Right hand side kernels of the linear compartment models
+#
+
+# Packages
+import numpy as np
+
+from .linear import rate_matrix
+
+# number of states above which the rate matrix is stored as a sparse matrix
+SPARSE_STATES = 32
+
+
+class LinearModel:
+    """Compartment model dq/dt = A q + b dose(t), with the parameters
+    unpacked once into a contiguous rate matrix.
+
+    The model has a central compartment, any number of peripheral
+    compartments and optionally a dosing compartment (see rate_matrix).
+    Large models store the rate matrix as a sparse matrix, so that the
+    right hand side stays a single sparse mat-vec.
+
+    The rate matrix is the exact, constant Jacobian of the model, so it can
+    be passed as `jac` to the implicit solvers (Radau, BDF, LSODA) instead
+    of having them estimate it by finite differences.
+
+    Input
+    -----
+    model_input: dict, model parameters, see rate_matrix
+    no_peripheral: int, number of peripheral compartments, defaults to the
+        class attribute
+    dose_comp: bool, whether a dosing compartment is used, defaults to the
+        class attribute
+    sparse: bool, whether to store the rate matrix as a sparse matrix.
+        Defaults to True for models with more than SPARSE_STATES states.
+    """
+    no_peripheral = 1
+    dose_comp = False
+
+    def __init__(self, model_input, no_peripheral=None, dose_comp=None,
+                 sparse=None):
+        if no_peripheral is not None:
+            self.no_peripheral = no_peripheral
+        if dose_comp is not None:
+            self.dose_comp = dose_comp
+        n = 1 + self.no_peripheral + self.dose_comp
+        self.sparse = n > SPARSE_STATES if sparse is None else sparse
+        matrix, input_vector = rate_matrix(model_input, self.no_peripheral,
+                                           self.dose_comp, self.sparse)
+        if not self.sparse:
+            matrix = np.ascontiguousarray(matrix)
+        self.matrix = matrix
+        self.n = n
+        # the dose always enters the first state: the dosing compartment
+        # if there is one, the central compartment otherwise
+        self._dosed = int(np.flatnonzero(input_vector)[0])
+
+    @property
+    def jacobian(self):
+        """Constant Jacobian of the right hand side, shape (n, n), sparse
+        for large models."""
+        return self.matrix
+
+    def jac(self, t, y):
+        """Jacobian as a function of time and state, for solvers that only
+        accept a callable of a dense matrix (LSODA)."""
+        if self.sparse:
+            return self.matrix.toarray()
+        return self.matrix
+
+    def rhs(self, t, y, dose, out=None):
+        """Right hand side of the model.
+
+        Input
+        -----
+        t: float, time
+        y: array, state, shape (n,) or (n, k) for k states at once
+        dose: func, dosing rate in time
+        out: array, optional preallocated output with the shape of y. The
+            solvers in scipy.integrate keep references to the arrays they
+            are given, so it should only be reused by callers that copy
+            the result.
+
+        Output
+        ------
+        dq_dt: array, rate of change of the state, written into out if
+            given
+        """
+        if self.sparse:
+            if out is None:
+                out = self.matrix @ y
+            else:
+                out[...] = self.matrix @ y
+        else:
+            out = np.dot(self.matrix, y, out=out)
+        out[self._dosed] += dose(t)
+        return out
+
+
+class IVOneCompartmentModel(LinearModel):
+    """One-compartment IV model, see rhs_iv_one_compartment."""
+    no_peripheral = 0
+
+
+class IVTwoCompartmentsModel(LinearModel):
+    """Two-compartment IV model, see rhs_iv_two_compartments."""
+    no_peripheral = 1
+
+
+class SubcutaneousModel(LinearModel):
+    """Subcutaneous model with a dosing compartment, see rhs_subcutaneous.
+    """
+    no_peripheral = 1
+    dose_comp = True
@@ -0,0 +1,247 @@
+#
+# Exact solutions of the linear compartment models
+#
+
+# Packages
+import numpy as np
+import scipy.linalg
+import scipy.sparse
+from scipy.optimize import OptimizeResult
+
+
+def rate_matrix(model_input, no_peripheral=1, dose_comp=False,
+                sparse=False):
+    """Function that builds the rate matrix A and input vector b of a
+    compartment model, such that the model reads dq/dt = A q + b dose(t).
+
+    The equations are the same as in rhs_iv_one_compartment,
+    rhs_iv_two_compartments and rhs_subcutaneous, with any number of
+    peripheral compartments. The states are ordered as in those functions:
+    dosing compartment (if used), central compartment, peripheral
+    compartments.
+
+    Inputs
+    ------
+    model_input (dict): Model parameters, see set_model_args. Needs 'V_c' and
+                        'CL', 'Q_pi' and 'V_pi' for every peripheral
+                        compartment i and 'k_a' if a dosing compartment is
+                        used. Parameters can be arrays of shape (N,) to
+                        build the matrices of N models at once.
+    no_peripheral (int): Number of peripheral compartments.
+    dose_comp (bool): Whether a dosing compartment is used.
+    sparse (bool): Whether to return A as a scipy.sparse CSR matrix. Only
+                   for scalar parameters.
+
+    Outputs
+    -------
+    matrix (array): Rate matrix A, shape (n, n) or (N, n, n)
+    input_vector (array): Input vector b, shape (n,)
+    """
+
+    offset = 1 if dose_comp else 0
+    n = offset + 1 + no_peripheral
+    c = offset   # index of the central compartment
+    V_c = np.asarray(model_input['V_c'], dtype=float)
+
+    # (row, column, value) of every term, repeated entries are summed
+    entries = [(c, c, -model_input['CL'] / V_c)]
+    for i in range(1, no_peripheral + 1):
+        p = c + i
+        Q_p = model_input['Q_p' + str(i)]
+        V_p = model_input['V_p' + str(i)]
+        entries += [(c, c, -Q_p / V_c), (c, p, 1 / V_p),
+                    (p, c, Q_p / V_c), (p, p, -1 / V_p)]
+    if dose_comp:
+        entries += [(0, 0, -model_input['k_a']), (c, 0, model_input['k_a'])]
+    input_vector = np.zeros(n)
+    input_vector[0] = 1.0
+
+    if sparse:
+        rows, columns, values = zip(*entries)
+        matrix = scipy.sparse.csr_matrix(
+            (np.array(values, dtype=float), (rows, columns)), shape=(n, n))
+        return matrix, input_vector
+
+    batch = np.broadcast_shapes(*[np.shape(value) for _, _, value in entries])
+    matrix = np.zeros(batch + (n, n))
+    for row, column, value in entries:
+        matrix[..., row, column] += value
+    return matrix, input_vector
+
+
+def propagate(t_eval, y0, matrix, input_vector, dose):
+    """Function that solves dq/dt = A q + b dose(t) exactly for a dose that
+    is constant in between its breakpoints.
+
+    The time axis is split at t_eval and at the breakpoints of the dose.
+    On each piece the dose is constant, and the solution is advanced with
+    the matrix exponential of the augmented matrix [[A, b], [0, 0]], which
+    contains both the free decay and the convolution with the constant
+    input. The exponentials are cached by step length, so a uniform grid
+    only needs a handful of them.
+
+    Inputs
+    ------
+    t_eval (array): Sorted times at which the solution is returned.
+                    The solution starts from y0 at t_eval[0].
+    y0 (array): Initial condition, shape (n,) or (N, n)
+    matrix (array): Rate matrix A, shape (n, n), or (N, n, n) to solve
+                    N models at once
+    input_vector (array): Input vector b, shape (n,)
+    dose (DoseSchedule): Dosing rate in time. For N models it may return
+                         one rate per model, shape (N,) for scalar t and
+                         (len(t), N) for an array t. If it has a bolus
+                         method (see Protocol), the boluses are added to
+                         the state as jumps.
+
+    Outputs
+    -------
+    y (array): Solution at t_eval, shape (n, len(t_eval)) or
+               (N, n, len(t_eval))
+    """
+
+    t_eval = np.asarray(t_eval, dtype=float)
+    n = len(input_vector)
+    batch = matrix.shape[:-2]
+    augmented = np.zeros(batch + (n + 1, n + 1))
+    augmented[..., :n, :n] = matrix
+    augmented[..., :n, n] = input_vector
+
+    breaks = dose.breakpoints
+    breaks = breaks[(breaks > t_eval[0]) & (breaks < t_eval[-1])]
+    grid = np.union1d(t_eval, breaks)
+    steps = np.diff(grid)
+    rates = _per_step(dose(grid[:-1] + steps / 2), steps.shape, batch)
+
+    boluses = getattr(dose, 'bolus', None)
+    if boluses is not None:
+        boluses = _per_step(boluses(grid), grid.shape, batch)
+
+    y = np.empty((len(grid),) + batch + (n,))
+    z = np.zeros(batch + (n + 1,))
+    z[..., :n] = y0
+    expm = _expm if batch else scipy.linalg.expm
+    propagators = {}
+    for k in range(len(grid)):
+        if boluses is not None and np.any(boluses[k]):
+            # a bolus is a jump of the dosed compartment, and the solution
+            # is continuous from the right at the jump
+            z[..., :n] += np.multiply.outer(boluses[k], input_vector)
+        y[k] = z[..., :n]
+        if k == len(steps):
+            break
+        # steps of t_eval that only differ by floating point noise share
+        # one propagator, which integrates over the step itself
+        key = float('%.12g' % steps[k])
+        if key not in propagators:
+            propagators[key] = expm(augmented * steps[k])
+        z[..., n] = rates[k]
+        z = np.einsum('...ij,...j->...i', propagators[key], z)
+
+    # repeated times of t_eval are one grid point
+    y = y[np.searchsorted(grid, t_eval)]
+    return np.ascontiguousarray(np.moveaxis(y, 0, -1))
+
+
+def _per_step(values, shape, batch):
+    """Broadcasts dose values per time, shape (len(t),), or per time and
+    model, shape (len(t), N), to shape + batch."""
+    if np.ndim(values) == 1:
+        values = np.reshape(values, (-1,) + (1,) * len(batch))
+    return np.broadcast_to(values, shape + batch)
+
+
+def periodic_state(t_start, period, matrix, input_vector, dose):
+    """Function that gives the periodic steady state of a model whose doses
+    repeat every period.
+
+    After many intervals the state at the start of every interval is the
+    same, x = Phi x + c, with Phi = exp(A period) the propagator of one
+    interval and c the state after one interval started from zero. This is
+    solved directly, instead of simulating until the state stops changing.
+
+    Inputs
+    ------
+    t_start (float): Start of the dosing interval.
+    period (float): Length of the dosing interval.
+    matrix (array): Rate matrix A, shape (n, n) or (N, n, n)
+    input_vector (array): Input vector b, shape (n,)
+    dose (DoseSchedule or Protocol): Dosing over one interval, from
+                                     t_start (included) to t_start + period
+                                     (excluded). Later doses are ignored.
+
+    Outputs
+    -------
+    x (array): State at the start of every interval, before its doses,
+               shape (n,) or (N, n). The model must clear the drug, i.e. A
+               may not have a zero eigenvalue.
+    """
+    n = len(input_vector)
+    end = t_start + period
+    response = propagate([t_start, end], np.zeros(n), matrix, input_vector,
+                         dose)[..., -1]
+    bolus = getattr(dose, 'bolus', None)
+    if bolus is not None:
+        # a bolus at the end belongs to the next interval
+        response = response - np.multiply.outer(bolus(end), input_vector)
+    expm = _expm if matrix.ndim > 2 else scipy.linalg.expm
+    free = expm(matrix * period)
+    return np.linalg.solve(np.eye(n) - free, response[..., None])[..., 0]
+
+
+def _expm(a):
+    """Matrix exponential of a stack of matrices, shape (..., n, n).
+
+    scipy.linalg.expm loops over stacked matrices in Python, which dominates
+    the cost for large populations. This uses a Taylor series of degree 12
+    with scaling and squaring, evaluated with vectorised products over the
+    whole stack. After scaling every matrix has norm below 1/2, where the
+    relative truncation error of the series is about 1e-14, before the
+    squarings amplify it.
+    """
+    norm = np.abs(a).sum(axis=-1).max() if a.size else 0.0
+    squarings = max(0, int(np.ceil(np.log2(norm / 0.5)))) if norm else 0
+    a = a / 2.0 ** squarings
+    term = np.broadcast_to(np.eye(a.shape[-1]), a.shape)
+    result = term.copy()
+    for k in range(1, 13):
+        term = term @ a / k
+        result += term
+    for _ in range(squarings):
+        result = result @ result
+    return result
+
+
+def solve_exact(t_eval, y0, model_input, dose, no_peripheral=1,
+                dose_comp=False):
+    """Function that solves a compartment model exactly (see propagate) and
+    returns the result in the same form as scipy.integrate.solve_ivp.
+
+    Inputs
+    ------
+    t_eval (array): Sorted times at which the solution is returned.
+    y0 (array): Initial condition
+    model_input (dict): Model parameters, see rate_matrix.
+    dose (DoseSchedule or Protocol): Dosing rate in time
+    no_peripheral (int): Number of peripheral compartments.
+    dose_comp (bool): Whether a dosing compartment is used.
+
+    Outputs
+    -------
+    sol (OdeResult-like): Fields of interest: .t and .y, which give the
+                          time points and values of the solution, and
+                          .n_steps, the number of propagation steps.
+    """
+
+    matrix, input_vector = rate_matrix(model_input, no_peripheral, dose_comp)
+    t_eval = np.array(t_eval, dtype=float)
+    y = propagate(t_eval, y0, matrix, input_vector, dose)
+    # propagate takes one step per piece of t_eval split at the breakpoints
+    breaks = dose.breakpoints
+    n_steps = len(t_eval) - 1 + np.count_nonzero(
+        (breaks > t_eval[0]) & (breaks < t_eval[-1])
+        & ~np.isin(breaks, t_eval))
+    return OptimizeResult(
+        t=t_eval, y=y, sol=None, t_events=None, y_events=None,
+        nfev=0, njev=0, nlu=0, n_steps=n_steps, status=0, success=True,
+        message='The exact solution was evaluated at all requested times.')
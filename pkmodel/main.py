@@ -24,29 +24,32 @@ for i in range(no_models):
     m_type[i]['dose_comp'] = pk.type_of_dosis()
 
 t_eval = np.linspace(0, 12, 121)
-sol = [None] * no_models    # a list where each element stores the
-# output of each model run
 
-# determining which type of model to run and running it
+# determining which type of model to run: a central compartment, no_comp - 1
+# peripheral compartments and optionally a dosing compartment
+configs = []
 for m in range(no_models):
-    if m_type[m]['dose_comp']:  # runs 1-compartment m with subcutaneous dosing
-        y0 = np.array([0.0, 0.0, 0.0])
-        sol[m] = pk.subcutaneous(t_eval, y0, m_input[m])
-    elif m_type[m]['no_comp'] == 2:  # runs 2-compartment model with
-        # continuous dosing
-        y0 = np.array([0.0, 0.0])
-        sol[m] = pk.iv_two_compartments(t_eval, y0, m_input[m])
-    else:   # runs 1-compartment model with continuous dosing
-        y0 = np.array([0.0])
-        sol[m] = pk.iv_one_compartment(t_eval, y0, m_input[m])
+    configs.append({'model': 'compartment_model', 't_eval': t_eval,
+                    'model_input': m_input[m],
+                    'options': {'no_peripheral': m_type[m]['no_comp'] - 1,
+                                'dose_comp': m_type[m]['dose_comp']}})
 
+# running all models, a list where each element stores the
+# output of each model run. This script has no __main__ guard, so it stays
+# in one process: worker processes started with 'spawn' (Windows, macOS)
+# would re-run the prompts above.
+sol = pk.run_many(configs, workers=1)
+
+for m in range(no_models):
+    if isinstance(sol[m], pk.FailedRun):
+        raise RuntimeError('model ' + str(m) + ' failed:\n'
+                           + sol[m].traceback)
+    print(sol[m].message)
     dose_func = pk.create_dosis_function(t_eval,
                                          m_input[m]['dose_shape'],
                                          m_input[m]['dose_spikes'],
                                          m_input[m]['dose_strength'])
-    sol[m].dose = []
-    for t in t_eval:
-        sol[m].dose.append(dose_func(t))
+    sol[m].dose = np.broadcast_to(dose_func(t_eval), t_eval.shape)
 
     sol[m].name = 'model ' + str(m)
 
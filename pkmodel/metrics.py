@@ -0,0 +1,152 @@
+#
+# Summary metrics of concentration curves
+#
+# Every function works along the last (time) axis, so a single curve of
+# shape (n_times,) and a population of shape (N, n_times) are handled by the
+# same numpy reductions, without looping over the curves.
+#
+
+# Packages
+import numpy as np
+
+
+def concentration(y, V_c, central=0):
+    """Function that gives the drug concentration in the central compartment.
+
+    Inputs
+    ------
+    y (array): Drug amounts, shape (n_compartments, n_times) as in the .y of
+               a model runner, or (N, n_compartments, n_times) as returned
+               by simulate_population.
+    V_c (float or array): Volume of the central compartment, a scalar or
+                          one value per model, shape (N,).
+    central (int): Index of the central compartment in y. This is 0 for the
+                   .y of the runners, and 1 for populations of the
+                   'subcutaneous' model, which keep the dosing compartment.
+
+    Outputs
+    -------
+    c (array): Concentration q_c / V_c, shape (n_times,) or (N, n_times)
+    """
+    y = np.asarray(y, dtype=float)
+    return y[..., central, :] / np.asarray(V_c, dtype=float)[..., None]
+
+
+def cmax(c):
+    """Maximal concentration of every curve, shape c.shape[:-1]."""
+    return np.max(c, axis=-1)
+
+
+def tmax(t, c):
+    """Time of the maximal concentration of every curve. t is shared by all
+    curves, shape (n_times,), or given per curve, shape c.shape."""
+    index = np.argmax(c, axis=-1)[..., None]
+    t = np.broadcast_to(t, np.shape(c))
+    return np.take_along_axis(t, index, axis=-1)[..., 0]
+
+
+def auc(t, c, method='linear'):
+    """Function that gives the area under the concentration curve by the
+    trapezoidal rule.
+
+    Inputs
+    ------
+    t (array): Times, shape (n_times,) or c.shape
+    c (array): Concentrations, shape (n_times,) or (N, n_times)
+    method (str): 'linear' for the linear trapezoidal rule, or 'log-down'
+                  for the linear rule where the concentration rises and the
+                  logarithmic rule where it falls, which is exact for
+                  exponential decay.
+
+    Outputs
+    -------
+    auc (array): Area under every curve, shape c.shape[:-1]
+    """
+    c = np.asarray(c, dtype=float)
+    dt = np.diff(t, axis=-1)
+    first, second = c[..., :-1], c[..., 1:]
+    area = dt * (first + second) / 2
+    if method == 'log-down':
+        falling = (second < first) & (second > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_area = dt * (first - second) / np.log(first / second)
+        area = np.where(falling, log_area, area)
+    elif method != 'linear':
+        raise ValueError("method needs to be 'linear' or 'log-down'.")
+    return np.sum(area, axis=-1)
+
+
+def terminal_half_life(t, c, n_points=3):
+    """Function that gives the terminal half-life of every curve, from a
+    log-linear least squares fit to its last n_points concentrations.
+
+    Inputs
+    ------
+    t (array): Times, shape (n_times,) or c.shape
+    c (array): Concentrations, shape (n_times,) or (N, n_times)
+    n_points (int): Number of points at the end of the curves to fit.
+
+    Outputs
+    -------
+    half_life (array): ln(2) / lambda_z for every curve, shape c.shape[:-1].
+                       NaN where the curve does not decay or is not positive
+                       over the fitted points.
+    """
+    c = np.asarray(c, dtype=float)[..., -n_points:]
+    t = np.broadcast_to(t, np.shape(c)[:-1] + np.shape(t)[-1:])
+    t = np.asarray(t, dtype=float)[..., -n_points:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_c = np.where(c > 0, np.log(c), np.nan)
+        dt = t - t.mean(axis=-1, keepdims=True)
+        dlog = log_c - log_c.mean(axis=-1, keepdims=True)
+        slope = np.sum(dt * dlog, axis=-1) / np.sum(dt * dt, axis=-1)
+        return np.where(slope < 0, np.log(2) / -slope, np.nan)
+
+
+def troughs(t, c, dose_times):
+    """Function that gives the trough concentration of every dose: the
+    concentration at the last output time before the next dose, and at the
+    last output time for the last dose.
+
+    Inputs
+    ------
+    t (array): Sorted times, shape (n_times,), shared by all curves
+    c (array): Concentrations, shape (n_times,) or (N, n_times)
+    dose_times (array): Sorted start times of the doses, e.g. the .starts
+                        of a DoseSchedule.
+
+    Outputs
+    -------
+    troughs (array): Trough of every dose, shape c.shape[:-1] +
+                     (len(dose_times),)
+    """
+    dose_times = np.asarray(dose_times, dtype=float)
+    index = np.searchsorted(t, dose_times[1:], side='left') - 1
+    index = np.append(np.maximum(index, 0), len(t) - 1)
+    return np.asarray(c)[..., index]
+
+
+def summary(t, c, dose_times=None, n_points=3):
+    """Function that gives all metrics of this module for every curve.
+
+    Inputs
+    ------
+    t (array): Times, shape (n_times,) or c.shape. Must be shared by all
+               curves if dose_times is given.
+    c (array): Concentrations, shape (n_times,) or (N, n_times), see
+               concentration.
+    dose_times (array): Optional start times of the doses, for the troughs.
+    n_points (int): Number of points used for the terminal half-life.
+
+    Outputs
+    -------
+    metrics (dict): 'cmax', 'tmax', 'auc', 'auc_log', 'half_life' and, if
+                    dose_times is given, 'troughs', see the functions of
+                    the same names.
+    """
+    metrics = {'cmax': cmax(c), 'tmax': tmax(t, c), 'auc': auc(t, c),
+               'auc_log': auc(t, c, method='log-down'),
+               'half_life': terminal_half_life(t, c, n_points)}
+    if dose_times is not None:
+        metrics['troughs'] = troughs(t, c, dose_times)
+    return metrics
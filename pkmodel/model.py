@@ -1,9 +1,25 @@
+import logging
+import time
+
+import numpy as np
 import scipy.integrate
+from scipy.optimize import OptimizeResult
 
 import pkmodel as pk
 
+logger = logging.getLogger(__name__)
+
+SOLVERS = {
+    'RK23': scipy.integrate.RK23,
+    'RK45': scipy.integrate.RK45,
+    'DOP853': scipy.integrate.DOP853,
+    'Radau': scipy.integrate.Radau,
+    'BDF': scipy.integrate.BDF,
+    'LSODA': scipy.integrate.LSODA,
+}
+
 
-def rhs_iv_one_compartment(t, y, model_input, t_eval):
+def rhs_iv_one_compartment(t, y, model_input, t_eval, dose=None):
     '''Defines a one-compartment IV model.
 
     Parameters
@@ -32,6 +48,11 @@ def rhs_iv_one_compartment(t, y, model_input, t_eval):
     :param `X`: is the dose in ng of the drug.
     :type X: float
 
+    :param dose: `dose` is the dosing function returned by
+        create_dosis_function. If None, it is built from `model_input`
+        and `t_eval` on every call.
+    :type dose: func
+
     Return
     ----------
     :return dqc_dt: `dqc_dt` is the rate of change of the drug in the
@@ -41,18 +62,19 @@ def rhs_iv_one_compartment(t, y, model_input, t_eval):
     '''
 
     q_c = y
-    dose = pk.create_dosis_function(t_eval,
-                                    model_input['dose_shape'],
-                                    model_input['dose_spikes'],
-                                    model_input['dose_strength'])
+    if dose is None:
+        dose = pk.create_dosis_function(t_eval,
+                                        model_input['dose_shape'],
+                                        model_input['dose_spikes'],
+                                        model_input['dose_strength'])
     dqc_dt = dose(t) - q_c / model_input['V_c'] * model_input['CL']
     return [dqc_dt]
 
 
-def iv_one_compartment(t_eval, y0, model_input):
+def iv_one_compartment(t_eval, y0, model_input, method='RK45', **options):
     '''Solves the differential equations of a one-compartment
     IV dosing model (as described in rhs_iv_one_compartment)
-    using scipy.integrate.solve_ivp.
+    using compartment_model.
 
     Parameters
     ----------
@@ -81,6 +103,14 @@ def iv_one_compartment(t_eval, y0, model_input):
     :param `X`: is the dose in ng of the drug.
     :type X: float
 
+    :param method: `method` is the name of the solver (see SOLVERS), or
+        'exact' to use the exact solution of the linear model (see
+        solve_exact).
+    :type method: str
+
+    :param options: `options` are passed on to compartment_model, e.g.
+        protocol, t_span, and to the solver, e.g. rtol, atol.
+
     Return
     ----------
     :return sol_iv_one_compartment: `sol_iv_one_compartment` contains
@@ -90,18 +120,14 @@ def iv_one_compartment(t_eval, y0, model_input):
     :rtype sol_iv_one_compartment: bunch object OdeResult
     '''
 
-    sol_iv_one_compartment = scipy.integrate.solve_ivp(
-        fun=lambda t, y: rhs_iv_one_compartment(t, y, model_input, t_eval),
-        t_span=[t_eval[0], t_eval[-1]],
-        y0=y0, t_eval=t_eval, max_step=t_eval[1] - t_eval[0]
-    )
-    print(sol_iv_one_compartment.message)
+    sol_iv_one_compartment = compartment_model(
+        t_eval, y0, model_input, no_peripheral=0, method=method, **options)
     return sol_iv_one_compartment
 
 # --- Two compartments --------------------------
 
 
-def rhs_iv_two_compartments(t, y, model_input, t_eval):
+def rhs_iv_two_compartments(t, y, model_input, t_eval, dose=None):
 
     '''Defines a two-compartment IV model (main and peripheral compartments).
     Parameters
@@ -130,6 +156,11 @@ def rhs_iv_two_compartments(t, y, model_input, t_eval):
     :param `X`: is the dose in ng of the drug.
     :type X: float
 
+    :param dose: `dose` is the dosing function returned by
+        create_dosis_function. If None, it is built from `model_input`
+        and `t_eval` on every call.
+    :type dose: func
+
     Return
     ----------
     :return dqc_dt: `dqc_dt` is the rate of change of the drug in the main
@@ -147,10 +178,11 @@ def rhs_iv_two_compartments(t, y, model_input, t_eval):
     transition = (model_input['Q_p1'] * q_c / model_input['V_c']
                   - q_p1 / model_input['V_p1'])
 
-    dose = pk.create_dosis_function(t_eval,
-                                    model_input['dose_shape'],
-                                    model_input['dose_spikes'],
-                                    model_input['dose_strength'])
+    if dose is None:
+        dose = pk.create_dosis_function(t_eval,
+                                        model_input['dose_shape'],
+                                        model_input['dose_spikes'],
+                                        model_input['dose_strength'])
     dqc_dt = (dose(t) - q_c / model_input['V_c'] * model_input['CL']
               - transition)
     dqp1_dt = transition
@@ -158,10 +190,10 @@ def rhs_iv_two_compartments(t, y, model_input, t_eval):
     return [dqc_dt, dqp1_dt]
 
 
-def iv_two_compartments(t_eval, y0, model_input):
+def iv_two_compartments(t_eval, y0, model_input, method='RK45', **options):
     '''Solves the differential equations of a two-compartment
     IV dosing model (as described in rhs_iv_two_compartments)
-    using scipy.integrate.solve_ivp.
+    using compartment_model.
 
     Parameters
     ----------
@@ -190,6 +222,14 @@ def iv_two_compartments(t_eval, y0, model_input):
     :param `X`: is the dose in ng of the drug.
     :type X: float
 
+    :param method: `method` is the name of the solver (see SOLVERS), or
+        'exact' to use the exact solution of the linear model (see
+        solve_exact).
+    :type method: str
+
+    :param options: `options` are passed on to compartment_model, e.g.
+        protocol, t_span, and to the solver, e.g. rtol, atol.
+
     Return
     ----------
     :return: `sol_iv_two_compartments` contains the solutions to
@@ -199,18 +239,14 @@ def iv_two_compartments(t_eval, y0, model_input):
     :rtype sol_iv_two_compartments: bunch object OdeResult
     '''
 
-    sol_iv_two_compartments = scipy.integrate.solve_ivp(
-        fun=lambda t, y: rhs_iv_two_compartments(t, y, model_input, t_eval),
-        t_span=[t_eval[0], t_eval[-1]],
-        y0=y0, t_eval=t_eval, max_step=t_eval[1] - t_eval[0]
-    )
-    print(sol_iv_two_compartments.message)
+    sol_iv_two_compartments = compartment_model(
+        t_eval, y0, model_input, no_peripheral=1, method=method, **options)
     return sol_iv_two_compartments
 
 # --- Subcutaneous ------------------------------
 
 
-def rhs_subcutaneous(t, y, model_input, t_eval):
+def rhs_subcutaneous(t, y, model_input, t_eval, dose=None):
     '''Defines a subcutaneous injection delivery model with an initial
     dosing compartment and an additional peripheral compartment.
 
@@ -240,6 +276,11 @@ def rhs_subcutaneous(t, y, model_input, t_eval):
     :param `X`: is the dose in ng of the drug.
     :type X: float
 
+    :param dose: `dose` is the dosing function returned by
+        create_dosis_function. If None, it is built from `model_input`
+        and `t_eval` on every call.
+    :type dose: func
+
     Return
     ----------
     :return dq0_dt: `dq0_dt` is the rate of change of the drug in
@@ -258,10 +299,11 @@ def rhs_subcutaneous(t, y, model_input, t_eval):
 
     transition = (model_input['Q_p1'] * q_c / model_input['V_c']
                   - q_p1 / model_input['V_p1'])
-    dose = pk.create_dosis_function(t_eval,
-                                    model_input['dose_shape'],
-                                    model_input['dose_spikes'],
-                                    model_input['dose_strength'])
+    if dose is None:
+        dose = pk.create_dosis_function(t_eval,
+                                        model_input['dose_shape'],
+                                        model_input['dose_spikes'],
+                                        model_input['dose_strength'])
     dq0_dt = dose(t) - model_input['k_a'] * q_0
     dqc_dt = (model_input['k_a'] * q_0
               - q_c / model_input['V_c'] * model_input['CL'] - transition)
@@ -270,9 +312,9 @@ def rhs_subcutaneous(t, y, model_input, t_eval):
     return [dq0_dt, dqc_dt, dqp1_dt]
 
 
-def subcutaneous(t_eval, y0, model_input):
+def subcutaneous(t_eval, y0, model_input, method='RK45', **options):
     '''Solves the differential equations involved in subcutaneous dosing
-    (as described in rhs_subcutaneous) using scipy.integrate.solve_ivp.
+    (as described in rhs_subcutaneous) using compartment_model.
 
     Parameters
     ----------
@@ -301,6 +343,14 @@ def subcutaneous(t_eval, y0, model_input):
     :param `X`: is the dose in ng of the drug.
     :type X: float
 
+    :param method: `method` is the name of the solver (see SOLVERS), or
+        'exact' to use the exact solution of the linear model (see
+        solve_exact).
+    :type method: str
+
+    :param options: `options` are passed on to compartment_model, e.g.
+        protocol, t_span, and to the solver, e.g. rtol, atol.
+
     Return
     ----------
     :return sol_subcutaneous: `sol_subcutaneous` contains the solutions
@@ -311,15 +361,281 @@ def subcutaneous(t_eval, y0, model_input):
 
     '''
 
-    sol_subcutaneous = scipy.integrate.solve_ivp(
-        fun=lambda t, y: rhs_subcutaneous(t, y, model_input, t_eval),
-        t_span=[t_eval[0], t_eval[-1]],
-        y0=y0, t_eval=t_eval, max_step=t_eval[1] - t_eval[0]
-    )
+    sol_subcutaneous = compartment_model(
+        t_eval, y0, model_input, no_peripheral=1, dose_comp=True,
+        method=method, **options)
+    return sol_subcutaneous
 
-    sol_subcutaneous.dose_comp = sol_subcutaneous.y[0]
-    sol_subcutaneous.y = sol_subcutaneous.y[1:]
 
-    print(sol_subcutaneous.message)
-    return sol_subcutaneous
+# --- General compartment model -----------------
+
+
+def compartment_model(t_eval, y0, model_input, no_peripheral=1,
+                      dose_comp=False, method='RK45', protocol=None,
+                      steady_state=False, t_span=None, dose_width=None,
+                      callback=None, **options):
+    '''Solves the differential equations of a model with a central
+    compartment, any number of peripheral compartments and an optional
+    dosing compartment. The model is assembled into one rate matrix (see
+    rate_matrix and LinearModel), so the right hand side is a single
+    mat-vec, and integrated with integrate_piecewise.
+
+    Parameters
+    ----------
+    :param t_eval: `t_eval` is an array containing the timespan over which
+        to evaluate the differential equations.
+    :type t_eval: array
+
+    :param y0: `y0` is an array containing the initial conditions for the
+        differential equations: dosing compartment (if used), central
+        compartment, peripheral compartments.
+    :type y0: array
+
+    :param model_input: `model_input` is a dictionary containing V_c, CL,
+        Q_pi and V_pi for every peripheral compartment i, k_a if a dosing
+        compartment is used, and the dose settings dose_shape, dose_spikes
+        and dose_strength.
+    :type model_input: dict
+
+    :param no_peripheral: `no_peripheral` is the number of peripheral
+        compartments.
+    :type no_peripheral: int
+
+    :param dose_comp: `dose_comp` is whether a dosing compartment is used.
+    :type dose_comp: bool
+
+    :param method: `method` is the name of the solver (see SOLVERS), or
+        'exact' to use the exact solution of the linear model (see
+        solve_exact).
+    :type method: str
+
+    :param protocol: `protocol` is an optional dosing Protocol, used
+        instead of the dose settings of model_input.
+    :type protocol: Protocol
+
+    :param steady_state: `steady_state` is whether to start from the
+        periodic steady state of the dose over t_span repeated forever
+        (see periodic_state) instead of y0. The solution then covers one
+        dosing interval at steady state.
+    :type steady_state: bool
+
+    :param t_span: `t_span` is the interval (t0, t_end) over which the
+        doses of model_input are spread, starting from y0 at t0. By
+        default it is (t_eval[0], t_eval[-1]). The model is only solved up
+        to t_eval[-1], and only the times in t_eval are returned, so t_eval
+        can hold a few irregular observation times.
+    :type t_span: tuple
+
+    :param dose_width: `dose_width` is the duration of a dose spike. By
+        default it is t_eval[1] - t_eval[0] (see spike_width); it needs to
+        be given for spiked doses together with t_span.
+    :type dose_width: float
+
+    :param callback: `callback` is an optional function that is called
+        with the diagnostics of the solve (see below). The diagnostics are
+        also logged to the 'pkmodel.model' logger, at DEBUG level, or at
+        WARNING level if the solver failed.
+    :type callback: func
+
+    :param options: `options` are passed on to the solver, e.g. rtol, atol.
+
+    Return
+    ----------
+    :return sol_compartment_model: `sol_compartment_model` contains the
+        solutions of the central compartment (.y[0]) and the peripheral
+        compartments (.y[1:]), and of the dosing compartment as .dose_comp
+        if it is used. .diagnostics is a dict with the solver 'method',
+        the number of right hand side evaluations 'nfev', Jacobian
+        evaluations 'njev', LU decompositions 'nlu' and steps 'n_steps'
+        (matrix exponential steps for method 'exact'), the 'wall_time' of
+        the solve in seconds, and its 'status' and 'message'. If
+        profiling is on (see pkmodel.profiling), .profile holds the calls
+        and times of the right hand side, the dose and the solver.
+    :rtype sol_compartment_model: bunch object OdeResult
+    '''
+
+    t_eval = np.asarray(t_eval, dtype=float)
+    if dose_width is None and protocol is None \
+            and not model_input['dose_shape']:
+        dose_width = pk.spike_width(t_eval, t_span)
+    if t_span is None:
+        t_span = (t_eval[0], t_eval[-1])
+    t_span = np.asarray(t_span, dtype=float)
+    if np.any(np.diff(t_eval) < 0) or t_eval[0] < t_span[0]:
+        raise ValueError('t_eval needs to be sorted and start within t_span.')
+
+    # timings of this solve if profiling is on, see pkmodel.profiling
+    run = pk.profiling.new_run()
+    dose = protocol
+    if dose is None:
+        build = pk.profiling.instrument(run, 'dose_build',
+                                        pk.create_dosis_function)
+        dose = build(t_span, model_input['dose_shape'],
+                     model_input['dose_spikes'],
+                     model_input['dose_strength'], dose_width)
+    if steady_state:
+        matrix, input_vector = pk.rate_matrix(model_input, no_peripheral,
+                                              dose_comp)
+        y0 = pk.periodic_state(t_span[0], t_span[-1] - t_span[0], matrix,
+                               input_vector, dose)
+
+    # start from y0 at t0 and drop that time again if it was not asked for
+    start = t_eval[0] > t_span[0]
+    times = np.concatenate([t_span[:1], t_eval]) if start else t_eval
+    dose = pk.profiling.instrument_dose(run, dose)
+    wall_time = time.perf_counter()
+    if method == 'exact':
+        sol_compartment_model = pk.solve_exact(
+            times, y0, model_input, dose, no_peripheral, dose_comp)
+    else:
+        model = pk.LinearModel(model_input, no_peripheral, dose_comp)
+        _set_jacobian(model, method, options)
+        sol_compartment_model = integrate_piecewise(
+            pk.profiling.instrument(run, 'rhs', model.rhs), times, y0, dose,
+            method, **options)
+    wall_time = time.perf_counter() - wall_time
+    pk.profiling.finish_run(run, wall_time, sol_compartment_model)
+    if start:
+        sol_compartment_model.t = sol_compartment_model.t[1:]
+        sol_compartment_model.y = sol_compartment_model.y[:, 1:]
+
+    if dose_comp:
+        sol_compartment_model.dose_comp = sol_compartment_model.y[0]
+        sol_compartment_model.y = sol_compartment_model.y[1:]
+
+    _report(sol_compartment_model, method, wall_time, callback)
+    return sol_compartment_model
+
+
+# --- Integration driver ------------------------
+
+
+def _report(sol, method, wall_time, callback=None):
+    '''Attaches the diagnostics of a solve to `sol` as .diagnostics, logs
+    them and passes them to `callback`.
+    '''
+    sol.diagnostics = {
+        'method': method, 'nfev': int(sol.nfev), 'njev': int(sol.njev),
+        'nlu': int(sol.nlu), 'n_steps': int(sol.n_steps),
+        'wall_time': wall_time, 'status': int(sol.status),
+        'message': sol.message}
+    level = logging.DEBUG if sol.status == 0 else logging.WARNING
+    if logger.isEnabledFor(level):
+        logger.log(level, '%s: %s (%d rhs evaluations, %d steps, %.3g s)',
+                   method, sol.message, sol.nfev, sol.n_steps, wall_time,
+                   extra={'diagnostics': sol.diagnostics})
+    if callback is not None:
+        callback(sol.diagnostics)
+
+
+def _set_jacobian(model, method, options):
+    '''Passes the exact Jacobian of `model` to the implicit solvers. Radau
+    and BDF get the constant matrix, LSODA only accepts a callable.
+    '''
+    if method in ('Radau', 'BDF'):
+        options.setdefault('jac', model.jacobian)
+    elif method == 'LSODA':
+        options.setdefault('jac', model.jac)
+
+
+def integrate_piecewise(rhs, t_eval, y0, dose, method='RK45', **options):
+    '''Integrates a model whose dose is constant in between the breakpoints
+    of the dosing schedule.
+
+    The time span [t_eval[0], t_eval[-1]] is split at the breakpoints of
+    `dose`. Each piece is smooth, so it is integrated with free step size
+    control, and the solution is read off the dense output at the points of
+    t_eval that fall inside each step. Narrow dose spikes can therefore not
+    be stepped over, without capping the step size everywhere else.
+
+    Parameters
+    ----------
+    :param rhs: `rhs` is the right hand side of the model, called as
+        rhs(t, y, dose) with `dose` a function of time.
+    :type rhs: func
+
+    :param t_eval: `t_eval` is a sorted array of the times at which the
+        solution is returned. The solution starts from y0 at t_eval[0].
+    :type t_eval: array
+
+    :param y0: `y0` is an array containing the initial conditions.
+    :type y0: array
+
+    :param dose: `dose` is the dosing schedule, see create_dosis_function,
+        or a Protocol, whose boluses are added to the first state (the
+        dosed compartment) as jumps at their times.
+    :type dose: DoseSchedule or Protocol
+
+    :param method: `method` is the name of the solver, one of the keys of
+        SOLVERS.
+    :type method: str
+
+    :param options: `options` are passed on to the solver, e.g. rtol, atol.
+
+    Return
+    ----------
+    :return sol: `sol` contains the solution at t_eval in the same
+        form as scipy.integrate.solve_ivp, with the number of solver steps
+        as .n_steps.
+    :rtype sol: bunch object OdeResult
+    '''
 
+    t_eval = np.array(t_eval, dtype=float)
+    breaks = dose.breakpoints
+    breaks = breaks[(breaks > t_eval[0]) & (breaks < t_eval[-1])]
+    edges = np.concatenate([t_eval[:1], breaks, t_eval[-1:]])
+    bolus = getattr(dose, 'bolus', None)
+
+    y = np.array(y0, dtype=float)
+    y_eval = np.empty((len(y), len(t_eval)))
+    y_eval[:, 0] = y
+    result = {'nfev': 0, 'njev': 0, 'nlu': 0, 'n_steps': 0}
+    status = 0
+    message = 'The solver successfully reached the end of the integration ' \
+              'interval.'
+    i = 1   # next index of t_eval to be filled
+    for start, end in zip(edges[:-1], edges[1:]):
+        amount = 0.0 if bolus is None else bolus(start)
+        if amount:
+            # a bolus is a jump of the dosed compartment, and the solution
+            # is continuous from the right at the jump
+            y = y.copy()
+            y[0] += amount
+            # every copy of a repeated time gets the state after the jump
+            y_eval[:, :i][:, t_eval[:i] == start] = y[:, None]
+        rate = dose((start + end) / 2)
+
+        def fun(t, y):
+            return rhs(t, y, lambda _: rate)
+
+        solver = SOLVERS[method](fun, start, y, end, **options)
+        i = _step_segment(solver, t_eval, y_eval, i, result)
+        if solver.status == 'failed':
+            status, message = -1, solver.message
+            break
+        y = solver.y
+
+    if bolus is not None and i == len(t_eval):
+        y_eval[0, -1] += bolus(edges[-1])
+    return OptimizeResult(
+        t=t_eval[:i], y=y_eval[:, :i], sol=None, t_events=None,
+        y_events=None, status=status, message=message, success=status == 0,
+        **result)
+
+
+def _step_segment(solver, t_eval, y_eval, i, result):
+    """Steps solver to the end of its piece, fills y_eval at the points of
+    t_eval from index i on that it passes and adds its counters to result.
+    Returns the next index of t_eval to be filled."""
+    while solver.status == 'running':
+        solver.step()
+        result['n_steps'] += 1
+        if solver.status == 'failed':
+            break
+        stop = np.searchsorted(t_eval, solver.t, side='right')
+        if stop > i:
+            y_eval[:, i:stop] = solver.dense_output()(t_eval[i:stop])
+            i = stop
+    for key in ('nfev', 'njev', 'nlu'):
+        result[key] += getattr(solver, key)
+    return i
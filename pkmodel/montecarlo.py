@@ -0,0 +1,145 @@
+#
+# Prediction intervals by Monte Carlo simulation of between-subject
+# variability
+#
+
+# Packages
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+from .metrics import concentration
+from .population import POPULATION_MODELS, iter_population
+
+
+def sample_parameters(typical, variability, n, rng=None):
+    """Function that draws log-normally distributed parameter sets.
+
+    Every parameter named in variability is theta * exp(omega * eta), with
+    theta its typical value, omega its between-subject variability (the
+    standard deviation of its logarithm) and eta standard normal.
+
+    Inputs
+    ------
+    typical (dict): Typical parameters, e.g. set_model_args with dose
+                    settings.
+    variability (dict): omega of every varying parameter, e.g.
+                        {'CL': 0.3, 'V_c': 0.2}.
+    n (int): Number of parameter sets.
+    rng (Generator): Random number generator, np.random.default_rng() by
+                     default.
+
+    Outputs
+    -------
+    parameters (dict): The varying parameters as arrays of shape (n,), the
+                       others as in typical, see simulate_population.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    names = list(variability)
+    omega = np.array([variability[k] for k in names], dtype=float)
+    theta = np.array([typical[k] for k in names], dtype=float)
+    samples = theta * np.exp(omega * rng.standard_normal((n, len(names))))
+    parameters = dict(typical)
+    parameters.update(zip(names, samples.T))
+    return parameters
+
+
+class QuantileSketch:
+    """Running estimate of the quantiles at every time point of a stream of
+    curves, in bounded memory.
+
+    A uniform random sample (reservoir) of at most size curves is kept, and
+    the quantiles are those of the sample. They are exact as long as no
+    more than size curves were added, and otherwise have a sampling error
+    of order sqrt(q (1 - q) / size). The mean is computed exactly.
+
+    Input
+    -----
+    n_times: int, number of time points of a curve
+    size: int, maximal number of curves kept
+    rng: Generator, random number generator for the sampling
+    """
+
+    def __init__(self, n_times, size=10000, rng=None):
+        self.size = size
+        self.count = 0
+        self._rng = np.random.default_rng() if rng is None else rng
+        self._sample = np.empty((size, n_times))
+        self._sum = np.zeros(n_times)
+
+    def update(self, curves):
+        """Adds curves, shape (k, n_times)."""
+        curves = np.asarray(curves, dtype=float)
+        self._sum += curves.sum(axis=0)
+        k = len(curves)
+        free = min(max(self.size - self.count, 0), k)
+        self._sample[self.count:self.count + free] = curves[:free]
+        # reservoir sampling: the i-th curve replaces a random one with
+        # probability size / i. On repeated slots the last curve wins, as
+        # it would when they are added one by one.
+        seen = self.count + np.arange(free, k) + 1
+        slots = (self._rng.random(k - free) * seen).astype(int)
+        keep = slots < self.size
+        self._sample[slots[keep]] = curves[free:][keep]
+        self.count += k
+
+    @property
+    def mean(self):
+        """Mean of all curves added, shape (n_times,)."""
+        return self._sum / self.count
+
+    def quantiles(self, q):
+        """Quantiles q of the curves at every time point, shape
+        (len(q), n_times)."""
+        return np.quantile(self._sample[:min(self.count, self.size)],
+                           q, axis=0)
+
+
+def monte_carlo(model, t_eval, typical, variability, n_samples=1000,
+                quantiles=(0.05, 0.5, 0.95), chunk_size=1000,
+                sketch_size=10000, seed=None, method='exact', t_span=None,
+                dose_width=None, **options):
+    """Function that gives prediction intervals of the concentration in the
+    central compartment under between-subject variability.
+
+    Parameters are drawn in chunks (see sample_parameters), every chunk is
+    solved at once (see iter_population) and reduced into a QuantileSketch,
+    so memory does not grow with n_samples.
+
+    Inputs
+    ------
+    model (str): One of the keys of POPULATION_MODELS.
+    t_eval (array): Times at which the bands are returned.
+    typical (dict): Typical parameters with dose settings.
+    variability (dict): omega of every varying parameter.
+    n_samples (int): Number of simulated subjects.
+    quantiles (list): Quantile levels of the bands.
+    chunk_size (int): Number of subjects solved together.
+    sketch_size (int): Number of curves kept for the quantiles; the bands
+                       are exact if n_samples is not larger.
+    seed (int): Seed of the random number generator.
+    method (str): Solver name (see SOLVERS), or 'exact'.
+    t_span (tuple): Interval of the doses, see simulate_population.
+    dose_width (float): Duration of a dose spike, see simulate_population.
+    options: Passed on to the solver, e.g. rtol, atol.
+
+    Outputs
+    -------
+    bands (OptimizeResult): .t, .quantiles (the levels), .bands (the
+                            concentration quantiles, shape
+                            (len(quantiles), len(t_eval))), .mean and
+                            .n_samples.
+    """
+    rng = np.random.default_rng(seed)
+    t_eval = np.asarray(t_eval, dtype=float)
+    central = 1 if POPULATION_MODELS[model][2] else 0
+    sketch = QuantileSketch(len(t_eval), sketch_size, rng)
+    for start in range(0, n_samples, chunk_size):
+        n = min(chunk_size, n_samples - start)
+        parameters = sample_parameters(typical, variability, n, rng)
+        for _, y in iter_population(model, t_eval, parameters, n,
+                                    method=method, t_span=t_span,
+                                    dose_width=dose_width, **options):
+            sketch.update(concentration(y, parameters['V_c'], central))
+    return OptimizeResult(t=t_eval, quantiles=np.asarray(quantiles),
+                          bands=sketch.quantiles(quantiles),
+                          mean=sketch.mean, n_samples=n_samples)
@@ -0,0 +1,205 @@
+#
+# Running many independent models in parallel
+#
+
+# Packages
+import collections
+import concurrent.futures
+import itertools
+import math
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .model import (compartment_model, iv_one_compartment,
+                    iv_two_compartments, subcutaneous)
+
+RUNNERS = {
+    'iv_one_compartment': iv_one_compartment,
+    'iv_two_compartments': iv_two_compartments,
+    'subcutaneous': subcutaneous,
+    'compartment_model': compartment_model,
+}
+
+
+def n_states(model, options=None):
+    """Function that gives the number of states of a model.
+
+    Input
+    -----
+    model: str, one of the keys of RUNNERS
+    options: dict, keyword arguments of the runner, which set the number
+        of compartments of 'compartment_model'
+
+    Output
+    ------
+    n: int, number of states, including the dosing compartment
+    """
+    if model == 'compartment_model':
+        options = options or {}
+        return (1 + options.get('no_peripheral', 1)
+                + bool(options.get('dose_comp', False)))
+    return {'iv_one_compartment': 1, 'iv_two_compartments': 2,
+            'subcutaneous': 3}[model]
+
+
+class FailedRun:
+    """Placeholder for a model run that raised an error.
+
+    Attributes
+    ----------
+    index: int, position of the run in the list of configurations
+    error: str, type and message of the error
+    traceback: str, formatted traceback of the error
+    """
+
+    def __init__(self, index, error, traceback):
+        self.index = index
+        self.error = error
+        self.traceback = traceback
+
+    def __repr__(self):
+        return 'FailedRun(index={}, error={!r})'.format(self.index,
+                                                        self.error)
+
+
+def run_model(config):
+    """Function that runs one model configuration.
+
+    Input
+    -----
+    config: dict with keys
+        'model': str, one of the keys of RUNNERS
+        't_eval': array, times at which the solution is returned
+        'model_input': dict, model parameters and dose settings
+        'y0': array, optional initial condition, zero by default
+        'options': dict, optional keyword arguments of the runner, e.g.
+            method, rtol
+
+    Output
+    ------
+    sol: OdeResult, the solution returned by the runner
+    """
+    model = config['model']
+    options = config.get('options', {})
+    y0 = config.get('y0')
+    if y0 is None:
+        y0 = np.zeros(n_states(model, options))
+    return RUNNERS[model](np.asarray(config['t_eval'], dtype=float),
+                          np.asarray(y0, dtype=float),
+                          config['model_input'], **options)
+
+
+def _run_indexed(item):
+    index, config = item
+    try:
+        return run_model(config)
+    except Exception as e:
+        return FailedRun(index, '{}: {}'.format(type(e).__name__, e),
+                         traceback.format_exc())
+
+
+def _run_chunk(chunk):
+    return [(index, _run_indexed((index, config))) for index, config in chunk]
+
+
+def _chunks(items, chunksize):
+    """Splits an iterable into lists of at most chunksize items."""
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _chunksize(n, workers):
+    """Number of configurations per chunk that splits n of them in about 4
+    chunks per worker."""
+    return max(1, math.ceil(n / (4 * workers)))
+
+
+def iter_runs(configs, workers=None, chunksize=None, ordered=True):
+    """Generator that runs model configurations on a pool of worker
+    processes and yields every result as soon as it is available.
+
+    Only a few chunks per worker are in flight at any time, and configs is
+    consumed lazily, so memory use does not grow with the number of runs
+    as long as the results are not kept.
+
+    Input
+    -----
+    configs: iterable of dict, model configurations, see run_model
+    workers: int, number of worker processes. Defaults to the number of
+        CPUs; with 1 the models are run in this process.
+    chunksize: int, number of configurations sent to a worker at once.
+        Defaults to splitting the work in about 4 chunks per worker if
+        configs has a length, and to 1 otherwise.
+    ordered: bool, whether to yield the results in the order of configs.
+        Otherwise they are yielded as they finish.
+
+    Output
+    ------
+    (index, result): position of the configuration and its OdeResult, or
+        FailedRun if it raised an error
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = (_chunksize(len(configs), workers)
+                     if hasattr(configs, '__len__') else 1)
+    items = enumerate(configs)
+    if workers == 1:
+        for item in items:
+            yield item[0], _run_indexed(item)
+        return
+
+    chunks = _chunks(items, chunksize)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque(
+            executor.submit(_run_chunk, chunk)
+            for chunk in itertools.islice(chunks, 2 * workers))
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+            for future in done:
+                for chunk in itertools.islice(chunks, 1):
+                    pending.append(executor.submit(_run_chunk, chunk))
+                yield from future.result()
+
+
+def run_many(configs, workers=None, chunksize=None):
+    """Function that runs many model configurations on a pool of worker
+    processes.
+
+    Configurations are sent to the workers in chunks, to amortise the cost
+    of pickling. A configuration that raises an error gives a FailedRun in
+    its place, the other runs are unaffected.
+
+    Input
+    -----
+    configs: list of dict, model configurations, see run_model
+    workers: int, number of worker processes. Defaults to the number of
+        CPUs; with 1 the models are run in this process.
+    chunksize: int, number of configurations sent to a worker at once.
+        Defaults to splitting the work in about 4 chunks per worker.
+
+    Output
+    ------
+    results: list, OdeResult or FailedRun for every configuration, in the
+        order of configs
+    """
+    configs = list(configs)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(configs)))
+    if chunksize is None:
+        chunksize = _chunksize(len(configs), workers)
+    return [result for _, result in iter_runs(configs, workers, chunksize)]
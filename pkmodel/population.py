@@ -0,0 +1,225 @@
+#
+# Simulation of many parameter sets at once
+#
+
+# Packages
+import time
+
+import numpy as np
+import scipy.sparse
+
+from . import profiling
+from .linear import periodic_state, propagate, rate_matrix
+from .model import (integrate_piecewise, rhs_iv_one_compartment,
+                    rhs_iv_two_compartments, rhs_subcutaneous)
+from .protocol import create_dosis_function, spike_width
+
+# right hand side, number of peripheral compartments and whether a dosing
+# compartment is used, for every model
+POPULATION_MODELS = {
+    'iv_one_compartment': (rhs_iv_one_compartment, 0, False),
+    'iv_two_compartments': (rhs_iv_two_compartments, 1, False),
+    'subcutaneous': (rhs_subcutaneous, 1, True),
+}
+
+
+class PopulationDose:
+    """Dosing rates of N models, evaluated together.
+
+    Models that share a dosing shape and number of spikes share one unit
+    DoseSchedule, which is evaluated once and scaled by each model's dose
+    strength.
+
+    Input
+    -----
+    t_eval: array, time steps, see create_dosis_function
+    shapes: array (N,), whether each model has a continuous dosis
+    spikes: array (N,), number of spikes of each model
+    strengths: array (N,), strength of the dosis of each model
+    width: float, duration of a spike, see create_dosis_function
+    """
+
+    def __init__(self, t_eval, shapes, spikes, strengths, width=None):
+        self.strengths = np.asarray(strengths, dtype=float)
+        keys = np.stack([np.asarray(shapes, dtype=bool).astype(int),
+                         np.asarray(spikes, dtype=int)], axis=1)
+        unique, self._groups = np.unique(keys, axis=0, return_inverse=True)
+        self._groups = self._groups.ravel()
+        self._schedules = [create_dosis_function(t_eval, shape, spikes, 1.0,
+                                                 width)
+                           for shape, spikes in unique]
+
+    @property
+    def breakpoints(self):
+        """Sorted times at which the dosing rate of any model can change."""
+        return np.unique(np.concatenate(
+            [s.breakpoints for s in self._schedules]))
+
+    def __call__(self, t):
+        """Dosing rates at time t, shape (N,) for a scalar t and
+        (len(t), N) for an array t."""
+        unit = np.stack([np.broadcast_to(s(t), np.shape(t))
+                         for s in self._schedules], axis=-1)
+        return unit[..., self._groups] * self.strengths
+
+
+def simulate_population(model, t_eval, parameters, y0=None, method='RK45',
+                        steady_state=False, t_span=None, dose_width=None,
+                        **options):
+    """Function that solves one model for N parameter sets at once.
+
+    With method='exact' the N models are propagated together with stacked
+    matrix exponentials (see propagate). Otherwise the N copies of the
+    model's rhs_* equations are stacked into one system, which is evaluated
+    for all models in a single vectorised call and integrated with
+    integrate_piecewise. Its error control covers the whole system, so
+    rtol and atol are divided by sqrt(N): every model is then solved at
+    least as accurately as on its own, at the cost of more steps for large
+    N. The results still depend slightly on the other models of the
+    population, as the steps are shared.
+
+    Inputs
+    ------
+    model (str): One of 'iv_one_compartment', 'iv_two_compartments' or
+                 'subcutaneous'.
+    t_eval (array): Times at which the solutions are returned.
+    parameters (dict): Model parameters as in set_model_args, plus
+                       'dose_shape', 'dose_spikes' and 'dose_strength'.
+                       Every entry is either a scalar or an array of length
+                       N, scalars are shared by all models. Entries that
+                       are not numbers, such as 'name', are ignored.
+    y0 (array): Initial conditions, shape (n_compartments,) shared by all
+                models or (N, n_compartments). Zero by default.
+    method (str): Solver name (see SOLVERS), or 'exact'.
+    steady_state (bool): Whether to start every model from the periodic
+                         steady state of its dose over t_span repeated
+                         forever (see periodic_state), instead of y0.
+    t_span (tuple): Interval (t0, t_end) over which the doses are spread,
+                    starting from y0 at t0, (t_eval[0], t_eval[-1]) by
+                    default. As in compartment_model, t_eval can then
+                    hold a few irregular observation times.
+    dose_width (float): Duration of a dose spike, t_eval[1] - t_eval[0] by
+                        default (see spike_width). It needs to be given for
+                        spiked doses together with t_span.
+    options: Passed on to the solver, e.g. rtol, atol, which are the
+             tolerances of every model.
+
+    Outputs
+    -------
+    y (array): Solutions, shape (N, n_compartments, len(t_eval)). The
+               compartments are ordered as in the model's rhs_* function,
+               e.g. dosing, central, peripheral for 'subcutaneous'.
+    """
+
+    rhs, no_peripheral, dose_comp = POPULATION_MODELS[model]
+    t_eval = np.asarray(t_eval, dtype=float)
+    values = {k: np.atleast_1d(np.asarray(v)) for k, v in parameters.items()}
+    names = [k for k, v in values.items() if v.dtype.kind in 'biuf']
+    columns = np.broadcast_arrays(*[values[k] for k in names])
+    columns = dict(zip(names, [c.astype(float) for c in columns]))
+    N = len(columns['V_c'])
+    n = 1 + no_peripheral + dose_comp
+    if y0 is None:
+        y0 = np.zeros(n)
+    y0 = np.broadcast_to(np.asarray(y0, dtype=float), (N, n))
+    t_span, dose = _population_dose(t_eval, columns, t_span, dose_width)
+
+    if method == 'exact' or steady_state:
+        matrix, input_vector = rate_matrix(columns, no_peripheral, dose_comp)
+    if steady_state:
+        y0 = periodic_state(t_span[0], t_span[-1] - t_span[0], matrix,
+                            input_vector, dose)
+    # start from y0 at t0 and drop that time again if it was not asked for
+    start = int(t_eval[0] > t_span[0])
+    times = np.concatenate([t_span[:1], t_eval]) if start else t_eval
+    if method == 'exact':
+        return propagate(times, y0, matrix, input_vector, dose)[..., start:]
+
+    # states are stored compartment by compartment: y[c * N + patient]
+    stacked = {k: c[:, None] for k, c in columns.items()}
+    run = profiling.new_run()
+    rhs = profiling.instrument(run, 'rhs', rhs)
+    dose = profiling.instrument_dose(run, dose)
+
+    def block_rhs(t, y, dose):
+        rates = dose(t)[:, None]
+        dy = rhs(t, y.reshape(n, N, -1), stacked, times, lambda _: rates)
+        return np.reshape(dy, y.shape)
+
+    # the solver bounds the RMS of the error over all N * n states, so the
+    # tolerances shrink by sqrt(N) to bound every model's error as tightly
+    # as a solve of that model alone
+    options['rtol'] = options.get('rtol', 1e-3) / np.sqrt(N)
+    options['atol'] = options.get('atol', 1e-6) / np.sqrt(N)
+    options.setdefault('vectorized', True)
+    if method in ('Radau', 'BDF'):
+        options.setdefault('jac_sparsity', scipy.sparse.kron(
+            np.ones((n, n)), scipy.sparse.identity(N), format='csc'))
+    wall_time = time.perf_counter()
+    sol = integrate_piecewise(block_rhs, times, y0.T.ravel(), dose, method,
+                              **options)
+    profiling.finish_run(run, time.perf_counter() - wall_time)
+    if not sol.success:
+        raise RuntimeError(sol.message)
+    return sol.y.reshape(n, N, -1).transpose(1, 0, 2)[..., start:]
+
+
+def _population_dose(t_eval, columns, t_span, dose_width):
+    """Checked t_span, and the PopulationDose of the parameter columns
+    spread over it, as compartment_model builds them."""
+    if dose_width is None and not np.all(columns['dose_shape']):
+        dose_width = spike_width(t_eval, t_span)
+    if t_span is None:
+        t_span = (t_eval[0], t_eval[-1])
+    t_span = np.asarray(t_span, dtype=float)
+    if np.any(np.diff(t_eval) < 0) or t_eval[0] < t_span[0]:
+        raise ValueError('t_eval needs to be sorted and start within t_span.')
+    return t_span, PopulationDose(t_span, columns['dose_shape'],
+                                  columns['dose_spikes'],
+                                  columns['dose_strength'], dose_width)
+
+
+def iter_population(model, t_eval, parameters, chunk_size=1000, y0=None,
+                    method='RK45', t_span=None, dose_width=None, **options):
+    """Generator that solves a population in chunks (see
+    simulate_population) and yields every chunk as soon as it is solved,
+    so that only one chunk is held in memory at a time.
+
+    Inputs
+    ------
+    model (str): One of the keys of POPULATION_MODELS.
+    t_eval (array): Times at which the solutions are returned.
+    parameters (dict): Scalars or arrays of length N, see
+                       simulate_population.
+    chunk_size (int): Number of models solved together.
+    y0 (array): Initial conditions, shape (n_compartments,) or
+                (N, n_compartments).
+    method (str): Solver name (see SOLVERS), or 'exact'.
+    t_span (tuple): Interval of the doses, see simulate_population.
+    dose_width (float): Duration of a dose spike, see simulate_population.
+    options: Passed on to the solver, e.g. rtol, atol.
+
+    Outputs
+    -------
+    (start, y): Index of the first model in the chunk, and the solutions
+                of the chunk, shape (chunk, n_compartments, len(t_eval)).
+    """
+
+    N = np.broadcast(*[np.atleast_1d(np.asarray(v))
+                       for v in parameters.values()]).shape[0]
+    for start in range(0, N, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        part = {k: _rows(v, N, chunk) for k, v in parameters.items()}
+        part_y0 = None if y0 is None else _rows(y0, N, chunk, ndim=2)
+        yield start, simulate_population(model, t_eval, part, part_y0,
+                                         method, t_span=t_span,
+                                         dose_width=dose_width, **options)
+
+
+def _rows(value, N, chunk, ndim=1):
+    """Rows of a per-model value that is either shared or given per model.
+    """
+    value = np.asarray(value)
+    if value.ndim < ndim or len(value) != N:
+        return value
+    return value[chunk]
@@ -0,0 +1,168 @@
+#
+# Opt-in instrumentation of the model solves
+#
+# Profiling is off by default, and then costs one function call per solve.
+# It is switched on for a block of code with
+#
+#   with pk.profile() as session:
+#       sol = pk.subcutaneous(t_eval, y0, model_input)
+#   sol.profile          # breakdown of this solve
+#   session.report()     # totals over all solves in the block
+#
+# or for a whole process by setting the environment variable PKMODEL_PROFILE
+# to 1, or to a file name to which the totals are written as JSON on exit.
+#
+# A pk.profile() block only records the solves of its own thread (or asyncio
+# task), so solves running concurrently in other threads, e.g. in the
+# executor of a SimulationService, do not end up in it. The profile of the
+# process records the solves of all threads.
+#
+
+# Packages
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+# profiles of pk.profile() blocks that are recording in this context,
+# innermost last
+_active = contextvars.ContextVar('pkmodel_profiles', default=())
+
+
+class Profile:
+    """Call counts and times of instrumented functions.
+
+    Attributes
+    ----------
+    timings: dict, for every name the number of calls and the total time
+        in seconds, as a list [calls, seconds]
+    """
+
+    def __init__(self):
+        self.timings = {}
+
+    def wrap(self, name, function):
+        """Returns function with every call counted and timed under name."""
+        record = self.timings.setdefault(name, [0, 0.0])
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record[0] += 1
+                record[1] += clock() - start
+        return timed
+
+    def add(self, name, seconds, calls=1):
+        """Adds calls and time to name."""
+        record = self.timings.setdefault(name, [0, 0.0])
+        record[0] += calls
+        record[1] += seconds
+
+    def merge(self, other):
+        """Adds the timings of another profile to this one."""
+        for name, (calls, seconds) in other.timings.items():
+            self.add(name, seconds, calls)
+
+    def report(self):
+        """Timings as a dict of {'calls', 'time', 'mean'} per name, with
+        times in seconds."""
+        return {name: {'calls': calls, 'time': seconds,
+                       'mean': seconds / calls if calls else 0.0}
+                for name, (calls, seconds) in self.timings.items()}
+
+    def to_json(self, path=None):
+        """Report as a JSON string, also written to path if given."""
+        text = json.dumps(self.report(), indent=2, sort_keys=True)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+
+class TimedDose:
+    """Dose schedule whose evaluations are counted and timed, with the
+    other attributes (breakpoints, bolus, ...) of the wrapped schedule."""
+
+    def __init__(self, dose, run):
+        self._dose = dose
+        self._call = run.wrap('dose', dose)
+
+    def __call__(self, t):
+        return self._call(t)
+
+    def __getattr__(self, name):
+        return getattr(self._dose, name)
+
+
+@contextlib.contextmanager
+def profile():
+    """Context manager that records the timings of all solves in its block
+    into a Profile, which it yields."""
+    session = Profile()
+    token = _active.set(_active.get() + (session,))
+    try:
+        yield session
+    finally:
+        _active.reset(token)
+
+
+def new_run():
+    """Profile for one solve if profiling is on, None otherwise."""
+    if process_profile is None and not _active.get():
+        return None
+    return Profile()
+
+
+def instrument(run, name, function):
+    """function counted and timed under name in run, or function itself if
+    run is None."""
+    return function if run is None else run.wrap(name, function)
+
+
+def instrument_dose(run, dose):
+    """dose counted and timed in run, or dose itself if run is None."""
+    return dose if run is None else TimedDose(dose, run)
+
+
+def finish_run(run, wall_time, sol=None):
+    """Completes the profile of one solve: adds the total time and the time
+    spent outside the right hand side and the dose, attaches the report to
+    sol as .profile and adds it to the recording profiles."""
+    if run is None:
+        return
+    inside = sum(run.timings.get(name, [0, 0.0])[1]
+                 for name in ('rhs', 'dose'))
+    run.add('solve', wall_time)
+    run.add('solver', max(wall_time - inside, 0.0))
+    for session in _active.get():
+        session.merge(run)
+        session.add('runs', 0.0)
+    if process_profile is not None:
+        # solves of all threads end up here
+        with _process_lock:
+            process_profile.merge(run)
+            process_profile.add('runs', 0.0)
+    if sol is not None:
+        sol.profile = run.report()
+
+
+def _from_environment():
+    """Starts profiling the whole process if PKMODEL_PROFILE is set."""
+    setting = os.environ.get('PKMODEL_PROFILE', '')
+    if setting.lower() in ('', '0', 'false', 'no'):
+        return None
+    session = Profile()
+    if setting.lower() not in ('1', 'true', 'yes'):
+        atexit.register(session.to_json, setting)
+    return session
+
+
+# profile of the whole process, see PKMODEL_PROFILE
+process_profile = _from_environment()
+_process_lock = threading.Lock()
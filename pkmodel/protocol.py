@@ -1,5 +1,7 @@
 # from logging import raiseExceptions
 # from typing import Type
+import bisect
+
 import numpy as np
 
 
@@ -101,48 +103,239 @@ def dosage():
     return dose
 
 
-def create_dosis_function(t, shape, no_spikes, strength):
+class DoseSchedule:
+    """Dosing rate in time, given as a sorted list of intervals during which
+    the drug is delivered at a constant rate.
+
+    Queries are answered by binary search over the interval start times, so
+    their cost grows with log(number of intervals). A whole array of times
+    can be evaluated in one call.
+
+    Input
+    -----
+    starts: array, sorted start times of the dosing intervals
+    ends: array, end times of the dosing intervals (inclusive)
+    strength: float, dosing rate during an interval
+    """
+
+    def __init__(self, starts, ends, strength):
+        self.starts = np.asarray(starts, dtype=float)
+        self.ends = np.asarray(ends, dtype=float)
+        if self.starts.shape != self.ends.shape:
+            raise ValueError('starts and ends need to have the same length.')
+        if np.any(np.diff(self.starts) < 0):
+            raise ValueError('starts need to be sorted.')
+        self.strength = strength
+        # plain lists make scalar look-ups with bisect cheaper than numpy
+        self._starts = self.starts.tolist()
+        self._ends = self.ends.tolist()
+        self._constant = (self._starts == [-np.inf]
+                          and self._ends == [np.inf])
+
+    @property
+    def breakpoints(self):
+        """Sorted finite times at which the dosing rate can change."""
+        times = np.concatenate([self.starts, self.ends])
+        return np.unique(times[np.isfinite(times)])
+
+    def __call__(self, t):
+        """Dosing rate at time t.
+
+        Input
+        -----
+        t: float or array, time(s) at which to evaluate the dose
+
+        Output
+        ------
+        rate: float or array, dosing rate at t. A schedule that is always
+            on returns the scalar rate, which broadcasts against any t.
+        """
+        if self._constant:
+            return self.strength
+        if np.ndim(t) == 0:
+            i = bisect.bisect_right(self._starts, t) - 1
+            if i >= 0 and t <= self._ends[i]:
+                return self.strength
+            return 0.0
+
+        t = np.asarray(t, dtype=float)
+        i = np.searchsorted(self.starts, t, side='right') - 1
+        active = i >= 0
+        active[active] = t[active] <= self.ends[i[active]]
+        return np.where(active, float(self.strength), 0.0)
+
+
+class Protocol:
+    """Dosing protocol made of bolus doses and zero-order infusions, which
+    can be repeated in cycles.
+
+    Unlike create_dosis_function, the doses do not depend on the output
+    times. Boluses are instantaneous: the solvers add them to the dosed
+    compartment as a jump of the state at their time, instead of resolving
+    a narrow pulse. The infusion rate is piecewise constant and looked up
+    by binary search, so its cost grows with log(number of changes).
+
+    Input
+    -----
+    boluses: list of (time, amount) pairs
+    infusions: list of (start, duration, rate) triples. Overlapping
+        infusions add up; an infusion is on from its start (included) to
+        its end (excluded).
+    period: float, length of a dosing cycle. If given, all doses are
+        repeated every period, cycles times in total.
+    cycles: int, number of cycles
+    """
+
+    def __init__(self, boluses=(), infusions=(), period=None, cycles=1):
+        boluses = np.asarray(boluses, dtype=float).reshape(-1, 2)
+        infusions = np.asarray(infusions, dtype=float).reshape(-1, 3)
+        if np.any(boluses[:, 1] < 0) or np.any(infusions[:, 1:] < 0):
+            raise ValueError('Amounts, durations and rates need to be '
+                             'non-negative.')
+        shifts = np.zeros(1)
+        if period is not None:
+            if period <= 0:
+                raise ValueError('period needs to be positive.')
+            shifts = np.arange(cycles) * float(period)
+        self.period = period
+        self.cycles = cycles if period is not None else 1
+
+        # boluses at the same time are merged
+        times = (boluses[:, :1] + shifts).ravel()
+        amounts = np.repeat(boluses[:, 1], len(shifts))
+        self.bolus_times, index = np.unique(times, return_inverse=True)
+        self.bolus_amounts = np.zeros(len(self.bolus_times))
+        np.add.at(self.bolus_amounts, index.ravel(), amounts)
+
+        # the rate changes by +rate at every start and -rate at every end.
+        # Counting the running infusions keeps the rate exactly 0 when none
+        # is on, without round-off from the cumulative sum.
+        starts = (infusions[:, :1] + shifts).ravel()
+        ends = ((infusions[:, :1] + infusions[:, 1:2]) + shifts).ravel()
+        rates = np.repeat(infusions[:, 2], len(shifts))
+        self.infusion_starts, self.infusion_ends = starts, ends
+        changes = np.concatenate([starts, ends])
+        self._times, index = np.unique(changes, return_inverse=True)
+        delta = np.zeros(len(self._times))
+        running = np.zeros(len(self._times), dtype=int)
+        np.add.at(delta, index.ravel(), np.concatenate([rates, -rates]))
+        np.add.at(running, index.ravel(),
+                  np.repeat([1, -1], len(starts)))
+        self._rates = np.where(np.cumsum(running) > 0, np.cumsum(delta), 0.0)
+        # plain lists make scalar look-ups with bisect cheaper than numpy
+        self._time_list = self._times.tolist()
+        self._rate_list = self._rates.tolist()
+        self._bolus_list = self.bolus_times.tolist()
+
+    @property
+    def starts(self):
+        """Sorted start times of all doses, boluses and infusions."""
+        return np.union1d(self.bolus_times, self.infusion_starts)
+
+    @property
+    def breakpoints(self):
+        """Sorted times at which the infusion rate changes or a bolus is
+        given."""
+        return np.union1d(self._times, self.bolus_times)
+
+    def __call__(self, t):
+        """Infusion rate at time t.
+
+        Input
+        -----
+        t: float or array, time(s) at which to evaluate the rate
+
+        Output
+        ------
+        rate: float or array, total rate of the infusions running at t
+        """
+        if np.ndim(t) == 0:
+            i = bisect.bisect_right(self._time_list, t) - 1
+            return self._rate_list[i] if i >= 0 else 0.0
+        # index -1 (before the first change) picks the appended 0
+        i = np.searchsorted(self._times, t, side='right') - 1
+        return np.append(self._rates, 0.0)[i]
+
+    def bolus(self, t):
+        """Bolus amount given at exactly time t, 0 if there is none.
+
+        Input
+        -----
+        t: float or array, time(s)
+
+        Output
+        ------
+        amount: float or array, amount given at t
+        """
+        if np.ndim(t) == 0:
+            i = bisect.bisect_left(self._bolus_list, t)
+            if i < len(self._bolus_list) and self._bolus_list[i] == t:
+                return float(self.bolus_amounts[i])
+            return 0.0
+        t = np.asarray(t, dtype=float)
+        if not len(self.bolus_times):
+            return np.zeros(t.shape)
+        i = np.minimum(np.searchsorted(self.bolus_times, t),
+                       len(self.bolus_times) - 1)
+        return np.where(self.bolus_times[i] == t, self.bolus_amounts[i], 0.0)
+
+    def total(self, t_start, t_end):
+        """Total amount given in [t_start, t_end), by boluses and
+        infusions."""
+        bolus = self.bolus_amounts[(self.bolus_times >= t_start)
+                                   & (self.bolus_times < t_end)].sum()
+        edges = np.clip(np.append(self._times, np.inf), t_start, t_end)
+        return float(bolus + np.sum(np.diff(edges) * self._rates))
+
+
+def create_dosis_function(t, shape, no_spikes, strength, width=None):
     """Function takes inputs about dosis and creates an array
     for the dose in time
 
     Input
     -----
-    t: array, time steps
+    t: array, time steps. The spikes start at t[0] and are spread evenly
+        up to t[-1]
     shape: bool, whether we have a continuous dosis
     no_spikes: int, number of dosis for instantaneous input
     strength: float, strength of the dosis
+    width: float, duration of a spike, t[1] - t[0] by default
 
     Output
     ------
-    dosis: func, function for dosis in time
+    dosis: DoseSchedule, callable giving the dosis in time
     """
 
+    if shape:
+        return DoseSchedule([-np.inf], [np.inf], strength)
+
     dt = (t[-1] - t[0]) / no_spikes  # time difference between spikes
-    epsilon = t[1] - t[0]  # width of spike (in time)
-    times = np.arange(no_spikes) * dt
+    epsilon = t[1] - t[0] if width is None else width  # width of spike
+    times = t[0] + np.arange(no_spikes) * dt
 
-    if shape:
+    return DoseSchedule(times, times + epsilon, strength)
 
-        def dosis(t):
-            return strength
-    else:
 
-        def dosis(t):
-            if t < times[0]:
-                t = 0
-            elif t > times[-1] + epsilon:
-                t = 0
-            elif (t > times[-1]) and (t <= times[-1] + epsilon):
-                t = 1
-            else:
-                for it in range(0, no_spikes - 1):
-                    if t >= times[it] and (t <= times[it] + epsilon):
-                        t = 1
-                    elif (t > times[it] + epsilon) and (t < times[it + 1]):
-                        t = 0
-            return t * strength
+def spike_width(t_eval, t_span=None):
+    """Function that gives the default duration of a dose spike
 
-    return dosis
+    Input
+    -----
+    t_eval: array, output times
+    t_span: tuple, optional interval (t0, t_end) of the doses, if it is
+        given separately from t_eval
+
+    Output
+    ------
+    width: float, t_eval[1] - t_eval[0] when t_eval is also the time grid
+        of the doses. Otherwise, e.g. for a few observation times, the
+        output times say nothing about the doses and a ValueError asks for
+        an explicit width.
+    """
+    if t_span is not None or len(t_eval) < 2:
+        raise ValueError('dose_width needs to be given for spiked doses '
+                         'when t_span is given or t_eval has one point.')
+    return t_eval[1] - t_eval[0]
 
 
 def set_model_args():
@@ -159,6 +352,8 @@ def set_model_args():
         'Q_p1': 1.0,
         'V_c': 1.0,
         'V_p1': 1.0,
+        'Q_p2': 1.0,
+        'V_p2': 1.0,
         'CL': 1.0,
         'X': 1.0,
         'k_a': 1.0
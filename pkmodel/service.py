@@ -0,0 +1,251 @@
+#
+# Asynchronous simulation for event loops, e.g. in a web service
+#
+
+# Packages
+import asyncio
+import concurrent.futures
+import functools
+import time
+import weakref
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+from .cache import solution_key
+from .parallel import RUNNERS, n_states
+from .population import POPULATION_MODELS, simulate_population
+
+# options with which requests can be solved together in one population
+BATCH_OPTIONS = ('rtol', 'atol', 'max_step', 'first_step', 'steady_state',
+                 't_span', 'dose_width')
+
+
+class SimulationService:
+    """Runs model solves for coroutines, without blocking the event loop.
+
+    Solves run in a bounded executor, at most max_workers at a time; the
+    other requests wait in the event loop, where they can be cancelled.
+    Identical requests that arrive while one is being solved share its
+    result. Requests for the models of POPULATION_MODELS with method
+    'exact' that only differ in their parameters and initial conditions
+    are collected for batch_window seconds, or until max_batch of them are
+    waiting, and solved together with simulate_population. Requests for
+    the other solvers are solved on their own, since the step size control
+    of a batch depends on all its requests, and so would their results.
+
+    A service belongs to the event loop it is first used in.
+
+    Input
+    -----
+    max_workers: int, number of solves running at the same time
+    batch_window: float, seconds a batchable request waits for others, 0
+        to solve every request on its own
+    max_batch: int, largest number of requests solved together
+    executor: optional concurrent.futures.Executor running the solves, a
+        thread pool of max_workers threads by default
+
+    Attributes
+    ----------
+    solves: int, number of solves run, a batch counting once
+    batches: int, number of those solves that were batches
+    coalesced: int, number of requests answered by an identical one
+    """
+
+    def __init__(self, max_workers=4, batch_window=0.005, max_batch=256,
+                 executor=None):
+        self.max_workers = max_workers
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.solves = 0
+        self.batches = 0
+        self.coalesced = 0
+        self._own_executor = executor is None
+        self._executor = executor or concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix='pkmodel')
+        self._slots = None
+        self._in_flight = {}
+        self._pending = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Shuts down the executor, if the service created it."""
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    async def simulate(self, model, t_eval, model_input, y0=None,
+                       method='RK45', **options):
+        """Solves one model, see the runners in RUNNERS.
+
+        Input
+        -----
+        model: str, one of the keys of RUNNERS
+        t_eval: array, times at which the solution is returned
+        model_input: dict, model parameters and dose settings
+        y0: array, initial condition, zero by default
+        method: str, solver name (see SOLVERS), or 'exact'
+        options: passed on to the runner, e.g. rtol, protocol. Requests
+            with a callback are never shared, so that every callback is
+            called.
+
+        Output
+        ------
+        sol: result of the runner. A request solved in a batch gets an
+            OptimizeResult with the same .t, .y (and .dose_comp),
+            .success, .status, .message and .diagnostics, plus .batch_size.
+            As the batch is solved as one system, its solver counters
+            (nfev, njev, nlu, n_steps) are None, and its wall_time is that
+            of the whole batch. Results of coalesced requests are the same
+            object, and must not be modified.
+        """
+        t_eval = np.asarray(t_eval, dtype=float)
+        n = n_states(model, options)
+        y0 = np.zeros(n) if y0 is None else np.asarray(y0, dtype=float)
+        if y0.shape != (n,):
+            raise ValueError('y0 needs to have shape ({},) for {}.'.format(
+                n, model))
+        options = dict(options, method=method)
+        key = None
+        if 'callback' not in options:
+            key = solution_key(model, t_eval, y0, model_input, options)
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            if self._batchable(model, options):
+                future = self._enqueue(model, t_eval, y0, model_input,
+                                       options)
+            else:
+                future = asyncio.ensure_future(self._solve_one(
+                    model, t_eval, y0, model_input, options))
+            if key is not None:
+                self._in_flight[key] = future
+                future.add_done_callback(
+                    lambda _: self._in_flight.pop(key, None))
+        # a cancelled request must not cancel the others sharing the solve
+        return await asyncio.shield(future)
+
+    def _batchable(self, model, options):
+        return (self.batch_window > 0 and model in POPULATION_MODELS
+                and options['method'] == 'exact'
+                and set(options) <= {'method', *BATCH_OPTIONS})
+
+    async def _run(self, solve):
+        """Runs solve in the executor once a slot is free."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        async with self._slots:
+            self.solves += 1
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, solve)
+
+    async def _solve_one(self, model, t_eval, y0, model_input, options):
+        """Solves one request with its runner."""
+        return await self._run(functools.partial(
+            RUNNERS[model], t_eval, y0, model_input, **options))
+
+    def _enqueue(self, model, t_eval, y0, model_input, options):
+        """Adds a request to the batch of requests it can be solved with,
+        and returns the future of its result."""
+        group = solution_key(model, t_eval, [], dict.fromkeys(model_input),
+                             options)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if group not in self._pending:
+            self._pending[group] = (model, t_eval, options, [])
+            loop.call_later(self.batch_window, self._flush, group)
+        batch = self._pending[group][3]
+        batch.append((model_input, y0, future))
+        if len(batch) >= self.max_batch:
+            self._flush(group)
+        return future
+
+    def _flush(self, group):
+        """Starts solving the waiting batch of group, if it was not solved
+        yet."""
+        pending = self._pending.pop(group, None)
+        if pending is not None:
+            asyncio.ensure_future(self._solve_batch(*pending))
+
+    async def _solve_batch(self, model, t_eval, options, batch):
+        """Solves a batch and sets the results of its futures. If the batch
+        fails, e.g. because of the parameters of one request, its requests
+        are solved one by one, so that only the bad ones fail."""
+        try:
+            solver_options = dict(options)
+            method = solver_options.pop('method')
+            parameters = {k: np.array([p[k] for p, _, _ in batch])
+                          for k in batch[0][0]}
+            y0 = np.array([y for _, y, _ in batch], dtype=float)
+            wall_time = time.perf_counter()
+            y = await self._run(functools.partial(
+                simulate_population, model, t_eval, parameters, y0, method,
+                **solver_options))
+            wall_time = time.perf_counter() - wall_time
+        except Exception as error:
+            if len(batch) == 1:
+                _set(batch[0][2], error=error)
+                return
+            await asyncio.gather(*[
+                self._retry(model, t_eval, y0, model_input, options, future)
+                for model_input, y0, future in batch])
+            return
+        if len(batch) > 1:
+            self.batches += 1
+        message = 'Solved in a batch of {} requests'.format(len(batch))
+        diagnostics = {'method': method, 'nfev': None, 'njev': None,
+                       'nlu': None, 'n_steps': None, 'wall_time': wall_time,
+                       'status': 0, 'message': message}
+        # as in compartment_model, the dosing compartment goes to .dose_comp
+        dose_comp = POPULATION_MODELS[model][2]
+        for i, (_, _, future) in enumerate(batch):
+            sol = OptimizeResult(
+                t=t_eval, y=y[i, dose_comp:], success=True, status=0,
+                message=message, nfev=None, njev=None, nlu=None,
+                n_steps=None, diagnostics=dict(diagnostics),
+                batch_size=len(batch))
+            if dose_comp:
+                sol.dose_comp = y[i, 0]
+            _set(future, sol)
+
+    async def _retry(self, model, t_eval, y0, model_input, options, future):
+        """Solves one request of a failed batch on its own."""
+        try:
+            sol = await self._solve_one(model, t_eval, y0, model_input,
+                                        options)
+        except Exception as error:
+            _set(future, error=error)
+        else:
+            _set(future, sol)
+
+
+def _set(future, result=None, error=None):
+    """Sets the result or the error of a future, unless it was cancelled."""
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+# default service of every event loop
+_services = weakref.WeakKeyDictionary()
+
+
+async def simulate(model, t_eval, model_input, y0=None, method='RK45',
+                   **options):
+    """Solves one model without blocking the event loop, with the default
+    SimulationService of the running loop. See SimulationService.simulate.
+    """
+    loop = asyncio.get_running_loop()
+    service = _services.get(loop)
+    if service is None:
+        service = _services[loop] = SimulationService()
+    return await service.simulate(model, t_eval, model_input, y0, method,
+                                  **options)
@@ -6,15 +6,21 @@
 import os
 from datetime import datetime
 import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
 
 
-def solution(model_sol, *args):
+# number of models above which solution draws line collections
+LINES_LIMIT = 20
+
+
+def solution(model_sol, *args, path=None, format=None, mode='auto',
+             max_points=2000, close=True):
     """
     Function that plots the results from the model and allows
     the user to compare results between different models.
 
-    Uses the plot_drug function to plot the individual plots.
-
     Inputs
     ------
     model_sol (dict): The first set of model results. Should contain 2 keys
@@ -26,38 +32,77 @@ def solution(model_sol, *args):
     *args: Optional arguments for more sets of model results. Should have
            same structure as model_sol.
 
+    path (str): File the figure is saved to. By default a timestamped file
+                in a folder called data in the current working directory.
+
+    format (str): File format, e.g. 'png', 'svg' or 'pdf'. By default taken
+                  from the extension of path, or png.
+
+    mode (str): 'lines' plots every compartment of every model with its own
+                line and legend entry (see plot_drug). 'collection' draws
+                all models in one LineCollection per compartment, with the
+                points decimated to max_points (see plot_collection).
+                'envelope' shows the range and median over the models
+                (see plot_envelope). 'auto' uses 'lines' for up to
+                LINES_LIMIT models and 'collection' above.
+
+    max_points (int): Number of points per curve kept in 'collection' mode,
+                      about the horizontal resolution of the figure.
+
+    close (bool): Whether to close the figure after saving it.
+
     Outputs
     -------
+    path (str): The file the figure was saved to
     """
 
     # check inputs
-    for model in [model_sol, *args]:
-        if not isinstance(model_sol, dict):
+    models = [model_sol, *args]
+    for model in models:
+        if not isinstance(model, dict):
             raise TypeError('Model data output for plotting \
                             must be a dictionary')
+    if mode == 'auto':
+        mode = 'lines' if len(models) <= LINES_LIMIT else 'collection'
+    if mode not in ('lines', 'collection', 'envelope'):
+        raise ValueError("mode must be 'lines', 'collection', 'envelope' "
+                         "or 'auto'")
 
     # create subplot
     fig, (ax_0, ax_1) = plt.subplots(2, 1,
                                      gridspec_kw={'height_ratios': [3, 1]})
-    for model in [model_sol, *args]:    # calls plot_drug function
-        plot_drug(model, fig)
-
-    # adding visualisation elements
-    ax_0.legend()
-    ax_1.legend()
-    fig.suptitle('Pharmacokinetic Model')
-    ax_0.set_ylabel('drug in compartment [ng]')
-    ax_1.set_ylabel('dosage [ng]')
-    ax_1.set_xlabel('time [h]')
-    ax_0.set_xticks([])
-    fig.subplots_adjust(hspace=0)
-
-    # saving graph under ~/data
-    # creating /data folder if it does not exist
-    if not os.path.exists(os.getcwd() + '/data/'):
-        os.mkdir(os.getcwd() + '/data/')
-    fig.savefig(os.getcwd() + '/data/model'
-                + datetime.today().strftime('%Y%m%d%H%M%S') + '.png')
+    try:
+        if mode == 'lines':
+            for model in models:    # calls plot_drug function
+                plot_drug(model, fig)
+        elif mode == 'collection':
+            plot_collection(models, fig, max_points)
+        else:
+            plot_envelope(models, fig)
+
+        # adding visualisation elements
+        ax_0.legend()
+        ax_1.legend()
+        fig.suptitle('Pharmacokinetic Model')
+        ax_0.set_ylabel('drug in compartment [ng]')
+        ax_1.set_ylabel('dosage [ng]')
+        ax_1.set_xlabel('time [h]')
+        ax_0.set_xticks([])
+        fig.subplots_adjust(hspace=0)
+
+        if path is None:
+            # saving graph under ./data, creating the folder if it does
+            # not exist
+            folder = os.path.join(os.getcwd(), 'data')
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, 'model'
+                                + datetime.today().strftime('%Y%m%d%H%M%S')
+                                + '.' + (format or 'png'))
+        fig.savefig(path, format=format)
+    finally:
+        if close:
+            plt.close(fig)
+    return path
 
 
 def plot_drug(model, fig):
@@ -85,7 +130,8 @@ def plot_drug(model, fig):
         raise ValueError('Second argument must be a figure with 2 axes')
 
     # plots the drug concentration for each compartment
-    comp_label = ['Central', 'Peripheral1', 'Peripheral2']
+    comp_label = ['Central'] + ['Peripheral' + str(i)
+                                for i in range(1, len(model.y))]
     for comp, _ in enumerate(model.y):
         fig.axes[0].plot(model.t, model.y[comp], label=model.name
                          + ' ' + comp_label[comp])
@@ -97,3 +143,181 @@ def plot_drug(model, fig):
 
     return fig
 
+
+def _curves(model):
+    """Label and values of every curve of a model result: compartments on
+    the first axes, the dose on the second."""
+    labels = ['Central'] + ['Peripheral' + str(i)
+                            for i in range(1, len(model.y))]
+    curves = list(zip(labels, model.y))
+    if 'dose_comp' in model.keys():
+        curves.append(('dose_comp', model.dose_comp))
+    dose = [('dose', np.broadcast_to(model.dose, np.shape(model.t)))
+            if 'dose' in model.keys() else None]
+    return curves, [d for d in dose if d is not None]
+
+
+def decimate(t, y, max_points):
+    """
+    Function that reduces a curve to about max_points points for plotting,
+    keeping the minimum and maximum of every bucket of points, so that
+    narrow peaks such as dose spikes stay visible.
+
+    Inputs
+    ------
+    t (array): Times of the curve
+
+    y (array): Values of the curve
+
+    max_points (int): Number of points to keep at most
+
+    Outputs
+    -------
+    t, y (arrays): The decimated curve
+    """
+    t = np.asarray(t)
+    y = np.asarray(y)
+    if len(t) <= max_points:
+        return t, y
+    size = int(np.ceil(2 * len(t) / max_points))
+    blocks = np.full(-(-len(y) // size) * size, np.nan)
+    blocks[:len(y)] = y
+    blocks = blocks.reshape(-1, size)
+    starts = np.arange(0, len(t), size)
+    keep = np.unique(np.concatenate([
+        [0, len(t) - 1], starts + np.nanargmin(blocks, axis=1),
+        starts + np.nanargmax(blocks, axis=1)]))
+    return t[keep], y[keep]
+
+
+def plot_collection(models, fig, max_points=2000):
+    """
+    Function that draws the curves of many models with one LineCollection
+    per compartment, which is much faster than one line per curve. Every
+    curve is decimated to max_points points (see decimate).
+
+    Inputs
+    ------
+    models (list): The model results that are to be plotted
+
+    fig (figure, 2 axes): The figure that the data will be plotted on
+
+    max_points (int): Number of points per curve kept
+
+    Outputs
+    -------
+    fig (figure): (same as fig input)
+    """
+    if not isinstance(fig, plt.Figure) or len(fig.axes) != 2:
+        raise ValueError('Second argument must be a figure with 2 axes')
+
+    segments = [{}, {}]   # curves by label, for both axes
+    for model in models:
+        for ax, curves in enumerate(_curves(model)):
+            for label, y in curves:
+                t, y = decimate(model.t, y, max_points)
+                segments[ax].setdefault(label, []).append(
+                    np.column_stack([t, y]))
+
+    for ax, curves in zip(fig.axes, segments):
+        for k, (label, lines) in enumerate(curves.items()):
+            color = 'C' + str(k)
+            ax.add_collection(LineCollection(lines, colors=color,
+                                             linewidths=0.8, alpha=0.6))
+            # proxy artist, as collections have no line legend entry
+            ax.add_line(Line2D([], [], color=color,
+                               label='{} ({} models)'.format(label,
+                                                             len(lines))))
+        ax.autoscale_view()
+
+    return fig
+
+
+def plot_envelope(models, fig):
+    """
+    Function that shows the spread of many models: for every compartment
+    the range over the models as a shaded area and the median as a line.
+    Models on other times than the first one are interpolated to its times.
+
+    Inputs
+    ------
+    models (list): The model results that are to be plotted
+
+    fig (figure, 2 axes): The figure that the data will be plotted on
+
+    Outputs
+    -------
+    fig (figure): (same as fig input)
+    """
+    if not isinstance(fig, plt.Figure) or len(fig.axes) != 2:
+        raise ValueError('Second argument must be a figure with 2 axes')
+
+    t = np.asarray(models[0].t)
+    stacks = [{}, {}]   # curves by label, for both axes
+    for model in models:
+        for ax, curves in enumerate(_curves(model)):
+            for label, y in curves:
+                if not np.array_equal(model.t, t):
+                    y = np.interp(t, model.t, y)
+                stacks[ax].setdefault(label, []).append(y)
+
+    for ax, curves in zip(fig.axes, stacks):
+        for k, (label, ys) in enumerate(curves.items()):
+            color = 'C' + str(k)
+            ys = np.asarray(ys)
+            ax.fill_between(t, ys.min(axis=0), ys.max(axis=0), color=color,
+                            alpha=0.25, linewidth=0)
+            ax.plot(t, np.median(ys, axis=0), color=color,
+                    label='{} median of {}'.format(label, len(ys)))
+
+    return fig
+
+
+def plot_bands(bands, fig=None, label='', color=None):
+    """
+    Function that plots prediction intervals of the concentration, as
+    returned by monte_carlo: a shaded band between every pair of quantile
+    levels q and 1 - q, and the median as a line.
+
+    Inputs
+    ------
+    bands (dict): Result of monte_carlo, with .t, .quantiles and .bands
+
+    fig (figure): Optional figure to plot on, a new one by default. The
+                  bands are drawn on its first axes.
+
+    label (str): Label of the median in the legend
+
+    color: Optional matplotlib color of the bands
+
+    Outputs
+    -------
+    fig (figure): The figure that the bands were plotted on
+
+    """
+
+    # check inputs
+    if not isinstance(bands, dict):
+        raise TypeError('Bands for plotting must be a dictionary')
+    if fig is None:
+        fig, _ = plt.subplots()
+    ax = fig.axes[0]
+
+    levels = [round(float(q), 9) for q in bands.quantiles]
+    # the widest bands are the palest
+    pairs = sorted([(q, levels.index(round(1 - q, 9))) for q in levels
+                    if q < 0.5 and round(1 - q, 9) in levels])
+    for k, (q, upper) in enumerate(pairs):
+        ax.fill_between(bands.t, bands.bands[levels.index(q)],
+                        bands.bands[upper], color=color,
+                        alpha=0.15 + 0.3 * k / max(len(pairs), 1),
+                        linewidth=0,
+                        label='{:g}-{:g}%'.format(100 * q, 100 * (1 - q)))
+    if 0.5 in levels:
+        ax.plot(bands.t, bands.bands[levels.index(0.5)], color=color,
+                label=(label + ' median').strip())
+    ax.set_xlabel('time [h]')
+    ax.set_ylabel('concentration [ng/mL]')
+    ax.legend()
+
+    return fig
@@ -0,0 +1,272 @@
+#
+# Columnar on-disk storage of model results
+#
+# A result store is a directory with one raw little-endian float64 file per
+# column and a manifest.json describing their shapes:
+#
+#   t.f8          (n_runs, n_times)                   output times
+#   y.f8          (n_runs, n_compartments, n_times)   central, peripheral
+#   dose.f8       (n_runs, n_times)                   dosing rate
+#   dose_comp.f8  (n_runs, n_times)                   dosing compartment
+#   params.f8     (n_runs, n_parameters)              model parameters
+#
+# Runs with fewer compartments or times than the store are padded with NaN.
+# Raw files (rather than .npz) can be appended to run by run and memory
+# mapped on reading, so single runs or compartments can be sliced out of
+# stores much larger than memory.
+#
+
+# Packages
+import json
+import os
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+FORMAT = 'pkmodel-store'
+FORMAT_VERSION = 1
+DTYPE = '<f8'
+COLUMNS = ('t', 'y', 'dose', 'dose_comp', 'params')
+
+
+class ResultWriter:
+    """Writer that appends model results to a result store.
+
+    Results are written to disk as they are appended, so memory use does
+    not grow with the number of runs. The manifest is written on close();
+    use the writer as a context manager.
+
+    Input
+    -----
+    path: str, directory of the store, created if needed
+    n_compartments: int, number of central and peripheral compartments
+        kept per run
+    n_times: int, number of output times kept per run
+    parameters: list of str, names of the model parameters stored per run.
+        Defaults to the numeric entries of the first model_input appended.
+    """
+
+    def __init__(self, path, n_compartments, n_times, parameters=None):
+        self.path = path
+        self.n_compartments = n_compartments
+        self.n_times = n_times
+        self.parameters = None if parameters is None else list(parameters)
+        self.names = []
+        self.closed = False
+        os.makedirs(path, exist_ok=True)
+        self._files = {column: open(os.path.join(path, column + '.f8'), 'wb')
+                       for column in COLUMNS}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.names)
+
+    def append(self, sol, model_input=None, dose=None, name=None):
+        """Appends one result.
+
+        Input
+        -----
+        sol: OdeResult, result of a model runner
+        model_input: dict, parameters of the run
+        dose: array, dosing rate at sol.t
+        name: str, name of the run, defaults to sol.name or the index
+        """
+        if name is None:
+            name = sol.get('name', 'run ' + str(len(self)))
+        if dose is None:
+            dose = sol.get('dose')
+        dose_comp = sol.get('dose_comp')
+        self.append_many(
+            sol.t, np.asarray(sol.y)[None],
+            dose=None if dose is None else np.asarray(dose)[None],
+            dose_comp=None if dose_comp is None else dose_comp[None],
+            params=None if model_input is None else {
+                k: [v] for k, v in model_input.items()},
+            names=[name])
+
+    def append_many(self, t, y, dose=None, dose_comp=None, params=None,
+                    names=None):
+        """Appends the results of several runs, e.g. of a population.
+
+        Input
+        -----
+        t: array, output times, shape (n_times,) shared by all runs or
+            (N, n_times)
+        y: array, solutions, shape (N, n_compartments, n_times)
+        dose: array, optional dosing rates, shape (N, n_times)
+        dose_comp: array, optional dosing compartment, shape (N, n_times)
+        params: dict, optional parameters, scalars or arrays of length N
+        names: list of str, optional names of the runs
+        """
+        y = np.asarray(y, dtype=float)
+        N, n_compartments, n_times = y.shape
+        if n_compartments > self.n_compartments or n_times > self.n_times:
+            raise ValueError(
+                'Results with {} compartments and {} times do not fit a '
+                'store of {} compartments and {} times.'.format(
+                    n_compartments, n_times, self.n_compartments,
+                    self.n_times))
+
+        self._write('t', np.broadcast_to(t, (N, n_times)), (N, self.n_times))
+        self._write('y', y, (N, self.n_compartments, self.n_times))
+        for column, values in (('dose', dose), ('dose_comp', dose_comp)):
+            if values is None:
+                values = np.full((N, n_times), np.nan)
+            self._write(column, np.broadcast_to(values, (N, n_times)),
+                        (N, self.n_times))
+
+        params = params or {}
+        if self.parameters is None:
+            self.parameters = sorted(
+                k for k, v in params.items()
+                if np.issubdtype(np.asarray(v).dtype, np.number))
+        columns = [np.broadcast_to(np.asarray(params.get(k, np.nan),
+                                              dtype=float), (N,))
+                   for k in self.parameters]
+        self._write('params', np.stack(columns, axis=-1)
+                    if columns else np.empty((N, 0)),
+                    (N, len(self.parameters)))
+
+        start = len(self.names)
+        if names is None:
+            names = ['run ' + str(i) for i in range(start, start + N)]
+        self.names.extend(str(name) for name in names)
+
+    def write_runs(self, runs, configs=None):
+        """Appends results from an iterable as they arrive, e.g. from
+        iter_runs, without keeping them in memory.
+
+        Input
+        -----
+        runs: iterable of (index, result) pairs, see iter_runs
+        configs: list of dict, optional configurations of the runs, whose
+            'model_input' is stored as the parameters of each run
+
+        Output
+        ------
+        failed: list of the results that are not solutions (FailedRun)
+        """
+        failed = []
+        for index, sol in runs:
+            if not isinstance(sol, dict):
+                failed.append(sol)
+                continue
+            config = {} if configs is None else configs[index]
+            name = config.get('name', sol.get('name', 'run ' + str(index)))
+            self.append(sol, config.get('model_input'), name=name)
+        return failed
+
+    def _write(self, column, values, shape):
+        """Writes values padded with NaN to the given shape."""
+        block = np.full(shape, np.nan, dtype=DTYPE)
+        block[tuple(slice(0, n) for n in np.shape(values))] = values
+        block.tofile(self._files[column])
+
+    def close(self):
+        """Flushes the column files and writes the manifest."""
+        if self.closed:
+            return
+        for f in self._files.values():
+            f.close()
+        manifest = {'format': FORMAT, 'version': FORMAT_VERSION,
+                    'dtype': DTYPE, 'n_runs': len(self.names),
+                    'n_compartments': self.n_compartments,
+                    'n_times': self.n_times,
+                    'parameters': self.parameters or [],
+                    'names': self.names}
+        with open(os.path.join(self.path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        self.closed = True
+
+
+def write_results(path, results, model_inputs=None, names=None):
+    """Function that writes a list of model results to a result store.
+
+    Input
+    -----
+    path: str, directory of the store
+    results: list of OdeResult, results of the model runners, with the
+        dosing rate as .dose and the name as .name if available
+    model_inputs: list of dict, optional parameters of every run
+    names: list of str, optional names of the runs
+    """
+    n_compartments = max(len(sol.y) for sol in results)
+    n_times = max(len(sol.t) for sol in results)
+    with ResultWriter(path, n_compartments, n_times) as writer:
+        for i, sol in enumerate(results):
+            writer.append(sol,
+                          None if model_inputs is None else model_inputs[i],
+                          name=None if names is None else names[i])
+
+
+class ResultStore:
+    """Reader of a result store. The columns are memory mapped, so slicing
+    single runs or compartments only reads those from disk.
+
+    Input
+    -----
+    path: str, directory of the store
+
+    Attributes
+    ----------
+    t: array (n_runs, n_times), output times
+    y: array (n_runs, n_compartments, n_times), central and peripheral
+        compartments
+    dose: array (n_runs, n_times), dosing rate
+    dose_comp: array (n_runs, n_times), dosing compartment
+    params: array (n_runs, n_parameters), parameters named in .parameters
+    names: list of str, names of the runs
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('format') != FORMAT:
+            raise ValueError(path + ' is not a pkmodel result store.')
+        self.names = manifest['names']
+        self.parameters = manifest['parameters']
+        N = manifest['n_runs']
+        C = manifest['n_compartments']
+        T = manifest['n_times']
+        shapes = {'t': (N, T), 'y': (N, C, T), 'dose': (N, T),
+                  'dose_comp': (N, T), 'params': (N, len(self.parameters))}
+        for column, shape in shapes.items():
+            setattr(self, column, self._map(column, shape,
+                                            manifest['dtype']))
+
+    def _map(self, column, shape, dtype):
+        if 0 in shape:  # empty files cannot be memory mapped
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, column + '.f8'),
+                         dtype=dtype, mode='r', shape=shape)
+
+    def __len__(self):
+        return len(self.names)
+
+    def parameter(self, name):
+        """Values of one parameter for all runs, shape (n_runs,)."""
+        return self.params[:, self.parameters.index(name)]
+
+    def run(self, i):
+        """Result of run i in the form returned by the model runners, with
+        the padding removed. Arrays are read-only views of the store."""
+        times = ~np.isnan(self.t[i])
+        compartments = ~np.all(np.isnan(self.y[i]), axis=-1)
+        sol = OptimizeResult(t=self.t[i][times],
+                             y=self.y[i][compartments][:, times],
+                             dose=self.dose[i][times],
+                             name=self.names[i])
+        if not np.all(np.isnan(self.dose_comp[i])):
+            sol.dose_comp = self.dose_comp[i][times]
+        return sol
+
+
+def open_results(path):
+    """Function that opens a result store for reading, see ResultStore."""
+    return ResultStore(path)
@@ -0,0 +1,165 @@
+#
+# Responses to dosing regimens by superposition of unit responses
+#
+# The compartment models are linear and time invariant, so the response to
+# a regimen is the sum of shifted and scaled responses to a single unit
+# dose. The unit responses are solved once per parameter set, after which
+# any regimen on the same time grid only costs a convolution.
+#
+
+# Packages
+import numpy as np
+import scipy.fft
+
+from .linear import propagate, rate_matrix
+from .protocol import DoseSchedule
+
+
+def grid_regimen(t_eval, times, amounts, durations=None):
+    """Function that puts a list of doses on a uniform time grid.
+
+    Inputs
+    ------
+    t_eval (array): Uniform time grid.
+    times (array): Start times of the doses, in any order. They need to lie
+                   on the grid; refine the grid to represent other times.
+    amounts (array): Amount of every dose.
+    durations (array): Duration of every dose. Doses of duration 0 (the
+                       default) are boluses, the others are infusions at
+                       rate amount / duration. Infusions need to end on the
+                       grid as well.
+
+    Outputs
+    -------
+    rates (array): Infusion rate on every grid interval [t_i, t_i+1),
+                   shape (len(t_eval),)
+    boluses (array): Bolus amount at every grid time, shape (len(t_eval),)
+    """
+    t_eval = np.asarray(t_eval, dtype=float)
+    times, amounts, durations = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(times, dtype=float)),
+        np.asarray(amounts, dtype=float),
+        np.asarray(0.0 if durations is None else durations, dtype=float))
+    start = _grid_index(t_eval, times)
+    end = _grid_index(t_eval, times + durations)
+
+    T = len(t_eval)
+    boluses = np.zeros(T)
+    bolus = (durations == 0) & (start < T)
+    np.add.at(boluses, start[bolus], amounts[bolus])
+    # an infusion adds its rate from its start and removes it at its end
+    changes = np.zeros(T + 1)
+    infusion = durations > 0
+    rate = amounts[infusion] / durations[infusion]
+    np.add.at(changes, np.minimum(start[infusion], T), rate)
+    np.add.at(changes, np.minimum(end[infusion], T), -rate)
+    return np.cumsum(changes[:T]), boluses
+
+
+def _grid_index(t_eval, times):
+    """Position of times on a uniform grid, which may lie past its end."""
+    h = t_eval[1] - t_eval[0]
+    index = (times - t_eval[0]) / h
+    rounded = np.round(index)
+    if np.any(np.abs(index - rounded) > 1e-6) or np.any(rounded < 0):
+        raise ValueError('Dose times need to lie on the time grid.')
+    return rounded.astype(int)
+
+
+class UnitResponse:
+    """Responses of a compartment model to a unit dose, from which the
+    response to any regimen on the same grid is assembled.
+
+    The step response (to a unit rate infusion that never stops) and the
+    impulse response (to a unit bolus) are solved exactly with propagate,
+    once. Parameters can be arrays of shape (N,) for N models at once.
+
+    Input
+    -----
+    t_eval: array, uniform time grid
+    model_input: dict, model parameters, see rate_matrix
+    no_peripheral: int, number of peripheral compartments
+    dose_comp: bool, whether a dosing compartment is used
+
+    Attributes
+    ----------
+    step: array (n, len(t_eval)) or (N, n, len(t_eval)), step response
+    impulse: array of the same shape, impulse response
+    """
+
+    def __init__(self, t_eval, model_input, no_peripheral=1,
+                 dose_comp=False):
+        self.t = np.asarray(t_eval, dtype=float)
+        steps = np.diff(self.t)
+        if len(self.t) < 2 or not np.allclose(steps, steps[0]):
+            raise ValueError('t_eval needs to be a uniform grid.')
+        matrix, input_vector = rate_matrix(model_input, no_peripheral,
+                                           dose_comp)
+        zero = np.zeros(len(input_vector))
+        self.step = propagate(self.t, zero, matrix, input_vector,
+                              DoseSchedule([-np.inf], [np.inf], 1.0))
+        self.impulse = propagate(self.t, input_vector, matrix,
+                                 input_vector,
+                                 DoseSchedule([-np.inf], [np.inf], 0.0))
+
+    def regimen(self, times, amounts, durations=None):
+        """Infusion rates and boluses of a list of doses on the grid, see
+        grid_regimen."""
+        return grid_regimen(self.t, times, amounts, durations)
+
+    def response(self, rates=None, boluses=None, method='direct'):
+        """Function that gives the response to one or many regimens,
+        starting from zero.
+
+        Inputs
+        ------
+        rates (array): Infusion rate on every grid interval, shape
+                       (..., len(t_eval)), see grid_regimen.
+        boluses (array): Bolus amount at every grid time, shape
+                         (..., len(t_eval)).
+        method (str): 'direct' adds one shifted unit response per grid
+                      time at which any regimen doses, which is fastest for
+                      few doses; 'fft' convolves with the FFT, whose cost
+                      does not depend on the number of doses.
+
+        Leading dimensions of the regimens broadcast against those of the
+        responses, e.g. rates of shape (R, 1, T) and N models give the
+        responses to R regimens for every model.
+
+        Outputs
+        -------
+        y (array): Amounts in every compartment, shape
+                   (..., n, len(t_eval)), ordered as in rate_matrix.
+        """
+        if method not in ('direct', 'fft'):
+            raise ValueError("method needs to be 'direct' or 'fft'.")
+        T = len(self.t)
+        y = 0.0
+        if rates is not None:
+            rates = np.asarray(rates, dtype=float)
+            # the step response to a change of rate at every grid time
+            changes = np.diff(rates, axis=-1, prepend=0.0)
+            y = y + _convolve(changes, self.step, T, method)
+        if boluses is not None:
+            y = y + _convolve(np.asarray(boluses, dtype=float),
+                              self.impulse, T, method)
+        return np.broadcast_to(y, np.broadcast_shapes(
+            np.shape(y), self.step.shape)).copy()
+
+
+def _convolve(inputs, response, T, method):
+    """Causal convolution of inputs (..., T) with response (..., n, T) along
+    the last axis, truncated to T points."""
+    inputs = inputs[..., None, :]
+    if method == 'fft':
+        size = scipy.fft.next_fast_len(2 * T - 1, real=True)
+        spectrum = (scipy.fft.rfft(inputs, size)
+                    * scipy.fft.rfft(response, size))
+        return scipy.fft.irfft(spectrum, size)[..., :T]
+
+    shape = np.broadcast_shapes(inputs.shape, response.shape)
+    y = np.zeros(shape)
+    active = np.any(inputs != 0, axis=tuple(range(inputs.ndim - 1)))
+    for j in np.flatnonzero(active):
+        y[..., j:] += inputs[..., j:j + 1] * response[..., :T - j]
+    return y
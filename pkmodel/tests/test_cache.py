@@ -0,0 +1,113 @@
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pkmodel as pk
+
+
+class CacheTest(unittest.TestCase):
+    """
+    Tests the solution cache.
+    """
+    def setUp(self):
+        self.t_eval = np.linspace(0, 12, 25)
+        self.model_input = dict(pk.set_model_args(), dose_shape=0,
+                                dose_spikes=2, dose_strength=3.0)
+
+    def test_key(self):
+        key = pk.solution_key('subcutaneous', self.t_eval, np.zeros(3),
+                              self.model_input, {'method': 'exact'})
+        reordered = dict(reversed(list(self.model_input.items())),
+                         dose_spikes=np.int64(2), name='other')
+        self.assertEqual(key, pk.solution_key(
+            'subcutaneous', self.t_eval, np.zeros(3), reordered,
+            {'method': 'exact'}))
+        for changed in [('iv_two_compartments', self.t_eval, np.zeros(3),
+                         self.model_input, {'method': 'exact'}),
+                        ('subcutaneous', self.t_eval[:-1], np.zeros(3),
+                         self.model_input, {'method': 'exact'}),
+                        ('subcutaneous', self.t_eval, np.ones(3),
+                         self.model_input, {'method': 'exact'}),
+                        ('subcutaneous', self.t_eval, np.zeros(3),
+                         dict(self.model_input, CL=2.0), {'method': 'exact'}),
+                        ('subcutaneous', self.t_eval, np.zeros(3),
+                         self.model_input, {})]:
+            self.assertNotEqual(key, pk.solution_key(*changed))
+
+    def test_memory(self):
+        cache = pk.SolutionCache(maxsize=2)
+        runner = mock.Mock(wraps=pk.iv_one_compartment, __name__='runner',
+                           __module__='tests', __qualname__='runner')
+        first = cache.solve(runner, self.t_eval, np.zeros(1),
+                            self.model_input)
+        second = cache.solve(runner, self.t_eval, np.zeros(1),
+                             self.model_input)
+        self.assertEqual(runner.call_count, 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertIs(first.y, second.y)
+        with self.assertRaises(ValueError):
+            second.y[0, 0] = 1.0
+        second.dose = 1
+        second.diagnostics['message'] = 'changed'
+        third = cache.solve(runner, self.t_eval, np.zeros(1),
+                            self.model_input, method='RK45')
+        self.assertEqual(runner.call_count, 1)
+        self.assertNotIn('dose', third)
+        self.assertEqual(third.diagnostics, first.diagnostics)
+
+        for strength in (1.0, 2.0):
+            cache.solve(runner, self.t_eval, np.zeros(1),
+                        dict(self.model_input, dose_strength=strength))
+        self.assertEqual(len(cache), 2)
+        cache.solve(runner, self.t_eval, np.zeros(1), self.model_input)
+        self.assertEqual(runner.call_count, 4)
+
+    def test_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            solve = pk.SolutionCache(directory=directory).wrap('subcutaneous')
+            sol = solve(self.t_eval, np.zeros(3), self.model_input)
+            cache = pk.SolutionCache(directory=directory)
+            cached = cache.solve('subcutaneous', self.t_eval, np.zeros(3),
+                                 self.model_input)
+            self.assertEqual((cache.hits, cache.disk_hits), (1, 1))
+            np.testing.assert_array_equal(cached.y, sol.y)
+            np.testing.assert_array_equal(cached.dose_comp, sol.dose_comp)
+            self.assertEqual(cached.nfev, sol.nfev)
+            self.assertEqual(cached.diagnostics['nfev'], sol.nfev)
+            self.assertEqual(cached.diagnostics['method'], 'RK45')
+            self.assertTrue(cached.success)
+            self.assertFalse(cached.y.flags.writeable)
+
+    def test_protocol(self):
+        protocol = pk.Protocol(boluses=[(0, 2.0)], infusions=[(1, 2, 0.5)])
+        key = pk.solution_key('subcutaneous', self.t_eval, np.zeros(3),
+                              self.model_input, {'protocol': protocol})
+        self.assertEqual(key, pk.solution_key(
+            'subcutaneous', self.t_eval, np.zeros(3), self.model_input,
+            {'protocol': pk.Protocol(boluses=[(0, 2)],
+                                     infusions=[(1, 2, 0.5)]),
+             'callback': print}))
+        self.assertNotEqual(key, pk.solution_key(
+            'subcutaneous', self.t_eval, np.zeros(3), self.model_input,
+            {'protocol': pk.Protocol(boluses=[(0, 3.0)])}))
+        with self.assertRaises(TypeError):
+            pk.solution_key('subcutaneous', self.t_eval, np.zeros(3),
+                            self.model_input, {'jac': print})
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = pk.SolutionCache(directory=directory)
+            calls = []
+            for _ in range(2):
+                sol = cache.solve('subcutaneous', self.t_eval, np.zeros(3),
+                                  self.model_input, protocol=protocol,
+                                  callback=calls.append)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            # the callback only sees solves that run
+            self.assertEqual(len(calls), 1)
+            np.testing.assert_array_equal(sol.y, pk.subcutaneous(
+                self.t_eval, np.zeros(3), self.model_input,
+                protocol=protocol).y)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import csv
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+import pkmodel as pk
+from pkmodel import cli
+
+
+class CliTest(unittest.TestCase):
+    """
+    Tests the ``pkmodel run`` command.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_json_to_json(self):
+        specs = {'defaults': {'dose_shape': 0, 'dose_spikes': 2,
+                              'dose_strength': 3.0, 'n_times': 13},
+                 'models': [{'name': 'a', 'no_peripheral': 0},
+                            {'name': 'b', 'no_peripheral': 2,
+                             'dose_comp': True, 'CL': 2.0},
+                            {'name': 'c', 'model': 'iv_two_compartments',
+                             'method': 'exact'},
+                            {'name': 'bad', 'V_c': 'x'}]}
+        with open(self.path('models.json'), 'w') as f:
+            json.dump(specs, f)
+        code = cli.main(['run', self.path('models.json'), '--workers', '1',
+                         '--format', 'json', '-o', self.path('out.json')])
+        self.assertEqual(code, 1)
+        with open(self.path('out.json')) as f:
+            runs = json.load(f)
+        self.assertEqual([r['name'] for r in runs], ['a', 'b', 'c', 'bad'])
+        self.assertEqual([r['success'] for r in runs],
+                         [True, True, True, False])
+        self.assertEqual(np.shape(runs[1]['y']), (3, 13))
+        self.assertEqual(len(runs[1]['dose_comp']), 13)
+
+        model_input = pk.set_model_args()
+        model_input.update(dose_shape=0, dose_spikes=2, dose_strength=3.0,
+                           CL=2.0)
+        t_eval = np.linspace(0, 12, 13)
+        expected = pk.compartment_model(t_eval, np.zeros(4), model_input,
+                                        no_peripheral=2, dose_comp=True)
+        np.testing.assert_allclose(runs[1]['y'], expected.y)
+        np.testing.assert_allclose(runs[1]['t'], t_eval)
+
+    def test_csv_to_csv(self):
+        with open(self.path('models.csv'), 'w') as f:
+            f.write('name,no_peripheral,dose_comp,dose_shape,dose_spikes,'
+                    'dose_strength,t_end,n_times\n'
+                    'one,0,false,1,1,2.0,6,7\n'
+                    'two,1,true,0,3,1.5,,\n')
+        code = cli.main(['run', self.path('models.csv'), '-w', '1',
+                         '-o', self.path('out.csv')])
+        self.assertEqual(code, 0)
+        with open(self.path('out.csv')) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 7 + 121)
+        self.assertEqual(rows[0]['dose_comp'], '')
+        self.assertEqual(rows[0]['peripheral1'], '')
+        self.assertEqual(float(rows[-1]['t']), 12.0)
+        self.assertNotEqual(rows[-1]['dose_comp'], '')
+
+    def test_toml(self):
+        try:
+            import tomllib  # noqa
+        except ImportError:
+            self.skipTest('tomllib needs Python 3.11')
+        with open(self.path('models.toml'), 'w') as f:
+            f.write('[defaults]\ndose_shape = 1\ndose_spikes = 1\n'
+                    'dose_strength = 1.0\n\n'
+                    '[[models]]\nname = "x"\nt_eval = [0.0, 1.0, 2.0]\n')
+        specs = cli.read_specs(self.path('models.toml'))
+        config = cli.make_config(specs[0])
+        self.assertEqual(config['name'], 'x')
+        np.testing.assert_array_equal(config['t_eval'], [0, 1, 2])
+        self.assertEqual(config['model_input']['dose_strength'], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+
+
+class FittingTest(unittest.TestCase):
+    """
+    Tests the sensitivities and parameter fits.
+    """
+    def setUp(self):
+        self.t_obs = np.linspace(0.5, 12, 24)
+        self.t_eval = np.concatenate([[0.0], self.t_obs])
+        self.truth = dict(pk.set_model_args(), V_c=2.0, CL=0.7, Q_p1=0.4,
+                          V_p1=3.0, k_a=1.5, dose_shape=0, dose_spikes=2,
+                          dose_strength=4.0)
+        self.dose = pk.create_dosis_function(self.t_eval, 0, 2, 4.0)
+
+    def test_sensitivities(self):
+        names = ['V_c', 'CL', 'Q_p1', 'V_p1', 'k_a']
+        y, s = pk.sensitivities(self.t_eval, np.zeros(3), self.truth,
+                                self.dose, names, dose_comp=True)
+        self.assertEqual(s.shape, (5, 3, 25))
+        for j, name in enumerate(names):
+            h = 1e-6
+            shifted = [pk.solve_exact(
+                self.t_eval, np.zeros(3),
+                dict(self.truth, **{name: self.truth[name] * np.exp(d)}),
+                self.dose, dose_comp=True).y for d in (h, -h)]
+            np.testing.assert_allclose(
+                s[j], (shifted[0] - shifted[1]) / (2 * h), atol=1e-6)
+
+    def test_fit_recovers_parameters(self):
+        y = pk.solve_exact(self.t_eval, np.zeros(3), self.truth, self.dose,
+                           dose_comp=True).y
+        c_obs = y[1, 1:] / self.truth['V_c']
+        # absorption and elimination can swap roles (flip-flop), so start
+        # on the right side of that ambiguity
+        guess = dict(self.truth, V_c=3.0, CL=1.0, Q_p1=0.6, V_p1=2.0,
+                     k_a=1.0)
+        names = ['V_c', 'CL', 'Q_p1', 'V_p1', 'k_a']
+        with self.assertRaises(ValueError):
+            pk.fit(self.t_obs, c_obs, guess, names, dose_comp=True)
+        result = pk.fit(self.t_obs, c_obs, guess, names, dose_comp=True,
+                        dose_width=0.5, xtol=1e-12, ftol=1e-12, gtol=1e-12)
+        self.assertTrue(result.success)
+        for name in names:
+            self.assertAlmostEqual(result.parameters[name],
+                                   self.truth[name], places=5)
+        np.testing.assert_allclose(result.c, c_obs, atol=1e-8)
+
+    def test_one_compartment(self):
+        t_eval = np.concatenate([[0.0], self.t_obs])
+        dose = pk.create_dosis_function(t_eval, 1, 1, 2.0)
+        truth = dict(self.truth, dose_shape=1, dose_strength=2.0)
+        y = pk.solve_exact(t_eval, np.zeros(1), truth, dose,
+                           no_peripheral=0).y
+        weights = np.linspace(1, 2, 24)
+        result = pk.fit(self.t_obs, y[0, 1:] / 2.0,
+                        dict(truth, V_c=5.0, CL=0.2), no_peripheral=0,
+                        weights=weights)
+        self.assertAlmostEqual(result.parameters['V_c'], 2.0, places=5)
+        self.assertAlmostEqual(result.parameters['CL'], 0.7, places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
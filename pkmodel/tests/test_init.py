@@ -0,0 +1,40 @@
+import subprocess
+import sys
+import unittest
+import pkmodel as pk
+
+
+class InitTest(unittest.TestCase):
+    """
+    Tests the lazy imports of the package.
+    """
+    def test_import_is_light(self):
+        code = ('import sys, pkmodel; '
+                'print(sorted(m for m in ("scipy", "matplotlib") '
+                'if m in sys.modules))')
+        output = subprocess.run([sys.executable, '-c', code],
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), '[]')
+
+    def test_lazy_names(self):
+        for name in pk._LAZY:
+            self.assertIn(name, dir(pk))
+            self.assertIsNotNone(getattr(pk, name))
+        self.assertTrue(callable(pk.solution))
+        self.assertTrue(callable(pk.iv_one_compartment))
+        with self.assertRaises(AttributeError):
+            pk.no_such_name
+
+    def test_submodule_import_keeps_function(self):
+        # importing the submodule first must not shadow the function
+        code = ('import pkmodel, pkmodel.solution; '
+                'from pkmodel.solution import decimate; '
+                'print(callable(pkmodel.solution), '
+                'pkmodel.solution is decimate.__globals__["solution"])')
+        output = subprocess.run([sys.executable, '-c', code],
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), 'True True')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+
+
+class KernelsTest(unittest.TestCase):
+    """
+    Tests the :class:`LinearModel` classes.
+    """
+    def setUp(self):
+        self.model_input = pk.set_model_args()
+        self.model_input.update({'Q_p1': 2.0, 'V_p1': 3.0, 'CL': 0.7,
+                                 'k_a': 1.5, 'dose_shape': 0,
+                                 'dose_spikes': 3, 'dose_strength': 4.0})
+        self.t_eval = np.linspace(0, 12, 25)
+        self.dose = pk.create_dosis_function(self.t_eval, 0, 3, 4.0)
+
+    def test_matches_rhs_functions(self):
+        models = [(pk.IVOneCompartmentModel, pk.rhs_iv_one_compartment),
+                  (pk.IVTwoCompartmentsModel, pk.rhs_iv_two_compartments),
+                  (pk.SubcutaneousModel, pk.rhs_subcutaneous)]
+        rng = np.random.default_rng(1)
+        for cls, rhs in models:
+            model = cls(self.model_input)
+            for t in [0.2, 1.0, 4.2, 7.0]:
+                y = rng.random(model.n)
+                expected = np.ravel(rhs(t, y, self.model_input, self.t_eval,
+                                        self.dose))
+                np.testing.assert_allclose(model.rhs(t, y, self.dose),
+                                           expected)
+                out = np.empty(model.n)
+                result = model.rhs(t, y, self.dose, out=out)
+                self.assertIs(result, out)
+                np.testing.assert_allclose(out, expected)
+
+    def test_jacobian(self):
+        model = pk.SubcutaneousModel(self.model_input)
+        y = np.array([1.0, 2.0, 3.0])
+        columns = [model.rhs(0.5, e, lambda t: 0.0) for e in np.eye(3)]
+        np.testing.assert_allclose(model.jacobian, np.transpose(columns))
+        np.testing.assert_allclose(model.rhs(0.5, y, lambda t: 0.0),
+                                   model.jacobian @ y)
+
+    def test_stiff_solver_uses_jacobian(self):
+        stiff = dict(self.model_input, k_a=1e4, CL=500.0)
+        exact = pk.subcutaneous(self.t_eval, np.zeros(3), stiff,
+                                method='exact')
+        for method in ['Radau', 'BDF', 'LSODA']:
+            sol = pk.subcutaneous(self.t_eval, np.zeros(3), stiff,
+                                  method=method, rtol=1e-8, atol=1e-10)
+            self.assertTrue(sol.success)
+            np.testing.assert_allclose(sol.y, exact.y, atol=1e-6)
+            np.testing.assert_allclose(sol.dose_comp, exact.dose_comp,
+                                       atol=1e-6)
+
+    def test_sparse(self):
+        model_input = dict(self.model_input)
+        for i in range(1, 41):
+            model_input['Q_p' + str(i)] = 0.1 * i
+            model_input['V_p' + str(i)] = 1.0 + i
+        sparse = pk.LinearModel(model_input, no_peripheral=40,
+                                dose_comp=True)
+        dense = pk.LinearModel(model_input, no_peripheral=40,
+                               dose_comp=True, sparse=False)
+        self.assertTrue(sparse.sparse)
+        np.testing.assert_allclose(sparse.jacobian.toarray(), dense.jacobian)
+        y = np.random.default_rng(2).random(42)
+        np.testing.assert_allclose(sparse.rhs(0.1, y, self.dose),
+                                   dense.rhs(0.1, y, self.dose))
+        out = np.empty(42)
+        sparse.rhs(0.1, y, self.dose, out=out)
+        np.testing.assert_allclose(out, dense.rhs(0.1, y, self.dose))
+
+
+if __name__ == '__main__':
+    unittest.main()
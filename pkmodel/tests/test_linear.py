@@ -0,0 +1,84 @@
+import unittest
+import numpy as np
+import scipy.integrate
+import pkmodel as pk
+
+
+def make_input(shape, spikes=4, strength=5.0):
+    model_input = pk.set_model_args()
+    model_input.update({'Q_p1': 2.0, 'V_p1': 3.0, 'CL': 0.7, 'k_a': 1.5,
+                        'dose_shape': shape, 'dose_spikes': spikes,
+                        'dose_strength': strength})
+    return model_input
+
+
+class LinearTest(unittest.TestCase):
+    """
+    Tests the exact solution of the linear models.
+    """
+    def test_rate_matrix_matches_rhs(self):
+        model_input = make_input(1, strength=0.0)
+        t_eval = np.linspace(0, 1, 11)
+        models = [(pk.rhs_iv_one_compartment, 0, False),
+                  (pk.rhs_iv_two_compartments, 1, False),
+                  (pk.rhs_subcutaneous, 1, True)]
+        for rhs, no_peripheral, dose_comp in models:
+            matrix, b = pk.rate_matrix(model_input, no_peripheral, dose_comp)
+            for j, column in enumerate(np.eye(len(b))):
+                np.testing.assert_allclose(
+                    np.ravel(rhs(0.0, column, model_input, t_eval)),
+                    matrix[:, j])
+
+    def test_one_compartment_analytical(self):
+        t_eval = np.linspace(0, 10, 10)
+        model_input = make_input(1)
+        sol = pk.iv_one_compartment(t_eval, np.array([0.0]), model_input,
+                                    method='exact')
+        analytical = 5.0 / 0.7 * (1 - np.exp(-0.7 * t_eval))
+        np.testing.assert_allclose(sol.y[0], analytical, rtol=1e-12)
+        self.assertTrue(sol.success)
+
+    def test_matches_numerical_solution(self):
+        t_eval = np.linspace(0, 12, 121)
+        model_input = make_input(0)
+        dose = pk.create_dosis_function(t_eval, 0, 4, 5.0)
+        rhs = pk.rhs_subcutaneous
+        reference = scipy.integrate.solve_ivp(
+            lambda t, y: rhs(t, y, model_input, t_eval, dose),
+            [0, 12], np.zeros(3), t_eval=t_eval, rtol=1e-10, atol=1e-12,
+            max_step=0.01)
+        sol = pk.subcutaneous(t_eval, np.zeros(3), model_input,
+                              method='exact')
+        np.testing.assert_allclose(sol.dose_comp, reference.y[0], atol=1e-6)
+        np.testing.assert_allclose(sol.y, reference.y[1:], atol=1e-6)
+
+    def test_spikes_between_outputs(self):
+        # spikes narrower than the output spacing still deliver their dose
+        dose = pk.DoseSchedule([0.25, 1.25], [0.5, 1.5], 4.0)
+        y = pk.propagate([0.0, 1.0, 2.0], [0.0], np.zeros((1, 1)),
+                         np.ones(1), dose)
+        np.testing.assert_allclose(y[0], [0.0, 1.0, 2.0])
+
+    def test_periodic_state(self):
+        model_input = make_input(0)
+        matrix, input_vector = pk.rate_matrix(model_input, dose_comp=True)
+        one = pk.Protocol(boluses=[(0.0, 3.0), (12.0, 9.0)],
+                          infusions=[(2.0, 1.5, 1.0)])
+        state = pk.periodic_state(0.0, 12.0, matrix, input_vector, one)
+        # simulate 60 intervals and compare the start of the last one
+        many = pk.Protocol(boluses=[(0.0, 3.0)],
+                           infusions=[(2.0, 1.5, 1.0)], period=12.0,
+                           cycles=60)
+        t_eval = np.arange(0, 61) * 12.0
+        y = pk.propagate(t_eval, np.zeros(3), matrix, input_vector, many)
+        np.testing.assert_allclose(y[:, -1], state, rtol=1e-10)
+
+        batched, _ = pk.rate_matrix(dict(model_input, CL=np.array(
+            [model_input['CL'], 2.0])), dose_comp=True)
+        states = pk.periodic_state(0.0, 12.0, batched, input_vector, one)
+        self.assertEqual(states.shape, (2, 3))
+        np.testing.assert_allclose(states[0], state)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+
+
+class MetricsTest(unittest.TestCase):
+    """
+    Tests the summary metrics of concentration curves.
+    """
+    def setUp(self):
+        self.t = np.linspace(0, 10, 101)
+        self.k = np.array([0.5, 1.0, 1.5])
+        # absorption at rate 2 and elimination at rate k
+        self.c = (np.exp(-self.k[:, None] * self.t)
+                  - np.exp(-2 * self.t)) * 4
+
+    def test_concentration(self):
+        y = np.ones((5, 3, 7))
+        c = pk.concentration(y, np.arange(1.0, 6.0), central=1)
+        self.assertEqual(c.shape, (5, 7))
+        np.testing.assert_array_equal(c[:, 0], 1 / np.arange(1.0, 6.0))
+        self.assertEqual(pk.concentration(y[0], 2.0).shape, (7,))
+
+    def test_peak(self):
+        c = np.exp(-self.t)
+        c[40] = 3.0
+        self.assertEqual(pk.cmax(c), 3.0)
+        self.assertEqual(pk.tmax(self.t, c), 4.0)
+        np.testing.assert_array_equal(
+            pk.tmax(self.t, self.c),
+            [self.t[np.argmax(row)] for row in self.c])
+
+    def test_auc(self):
+        c = np.exp(-self.t)
+        exact = 1 - np.exp(-10)
+        self.assertAlmostEqual(pk.auc(self.t, c, method='log-down'), exact,
+                               places=12)
+        self.assertAlmostEqual(pk.auc(self.t, c), exact, places=2)
+        expected = 4 * ((1 - np.exp(-10 * self.k)) / self.k
+                        - (1 - np.exp(-20)) / 2)
+        np.testing.assert_allclose(pk.auc(self.t, self.c, 'log-down'),
+                                   expected, rtol=5e-3)
+        with self.assertRaises(ValueError):
+            pk.auc(self.t, c, method='spline')
+
+    def test_half_life(self):
+        half_life = pk.terminal_half_life(self.t, self.c, n_points=10)
+        np.testing.assert_allclose(half_life[:2], np.log(2) / self.k[:2],
+                                   rtol=1e-3)
+        self.assertTrue(np.isnan(pk.terminal_half_life(self.t,
+                                                       np.ones(101))))
+
+    def test_troughs(self):
+        c = np.tile(np.arange(5.0), 3)
+        t = np.arange(15.0)
+        np.testing.assert_array_equal(pk.troughs(t, c, [0, 5, 10]),
+                                      [4, 4, 4])
+        stacked = pk.troughs(t, np.stack([c, 2 * c]), [0, 5, 10])
+        self.assertEqual(stacked.shape, (2, 3))
+
+    def test_summary_of_population(self):
+        parameters = {'V_c': np.array([1.0, 2.0]), 'CL': 1.0, 'k_a': 2.0,
+                      'Q_p1': 1.0, 'V_p1': 1.0, 'dose_shape': 0,
+                      'dose_spikes': 3, 'dose_strength': 10.0}
+        y = pk.simulate_population('subcutaneous', self.t, parameters,
+                                   method='exact')
+        c = pk.concentration(y, parameters['V_c'], central=1)
+        dose = pk.create_dosis_function(self.t, 0, 3, 10.0)
+        metrics = pk.summary(self.t, c, dose.starts)
+        self.assertEqual(metrics['troughs'].shape, (2, 3))
+        for i in range(2):
+            single = pk.summary(self.t, c[i], dose.starts)
+            for key, value in single.items():
+                np.testing.assert_array_equal(metrics[key][i], value)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 import numpy as np
 import pkmodel as pk
 class ModelTest(unittest.TestCase):
@@ -28,12 +29,25 @@ class ModelTest(unittest.TestCase):
         model_input['dose_strength'] = 5
         model_input['dose_spikes'] = 5
 
-        sol = pk.iv_one_compartment(t_eval, y, model_input)
-        analytical_answer = [0, 3.3544858,4.45811595,4.82138807,4.9410439,
-                              4.98053981,4.9935766,4.99787977,4.99930016,4.99976893]
+        sol = pk.iv_one_compartment(t_eval, y, model_input,
+                                    rtol=1e-10, atol=1e-12)
+        analytical_answer = 5 * (1 - np.exp(-t_eval))
         for i,_ in enumerate(analytical_answer):
             self.assertAlmostEqual(sol.y[0][i],analytical_answer[i])
 
+    def test_spikes_between_outputs(self):
+        # a spike between two output times must not be stepped over
+        t_eval = np.linspace(0, 12, 13)
+        model_input = pk.set_model_args()
+        model_input['dose_shape'] = 0
+        model_input['dose_strength'] = 5
+        model_input['dose_spikes'] = 3
+        model_input['CL'] = 0.0
+        sol = pk.iv_one_compartment(t_eval, np.array([0.0]), model_input)
+        # spikes of width 1 at t = 0, 4 and 8 deliver 5 ng each
+        np.testing.assert_allclose(sol.y[0], [0, 5, 5, 5, 5, 10, 10, 10, 10,
+                                              15, 15, 15, 15])
+
     def test_rhs_iv_two_compartments(self):
         t = np.linspace(0,10,10)
         t_eval = t
@@ -96,6 +110,186 @@ class ModelTest(unittest.TestCase):
             self.assertAlmostEqual(sol.y[1][i], analytical_answer[1][i])
             self.assertAlmostEqual(sol.dose_comp[i], analytical_dose[i])
 
+    def test_dose_function_built_once(self):
+        t_eval = np.linspace(0, 10, 10)
+        model_input = pk.set_model_args()
+        model_input['dose_shape'] = 0
+        model_input['dose_strength'] = 5
+        model_input['dose_spikes'] = 5
+        runs = [(pk.iv_one_compartment, np.array([0.0])),
+                (pk.iv_two_compartments, np.array([0.0, 0.0])),
+                (pk.subcutaneous, np.array([0.0, 0.0, 0.0]))]
+        for runner, y0 in runs:
+            with mock.patch.object(pk, 'create_dosis_function',
+                                   wraps=pk.create_dosis_function) as build:
+                runner(t_eval, y0, model_input)
+            self.assertEqual(build.call_count, 1)
+
+    def test_compartment_model(self):
+        t_eval = np.linspace(0, 12, 49)
+        model_input = pk.set_model_args()
+        model_input['dose_shape'] = 0
+        model_input['dose_strength'] = 5
+        model_input['dose_spikes'] = 3
+        for i in range(1, 6):
+            model_input['Q_p' + str(i)] = 0.5 * i
+            model_input['V_p' + str(i)] = 2.0 / i
+        options = {'rtol': 1e-10, 'atol': 1e-12}
+
+        sol = pk.compartment_model(t_eval, np.zeros(3), model_input,
+                                   no_peripheral=1, dose_comp=True, **options)
+        reference = pk.subcutaneous(t_eval, np.zeros(3), model_input,
+                                    **options)
+        np.testing.assert_allclose(sol.y, reference.y)
+        np.testing.assert_allclose(sol.dose_comp, reference.dose_comp)
+
+        sol = pk.compartment_model(t_eval, np.zeros(6), model_input,
+                                   no_peripheral=5, **options)
+        exact = pk.compartment_model(t_eval, np.zeros(6), model_input,
+                                     no_peripheral=5, method='exact')
+        self.assertEqual(sol.y.shape, (6, 49))
+        np.testing.assert_allclose(sol.y, exact.y, atol=1e-8)
+
+    def test_protocol(self):
+        model_input = pk.set_model_args()
+        model_input['CL'] = 0.5
+        protocol = pk.Protocol(boluses=[(0.0, 4.0), (3.0, 2.0)],
+                               infusions=[(5.0, 2.0, 1.5)])
+        # q_c decays with rate CL / V_c = 0.5 after every dose
+        t = np.array([0.0, 1.0, 3.0, 4.0, 5.0, 6.5, 8.0])
+        expected = 4 * np.exp(-t / 2) + 2 * np.exp(-(t - 3) / 2) * (t >= 3)
+        inf = 1.5 / 0.5 * (1 - np.exp(-(np.clip(t, 5, 7) - 5) / 2))
+        expected = expected + inf * np.exp(-np.clip(t - 7, 0, None) / 2)
+        for method in ('RK45', 'exact', 'Radau'):
+            sol = pk.iv_one_compartment(t, np.zeros(1), model_input,
+                                        method=method, protocol=protocol,
+                                        rtol=1e-10, atol=1e-12)
+            np.testing.assert_allclose(sol.y[0], expected, rtol=1e-7)
+        # the dose does not depend on the output times
+        fine = pk.subcutaneous(np.linspace(0, 8, 801), np.zeros(3),
+                               model_input, method='exact',
+                               protocol=protocol)
+        coarse = pk.subcutaneous(t, np.zeros(3), model_input,
+                                 method='exact', protocol=protocol)
+        np.testing.assert_allclose(fine.y[:, [0, 100, 300, 400, 500, 650,
+                                              800]], coarse.y, rtol=1e-10)
+        np.testing.assert_allclose(coarse.dose_comp[[0, 2]], [4, 2 + 4
+                                   * np.exp(-3)])
+
+    def test_steady_state(self):
+        model_input = dict(pk.set_model_args(), dose_shape=0, dose_spikes=1,
+                           dose_strength=10.0, CL=0.3)
+        # 40 intervals of 12 hours, with one spike of width 0.1 each
+        t_long = np.linspace(0, 480, 4801)
+        long = pk.iv_two_compartments(t_long, np.zeros(2),
+                                      dict(model_input, dose_spikes=40),
+                                      method='exact')
+        t_eval = np.linspace(0, 12, 121)
+        for method in ('exact', 'RK45'):
+            sol = pk.iv_two_compartments(t_eval, np.zeros(2), model_input,
+                                         method=method, steady_state=True,
+                                         rtol=1e-10, atol=1e-12)
+            np.testing.assert_allclose(sol.y, long.y[:, -121:], rtol=1e-6)
+        y = pk.simulate_population('iv_two_compartments', t_eval,
+                                   dict(model_input, CL=[0.3, 0.6]),
+                                   method='exact', steady_state=True)
+        np.testing.assert_allclose(y[0], long.y[:, -121:], rtol=1e-6)
+
+    def test_observation_times(self):
+        model_input = dict(pk.set_model_args(), dose_shape=0, dose_spikes=3,
+                           dose_strength=10.0)
+        dense = pk.subcutaneous(np.linspace(0, 12, 121), np.zeros(3),
+                                model_input, method='exact')
+        samples = [5, 13, 72, 73, 118]
+        t_obs = dense.t[samples]
+        for method in ('exact', 'RK45', 'BDF'):
+            sol = pk.subcutaneous(t_obs, np.zeros(3), model_input,
+                                  method=method, t_span=(0, 12),
+                                  dose_width=0.1, rtol=1e-10, atol=1e-12)
+            np.testing.assert_array_equal(sol.t, t_obs)
+            np.testing.assert_allclose(sol.y, dense.y[:, samples],
+                                       rtol=1e-6, atol=1e-9)
+            np.testing.assert_allclose(sol.dose_comp,
+                                       dense.dose_comp[samples],
+                                       rtol=1e-6, atol=1e-9)
+        with self.assertRaises(ValueError):
+            pk.subcutaneous(t_obs[::-1], np.zeros(3), model_input)
+
+    def test_repeated_observation_times(self):
+        model_input = dict(pk.set_model_args(), dose_shape=0, dose_spikes=3,
+                           dose_strength=10.0)
+        protocol = pk.Protocol(boluses=[(2, 5.0)])
+        t_obs = [1, 2, 2, 5, 5]
+        for options in ({}, {'protocol': protocol}):
+            exact = pk.subcutaneous(t_obs, np.zeros(3), model_input,
+                                    method='exact', t_span=(0, 12),
+                                    dose_width=0.1, **options)
+            rk45 = pk.subcutaneous(t_obs, np.zeros(3), model_input,
+                                   method='RK45', t_span=(0, 12),
+                                   dose_width=0.1, rtol=1e-10, atol=1e-12,
+                                   **options)
+            for sol in (exact, rk45):
+                np.testing.assert_array_equal(sol.y[:, 1], sol.y[:, 2])
+                np.testing.assert_array_equal(sol.y[:, 3], sol.y[:, 4])
+            np.testing.assert_allclose(rk45.y, exact.y, rtol=1e-6,
+                                       atol=1e-9)
+
+    def test_sparse_observations(self):
+        model_input = dict(pk.set_model_args(), dose_shape=0, dose_spikes=3,
+                           dose_strength=10.0)
+        dense = pk.subcutaneous(np.linspace(0, 12, 121), np.zeros(3),
+                                model_input, method='exact')
+        # the spike width does not follow from a few observation times
+        for t_obs in ([5.0, 10.0], [10.0]):
+            with self.assertRaises(ValueError):
+                pk.subcutaneous(t_obs, np.zeros(3), model_input,
+                                method='exact', t_span=(0, 12))
+            sol = pk.subcutaneous(t_obs, np.zeros(3), model_input,
+                                  method='exact', t_span=(0, 12),
+                                  dose_width=0.1)
+            samples = np.round(np.array(t_obs) * 10).astype(int)
+            np.testing.assert_allclose(sol.y, dense.y[:, samples],
+                                       rtol=1e-9)
+
+    def test_late_start(self):
+        model_input = dict(pk.set_model_args(), dose_shape=0, dose_spikes=3,
+                           dose_strength=10.0)
+        # the doses move with the start of t_eval
+        for steady_state in (False, True):
+            early, late = [pk.subcutaneous(
+                np.linspace(t0, t0 + 12, 121), np.zeros(3), model_input,
+                method='exact', steady_state=steady_state)
+                for t0 in (0, 24)]
+            self.assertGreater(late.y.max(), 0)
+            np.testing.assert_allclose(late.y, early.y, rtol=1e-9,
+                                       atol=1e-12)
+
+    def test_diagnostics(self):
+        model_input = dict(pk.set_model_args(), dose_shape=0, dose_spikes=2,
+                           dose_strength=1.0)
+        t_eval = np.linspace(0, 12, 25)
+        collected = []
+        with mock.patch('sys.stdout') as stdout, \
+                self.assertLogs('pkmodel.model', 'DEBUG') as logs:
+            sol = pk.subcutaneous(t_eval, np.zeros(3), model_input,
+                                  method='BDF', callback=collected.append)
+            exact = pk.subcutaneous(t_eval, np.zeros(3), model_input,
+                                    method='exact', dose_width=0.1)
+        stdout.write.assert_not_called()
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(collected, [sol.diagnostics])
+        diagnostics = sol.diagnostics
+        self.assertEqual(diagnostics['method'], 'BDF')
+        self.assertEqual(diagnostics['status'], 0)
+        self.assertEqual(diagnostics['nfev'], sol.nfev)
+        self.assertGreater(diagnostics['n_steps'], 0)
+        self.assertGreater(diagnostics['nlu'], 0)
+        self.assertGreaterEqual(diagnostics['wall_time'], 0)
+        # 24 output intervals and 2 spike ends between them
+        self.assertEqual(exact.diagnostics['n_steps'], 26)
+        self.assertEqual(exact.diagnostics['nfev'], 0)
+
+
 if __name__ == '__main__':
     unittest.main()
 
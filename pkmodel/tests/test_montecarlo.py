@@ -0,0 +1,81 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+
+
+class MonteCarloTest(unittest.TestCase):
+    """
+    Tests the Monte Carlo prediction intervals.
+    """
+    def setUp(self):
+        self.t_eval = np.linspace(0, 12, 25)
+        self.typical = dict(pk.set_model_args(), dose_shape=0,
+                            dose_spikes=2, dose_strength=5.0)
+
+    def test_sample_parameters(self):
+        rng = np.random.default_rng(1)
+        parameters = pk.sample_parameters(self.typical,
+                                          {'CL': 0.3, 'V_c': 0.1}, 20000,
+                                          rng)
+        self.assertEqual(parameters['CL'].shape, (20000,))
+        self.assertEqual(parameters['k_a'], 1.0)
+        self.assertAlmostEqual(np.std(np.log(parameters['CL'])), 0.3,
+                               places=2)
+        self.assertAlmostEqual(np.median(parameters['V_c']), 1.0, places=2)
+
+    def test_sketch(self):
+        rng = np.random.default_rng(2)
+        curves = rng.normal(size=(500, 4))
+        sketch = pk.QuantileSketch(4, size=500)
+        for chunk in np.split(curves, 5):
+            sketch.update(chunk)
+        np.testing.assert_allclose(sketch.quantiles([0.1, 0.9]),
+                                   np.quantile(curves, [0.1, 0.9], axis=0))
+        np.testing.assert_allclose(sketch.mean, curves.mean(axis=0))
+
+        # more curves than the sketch keeps
+        curves = rng.normal(size=(50000, 4))
+        sketch = pk.QuantileSketch(4, size=5000, rng=rng)
+        for chunk in np.array_split(curves, 7):
+            sketch.update(chunk)
+        self.assertEqual(sketch.count, 50000)
+        np.testing.assert_allclose(sketch.quantiles([0.05, 0.5, 0.95]),
+                                   [[-1.645] * 4, [0] * 4, [1.645] * 4],
+                                   atol=0.1)
+
+    def test_bands(self):
+        bands = pk.monte_carlo('iv_two_compartments', self.t_eval,
+                               self.typical, {'CL': 0.3, 'V_c': 0.2},
+                               n_samples=300, chunk_size=128, seed=0)
+        self.assertEqual(bands.bands.shape, (3, 25))
+        self.assertTrue(np.all(bands.bands[0] <= bands.bands[1]))
+        self.assertTrue(np.all(bands.bands[1] <= bands.bands[2]))
+        again = pk.monte_carlo('iv_two_compartments', self.t_eval,
+                               self.typical, {'CL': 0.3, 'V_c': 0.2},
+                               n_samples=300, chunk_size=128, seed=0)
+        np.testing.assert_array_equal(bands.bands, again.bands)
+
+        # without variability every band is the typical subject
+        bands = pk.monte_carlo('subcutaneous', self.t_eval, self.typical,
+                               {'CL': 0.0}, n_samples=10)
+        sol = pk.subcutaneous(self.t_eval, np.zeros(3), self.typical,
+                              method='exact')
+        for band in bands.bands:
+            np.testing.assert_allclose(band, sol.y[0], atol=1e-12)
+
+    def test_plot_bands(self):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        bands = pk.monte_carlo('iv_one_compartment', self.t_eval,
+                               self.typical, {'CL': 0.3},
+                               quantiles=[0.05, 0.25, 0.5, 0.75, 0.95],
+                               n_samples=50)
+        fig = pk.plot_bands(bands, label='IV')
+        self.assertEqual(len(fig.axes[0].collections), 2)
+        self.assertEqual(len(fig.axes[0].lines), 1)
+        plt.close(fig)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+
+
+def make_config(model, strength):
+    model_input = pk.set_model_args()
+    model_input['dose_shape'] = 0
+    model_input['dose_spikes'] = 3
+    model_input['dose_strength'] = strength
+    return {'model': model, 't_eval': np.linspace(0, 12, 25),
+            'model_input': model_input}
+
+
+class ParallelTest(unittest.TestCase):
+    """
+    Tests running many models on a process pool.
+    """
+    def setUp(self):
+        models = ['iv_one_compartment', 'iv_two_compartments',
+                  'subcutaneous']
+        self.configs = [make_config(models[i % 3], float(i))
+                        for i in range(7)]
+
+    def test_results_in_order(self):
+        serial = pk.run_many(self.configs, workers=1)
+        parallel = pk.run_many(self.configs, workers=2, chunksize=2)
+        self.assertEqual(len(parallel), 7)
+        for config, a, b in zip(self.configs, serial, parallel):
+            expected = pk.run_model(config)
+            np.testing.assert_array_equal(a.y, expected.y)
+            np.testing.assert_array_equal(b.y, expected.y)
+
+    def test_failures_reported_per_item(self):
+        del self.configs[3]['model_input']['CL']
+        self.configs[5]['model'] = 'no_such_model'
+        results = pk.run_many(self.configs, workers=2)
+        for i, result in enumerate(results):
+            if i in (3, 5):
+                self.assertIsInstance(result, pk.FailedRun)
+                self.assertEqual(result.index, i)
+                self.assertIn('KeyError', result.error)
+            else:
+                self.assertTrue(result.success)
+
+    def test_options(self):
+        config = dict(self.configs[2], options={'method': 'exact'})
+        y0_config = dict(self.configs[0], y0=[1.0])
+        sol, sol_y0 = pk.run_many([config, y0_config], workers=1)
+        self.assertEqual(sol.nfev, 0)
+        self.assertEqual(sol_y0.y[0, 0], 1.0)
+
+    def test_iter_runs(self):
+        expected = pk.run_many(self.configs, workers=1)
+        ordered = list(pk.iter_runs(iter(self.configs), workers=2))
+        self.assertEqual([i for i, _ in ordered], list(range(7)))
+        unordered = dict(pk.iter_runs(self.configs, workers=2, chunksize=3,
+                                      ordered=False))
+        self.assertEqual(sorted(unordered), list(range(7)))
+        for i, sol in ordered:
+            np.testing.assert_array_equal(sol.y, expected[i].y)
+            np.testing.assert_array_equal(unordered[i].y, expected[i].y)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+
+
+class PopulationTest(unittest.TestCase):
+    """
+    Tests simulating many parameter sets at once.
+    """
+    def setUp(self):
+        self.t_eval = np.linspace(0, 12, 61)
+        self.parameters = {
+            'V_c': np.array([1.0, 2.0, 1.5, 0.5]),
+            'CL': np.array([1.0, 0.5, 2.0, 1.0]),
+            'Q_p1': 1.0, 'V_p1': 2.0,
+            'k_a': np.array([1.0, 3.0, 0.5, 1.0]),
+            'dose_shape': np.array([1, 0, 0, 0]),
+            'dose_spikes': np.array([1, 3, 3, 5]),
+            'dose_strength': np.array([5.0, 2.0, 4.0, 1.0]),
+        }
+
+    def individual(self, model, i):
+        # exact reference solution of the i-th model on its own
+        model_input = pk.set_model_args()
+        for key, value in self.parameters.items():
+            model_input[key] = np.broadcast_to(value, (4,))[i]
+        runner = getattr(pk, model)
+        n = pk.POPULATION_MODELS[model][1] + 1
+        y0 = np.zeros(n + pk.POPULATION_MODELS[model][2])
+        sol = runner(self.t_eval, y0, model_input, method='exact',
+                     rtol=1e-10, atol=1e-12)
+        if model == 'subcutaneous':
+            return np.vstack([sol.dose_comp, sol.y])
+        return sol.y
+
+    def test_matches_individual_runs(self):
+        for model in pk.POPULATION_MODELS:
+            for method in ['exact', 'RK45']:
+                y = pk.simulate_population(model, self.t_eval,
+                                           self.parameters, method=method,
+                                           rtol=1e-10, atol=1e-12)
+                self.assertEqual(y.shape, (4, len(y[0]), 61))
+                for i in range(4):
+                    np.testing.assert_allclose(
+                        y[i], self.individual(model, i),
+                        atol=1e-7)
+
+    def test_model_args(self):
+        # the name of set_model_args is not a parameter
+        parameters = dict(pk.set_model_args(), **self.parameters)
+        y = pk.simulate_population('subcutaneous', self.t_eval, parameters,
+                                   method='exact')
+        np.testing.assert_allclose(y[1], self.individual('subcutaneous', 1),
+                                   atol=1e-7)
+
+    def test_observation_times(self):
+        dense = pk.simulate_population('subcutaneous', self.t_eval,
+                                       self.parameters, method='exact')
+        samples = [3, 14, 15, 40, 59]
+        for method in ('exact', 'RK45'):
+            y = pk.simulate_population('subcutaneous', self.t_eval[samples],
+                                       self.parameters, method=method,
+                                       t_span=(0, 12), dose_width=0.2,
+                                       rtol=1e-10, atol=1e-12)
+            np.testing.assert_allclose(y, dense[..., samples], atol=1e-7)
+        with self.assertRaises(ValueError):
+            pk.simulate_population('subcutaneous', self.t_eval[samples],
+                                   self.parameters, t_span=(0, 12))
+
+    def test_heterogeneous_accuracy(self):
+        # a fast model among many slow ones keeps the accuracy it has alone
+        N = 200
+        parameters = dict(pk.set_model_args(), dose_shape=0, dose_spikes=3,
+                          dose_strength=5.0,
+                          CL=np.r_[5.0, np.linspace(0.5, 2.0, N - 1)],
+                          k_a=np.r_[50.0, np.ones(N - 1)])
+        exact = pk.simulate_population('subcutaneous', self.t_eval,
+                                       parameters, method='exact')
+        y = pk.simulate_population('subcutaneous', self.t_eval, parameters,
+                                   method='RK45')
+        alone = pk.simulate_population(
+            'subcutaneous', self.t_eval,
+            dict(parameters, CL=5.0, k_a=50.0), method='RK45')
+        error = np.max(np.abs(y[0] - exact[0]))
+        self.assertLess(error, 2 * np.max(np.abs(alone[0] - exact[0])))
+
+    def test_stiff_solver(self):
+        y = pk.simulate_population('subcutaneous', self.t_eval,
+                                   self.parameters, method='BDF',
+                                   rtol=1e-8, atol=1e-10)
+        exact = pk.simulate_population('subcutaneous', self.t_eval,
+                                       self.parameters, method='exact')
+        np.testing.assert_allclose(y, exact, atol=1e-5)
+
+    def test_initial_conditions(self):
+        y0 = np.array([[1.0], [2.0], [3.0], [4.0]])
+        parameters = dict(self.parameters, dose_strength=0.0)
+        y = pk.simulate_population('iv_one_compartment', self.t_eval,
+                                   parameters, y0=y0, method='exact')
+        np.testing.assert_allclose(y[:, 0, 0], [1, 2, 3, 4])
+        decay = np.exp(-self.t_eval[-1] * parameters['CL']
+                       / parameters['V_c'])
+        np.testing.assert_allclose(y[:, 0, -1], [1, 2, 3, 4] * decay)
+
+    def test_iter_population(self):
+        y = pk.simulate_population('subcutaneous', self.t_eval,
+                                   self.parameters, method='exact')
+        chunks = list(pk.iter_population('subcutaneous', self.t_eval,
+                                         self.parameters, chunk_size=3,
+                                         y0=np.zeros((4, 3)),
+                                         method='exact'))
+        self.assertEqual([start for start, _ in chunks], [0, 3])
+        np.testing.assert_allclose(
+            np.concatenate([chunk for _, chunk in chunks]), y)
+
+
+if __name__ == '__main__':
+    unittest.main()
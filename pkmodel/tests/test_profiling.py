@@ -0,0 +1,96 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+import numpy as np
+import pkmodel as pk
+from pkmodel import profiling
+
+
+class ProfilingTest(unittest.TestCase):
+    """
+    Tests the opt-in profiling of the solves.
+    """
+    def setUp(self):
+        self.t_eval = np.linspace(0, 5, 51)
+        self.model_input = dict(pk.set_model_args(), dose_shape=0,
+                                dose_spikes=3, dose_strength=5.0)
+
+    def test_disabled(self):
+        self.assertIsNone(profiling.new_run())
+        self.assertIs(profiling.instrument(None, 'rhs', np.exp), np.exp)
+        sol = pk.subcutaneous(self.t_eval, np.zeros(3), self.model_input)
+        self.assertNotIn('profile', sol)
+
+    def test_breakdown(self):
+        with pk.profile() as session:
+            sol = pk.subcutaneous(self.t_eval, np.zeros(3),
+                                  self.model_input)
+            pk.subcutaneous(self.t_eval, np.zeros(3), self.model_input,
+                            method='exact')
+        self.assertIsNone(profiling.new_run())
+        self.assertEqual(sol.profile['rhs']['calls'], sol.nfev)
+        # the dose is evaluated once per constant piece, between the
+        # starts and ends of the 3 spikes
+        self.assertEqual(sol.profile['dose']['calls'], 6)
+        self.assertEqual(sol.profile['dose_build']['calls'], 1)
+        self.assertAlmostEqual(sol.profile['solve']['time'],
+                               sol.diagnostics['wall_time'])
+        report = session.report()
+        self.assertEqual(report['runs']['calls'], 2)
+        self.assertEqual(report['dose_build']['calls'], 2)
+        self.assertEqual(report['rhs']['calls'], sol.nfev)
+        self.assertEqual(json.loads(session.to_json()), report)
+
+    def test_threads(self):
+        # solves of other threads are not recorded by this block
+        started, stop = threading.Event(), threading.Event()
+
+        def solve_elsewhere():
+            started.set()
+            while not stop.is_set():
+                pk.subcutaneous(self.t_eval, np.zeros(3), self.model_input)
+
+        thread = threading.Thread(target=solve_elsewhere)
+        thread.start()
+        started.wait()
+        try:
+            with pk.profile() as session:
+                for _ in range(3):
+                    pk.subcutaneous(self.t_eval, np.zeros(3),
+                                    self.model_input)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(session.report()['runs']['calls'], 3)
+
+    def test_population(self):
+        parameters = dict(self.model_input, CL=np.array([0.5, 1.0, 2.0]))
+        with pk.profile() as session:
+            pk.simulate_population('subcutaneous', self.t_eval, parameters,
+                                   3, method='RK45')
+        report = session.report()
+        self.assertEqual(report['runs']['calls'], 1)
+        self.assertGreater(report['rhs']['calls'], 0)
+        self.assertGreater(report['dose']['calls'], 0)
+
+    def test_environment(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'profile.json')
+            code = ('import numpy as np, pkmodel as pk\n'
+                    'pk.subcutaneous(np.linspace(0, 5, 11), np.zeros(3), '
+                    'dict(pk.set_model_args(), dose_shape=0, '
+                    'dose_spikes=3, dose_strength=5.0))\n')
+            subprocess.run([sys.executable, '-c', code], check=True,
+                           env=dict(os.environ, PKMODEL_PROFILE=path))
+            with open(path) as f:
+                report = json.load(f)
+        self.assertEqual(report['runs']['calls'], 1)
+        self.assertIn('rhs', report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 import pkmodel as pk
 
 
@@ -10,5 +11,79 @@ class ProtocolTest(unittest.TestCase):
         """
         Tests Protocol creation.
         """
-        model = pk.Protocol()
-        self.assertEqual(model.value, 43)
+        protocol = pk.Protocol()
+        self.assertEqual(protocol(1.0), 0.0)
+        self.assertEqual(protocol.bolus(0.0), 0.0)
+        self.assertEqual(len(protocol.breakpoints), 0)
+        with self.assertRaises(ValueError):
+            pk.Protocol(boluses=[(0.0, -1.0)])
+        with self.assertRaises(ValueError):
+            pk.Protocol(boluses=[(0.0, 1.0)], period=0.0)
+
+    def test_infusions(self):
+        protocol = pk.Protocol(infusions=[(1.0, 2.0, 3.0), (2.0, 2.0, 1.0)])
+        for time, expected in [(0.5, 0), (1.0, 3), (2.0, 4), (2.5, 4),
+                               (3.0, 1), (3.9, 1), (4.0, 0), (10.0, 0)]:
+            self.assertEqual(protocol(time), expected)
+        queries = np.linspace(0, 5, 501)
+        np.testing.assert_array_equal(protocol(queries),
+                                      [protocol(q) for q in queries])
+        np.testing.assert_array_equal(protocol.breakpoints, [1, 2, 3, 4])
+
+    def test_cycles(self):
+        protocol = pk.Protocol(boluses=[(0.0, 5.0), (0.0, 1.0)],
+                               infusions=[(1.0, 0.5, 2.0)], period=6.0,
+                               cycles=3)
+        np.testing.assert_array_equal(protocol.bolus_times, [0, 6, 12])
+        np.testing.assert_array_equal(protocol.bolus_amounts, [6, 6, 6])
+        np.testing.assert_array_equal(protocol.starts,
+                                      [0, 1, 6, 7, 12, 13])
+        self.assertEqual(protocol(13.2), 2.0)
+        self.assertEqual(protocol(19.2), 0.0)
+        self.assertEqual(protocol.bolus(6.0), 6.0)
+        np.testing.assert_array_equal(protocol.bolus([0.0, 3.0, 12.0]),
+                                      [6, 0, 6])
+        self.assertAlmostEqual(protocol.total(0, 18), 21.0)
+        self.assertAlmostEqual(protocol.total(0, 6), 7.0)
+
+
+class DoseScheduleTest(unittest.TestCase):
+    """
+    Tests the :class:`DoseSchedule` class.
+    """
+    def test_continuous(self):
+        t = np.linspace(0, 10, 11)
+        dose = pk.create_dosis_function(t, 1, 3, 5)
+        self.assertEqual(dose(-1.0), 5)
+        self.assertEqual(dose(4.2), 5)
+        self.assertEqual(dose(t), 5)
+        self.assertEqual(len(dose.breakpoints), 0)
+
+    def test_spikes(self):
+        t = np.linspace(0, 12, 121)
+        dose = pk.create_dosis_function(t, 0, 3, 2.0)
+        # spikes start at 0, 4 and 8 and last one time step (0.1)
+        for time, expected in [(-0.5, 0), (0.0, 2), (0.05, 2), (0.2, 0),
+                               (3.99, 0), (4.0, 2), (4.1, 2), (8.05, 2),
+                               (8.2, 0), (12.0, 0)]:
+            self.assertEqual(dose(time), expected)
+        np.testing.assert_allclose(dose.breakpoints,
+                                   [0.0, 0.1, 4.0, 4.1, 8.0, 8.1])
+        # spikes start at t[0]
+        late = pk.create_dosis_function(t + 24, 0, 3, 2.0, width=0.5)
+        np.testing.assert_allclose(late.breakpoints,
+                                   [24.0, 24.5, 28.0, 28.5, 32.0, 32.5])
+        self.assertEqual(pk.spike_width(t), t[1] - t[0])
+        with self.assertRaises(ValueError):
+            pk.spike_width(t, t_span=(0, 12))
+
+    def test_vectorized_matches_scalar(self):
+        t = np.linspace(0, 24, 2401)
+        dose = pk.create_dosis_function(t, 0, 200, 1.5)
+        queries = np.linspace(-1, 25, 5000)
+        expected = [dose(q) for q in queries]
+        np.testing.assert_array_equal(dose(queries), expected)
+
+    def test_unsorted(self):
+        with self.assertRaises(ValueError):
+            pk.DoseSchedule([1.0, 0.0], [1.5, 0.5], 1.0)
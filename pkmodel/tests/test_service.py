@@ -0,0 +1,154 @@
+import asyncio
+import unittest
+import numpy as np
+import numpy.testing as npt
+import pkmodel as pk
+
+
+class ServiceTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Tests solving models from coroutines.
+    """
+    def setUp(self):
+        self.t_eval = np.linspace(0, 12, 121)
+        self.model_input = dict(pk.set_model_args(), dose_shape=0,
+                                dose_spikes=3, dose_strength=5.0)
+        self.service = pk.SimulationService(max_workers=2)
+        self.addCleanup(self.service.close)
+
+    async def test_coalesce(self):
+        requests = [self.service.simulate('iv_two_compartments', self.t_eval,
+                                          self.model_input, method='exact',
+                                          protocol=None)
+                    for _ in range(5)]
+        results = await asyncio.gather(*requests)
+        self.assertTrue(all(sol is results[0] for sol in results))
+        self.assertEqual(self.service.solves, 1)
+        self.assertEqual(self.service.coalesced, 4)
+        # a later request is solved again
+        await self.service.simulate('iv_two_compartments', self.t_eval,
+                                    self.model_input, method='exact',
+                                    protocol=None)
+        self.assertEqual(self.service.solves, 2)
+
+    async def test_batch(self):
+        clearances = np.linspace(0.5, 2.0, 10)
+        results = await asyncio.gather(*[
+            self.service.simulate('subcutaneous', self.t_eval,
+                                  dict(self.model_input, CL=CL),
+                                  method='exact')
+            for CL in clearances])
+        self.assertEqual((self.service.solves, self.service.batches), (1, 1))
+        for CL, sol in zip(clearances, results):
+            self.assertEqual(sol.batch_size, 10)
+            expected = pk.subcutaneous(self.t_eval, np.zeros(3),
+                                       dict(self.model_input, CL=CL),
+                                       method='exact')
+            npt.assert_allclose(sol.y, expected.y, rtol=1e-9, atol=1e-12)
+            npt.assert_allclose(sol.dose_comp, expected.dose_comp,
+                                rtol=1e-9, atol=1e-12)
+
+    async def test_not_batched(self):
+        service = pk.SimulationService(batch_window=0)
+        self.addCleanup(service.close)
+        results = await asyncio.gather(*[
+            service.simulate('iv_one_compartment', self.t_eval,
+                             dict(self.model_input, CL=CL))
+            for CL in (0.5, 1.0)])
+        self.assertEqual((service.solves, service.batches), (2, 0))
+        self.assertIn('diagnostics', results[0])
+
+    async def test_protocol(self):
+        protocol = pk.Protocol(boluses=[(0, 2.0)], infusions=[(1, 2, 0.5)],
+                               period=6, cycles=2)
+        results = await asyncio.gather(*[
+            self.service.simulate('subcutaneous', self.t_eval,
+                                  self.model_input, method='exact',
+                                  protocol=protocol) for _ in range(2)])
+        self.assertIs(results[0], results[1])
+        self.assertEqual(self.service.solves, 1)
+        npt.assert_allclose(results[0].y, pk.subcutaneous(
+            self.t_eval, np.zeros(3), self.model_input, method='exact',
+            protocol=protocol).y)
+
+        # every callback is called, so these are not shared
+        calls = []
+        await asyncio.gather(*[
+            self.service.simulate('subcutaneous', self.t_eval,
+                                  self.model_input, protocol=protocol,
+                                  callback=calls.append) for _ in range(2)])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.service.coalesced, 1)
+
+    async def test_bad_request_in_batch(self):
+        # a dose that is not a number fails the batch, which must not fail
+        # the others
+        requests = [dict(self.model_input, CL=0.5),
+                    dict(self.model_input, dose_strength='5 ng'),
+                    dict(self.model_input, CL=2.0)]
+        results = await asyncio.wait_for(asyncio.gather(*[
+            self.service.simulate('subcutaneous', self.t_eval, model_input,
+                                  method='exact')
+            for model_input in requests], return_exceptions=True), 10)
+        self.assertIsInstance(results[1], Exception)
+        for i in (0, 2):
+            npt.assert_allclose(results[i].y, pk.subcutaneous(
+                self.t_eval, np.zeros(3), requests[i], method='exact').y)
+
+    async def test_batch_diagnostics(self):
+        results = await asyncio.gather(*[
+            self.service.simulate('iv_one_compartment', self.t_eval,
+                                  dict(self.model_input, CL=CL),
+                                  method='exact')
+            for CL in (0.5, 1.0)])
+        solo = pk.iv_one_compartment(self.t_eval, np.zeros(1),
+                                     self.model_input, method='exact')
+        for sol in results:
+            self.assertEqual(sol.batch_size, 2)
+            self.assertEqual(set(sol.diagnostics), set(solo.diagnostics))
+            self.assertEqual(sol.diagnostics['method'], 'exact')
+            self.assertIsNone(sol.nfev)
+
+    async def test_adaptive_not_batched(self):
+        # the accuracy of an adaptive solve must not depend on the requests
+        # that arrive with it
+        requests = [dict(self.model_input, CL=5.0, k_a=50.0)] + [
+            dict(self.model_input, CL=CL) for CL in np.linspace(0.5, 2, 10)]
+        results = await asyncio.gather(*[
+            self.service.simulate('subcutaneous', self.t_eval, model_input)
+            for model_input in requests])
+        self.assertEqual(self.service.batches, 0)
+        solo = pk.subcutaneous(self.t_eval, np.zeros(3), requests[0])
+        npt.assert_array_equal(results[0].y, solo.y)
+        self.assertNotIn('batch_size', results[0])
+
+    async def test_y0_shape(self):
+        # mismatched initial conditions fail at once instead of hanging
+        requests = asyncio.gather(*[
+            self.service.simulate('subcutaneous', self.t_eval,
+                                  self.model_input, y0=np.zeros(n))
+            for n in (3, 2)])
+        with self.assertRaises(ValueError):
+            await asyncio.wait_for(requests, 10)
+
+    async def test_errors(self):
+        requests = [self.service.simulate('subcutaneous', self.t_eval,
+                                          dict(self.model_input, CL=CL),
+                                          method='no such method')
+                    for CL in (0.5, 1.0)]
+        results = await asyncio.gather(*requests, return_exceptions=True)
+        self.assertTrue(all(isinstance(r, Exception) for r in results))
+        with self.assertRaises(KeyError):
+            await self.service.simulate('no such model', self.t_eval,
+                                        self.model_input)
+
+    async def test_default_service(self):
+        sol = await pk.simulate('iv_one_compartment', self.t_eval,
+                                self.model_input, method='exact')
+        npt.assert_allclose(sol.y, pk.iv_one_compartment(
+            self.t_eval, np.zeros(1), self.model_input, method='exact').y,
+            rtol=1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
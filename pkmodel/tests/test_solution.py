@@ -1,6 +1,13 @@
+import os
+import tempfile
 import unittest
+import matplotlib
+import numpy as np
 import pkmodel as pk
 
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+
 
 class SolutionTest(unittest.TestCase):
     """
@@ -13,3 +20,72 @@ class SolutionTest(unittest.TestCase):
         model = pk.Solution()
         self.assertEqual(model.value, 44)
 
+
+class PlotTest(unittest.TestCase):
+    """
+    Tests plotting model results.
+    """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        t_eval = np.linspace(0, 12, 121)
+        self.models = []
+        for i in range(30):
+            model_input = dict(pk.set_model_args(), CL=0.5 + i / 30,
+                               dose_shape=0, dose_spikes=3,
+                               dose_strength=5.0)
+            sol = pk.subcutaneous(t_eval, np.zeros(3), model_input,
+                                  method='exact')
+            sol.dose = pk.create_dosis_function(t_eval, 0, 3, 5.0)(t_eval)
+            sol.name = 'model ' + str(i)
+            self.models.append(sol)
+
+    def test_modes(self):
+        for mode, n in [('lines', 2), ('collection', 30),
+                        ('envelope', 30), ('auto', 30)]:
+            path = os.path.join(self.directory, mode + '.svg')
+            self.assertEqual(pk.solution(*self.models[:n], path=path,
+                                         mode=mode), path)
+            self.assertTrue(os.path.getsize(path) > 0)
+        self.assertEqual(plt.get_fignums(), [])
+        with self.assertRaises(ValueError):
+            pk.solution(self.models[0], mode='surface')
+        self.assertEqual(plt.get_fignums(), [])
+
+    def test_format_and_default_path(self):
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        self.addCleanup(os.chdir, cwd)
+        path = pk.solution(self.models[0], format='pdf', close=False)
+        self.assertTrue(path.startswith(os.path.join(self.directory,
+                                                     'data')))
+        self.assertTrue(path.endswith('.pdf'))
+        self.assertEqual(len(plt.get_fignums()), 1)
+        plt.close('all')
+
+    def test_collection(self):
+        fig, _ = plt.subplots(2, 1)
+        pk.plot_collection(self.models, fig, max_points=50)
+        collections = fig.axes[0].collections
+        # central, peripheral and dosing compartment
+        self.assertEqual(len(collections), 3)
+        self.assertEqual(len(collections[0].get_segments()), 30)
+        self.assertLessEqual(len(collections[0].get_segments()[0]), 52)
+        plt.close(fig)
+
+    def test_decimate(self):
+        t = np.linspace(0, 1, 10001)
+        y = np.zeros(10001)
+        y[1234] = 1.0
+        y[8765] = -1.0
+        t_d, y_d = pk.decimate(t, y, 100)
+        self.assertLessEqual(len(t_d), 102)
+        self.assertEqual(y_d.max(), 1.0)
+        self.assertEqual(y_d.min(), -1.0)
+        self.assertEqual((t_d[0], t_d[-1]), (0.0, 1.0))
+        self.assertTrue(np.all(np.diff(t_d) > 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pkmodel as pk
+from pkmodel import cli
+
+
+class StoreTest(unittest.TestCase):
+    """
+    Tests writing and reading result stores.
+    """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'results')
+
+    def test_round_trip(self):
+        model_input = pk.set_model_args()
+        model_input.update(dose_shape=0, dose_spikes=2, dose_strength=3.0)
+        sols = [
+            pk.iv_one_compartment(np.linspace(0, 6, 7), np.zeros(1),
+                                  model_input),
+            pk.subcutaneous(np.linspace(0, 12, 13), np.zeros(3),
+                            dict(model_input, CL=2.0)),
+        ]
+        sols[1].dose = np.arange(13.0)
+        pk.write_results(self.path, sols,
+                         [model_input, dict(model_input, CL=2.0)],
+                         names=['iv', 'sc'])
+
+        store = pk.open_results(self.path)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.names, ['iv', 'sc'])
+        self.assertEqual(store.y.shape, (2, 2, 13))
+        self.assertIsInstance(store.y, np.memmap)
+        np.testing.assert_array_equal(store.parameter('CL'), [1.0, 2.0])
+        self.assertNotIn('name', store.parameters)
+
+        first, second = store.run(0), store.run(1)
+        np.testing.assert_array_equal(first.t, sols[0].t)
+        np.testing.assert_array_equal(first.y, sols[0].y)
+        self.assertNotIn('dose_comp', first)
+        self.assertTrue(np.all(np.isnan(first.dose)))
+        np.testing.assert_array_equal(second.y, sols[1].y)
+        np.testing.assert_array_equal(second.dose_comp, sols[1].dose_comp)
+        np.testing.assert_array_equal(second.dose, np.arange(13.0))
+        with self.assertRaises(ValueError):
+            store.y[0, 0, 0] = 1.0
+
+    def test_population_chunks(self):
+        t_eval = np.linspace(0, 12, 25)
+        parameters = {'V_c': np.linspace(1, 2, 10), 'CL': 1.0, 'Q_p1': 1.0,
+                      'V_p1': 1.0, 'k_a': 1.0, 'dose_shape': 1,
+                      'dose_spikes': 1, 'dose_strength': 2.0}
+        y = pk.simulate_population('iv_two_compartments', t_eval, parameters,
+                                   method='exact')
+        with pk.ResultWriter(self.path, 2, 25, ['V_c']) as writer:
+            for chunk in (slice(0, 4), slice(4, 10)):
+                writer.append_many(t_eval, y[chunk],
+                                   params={'V_c': parameters['V_c'][chunk]})
+        store = pk.open_results(self.path)
+        np.testing.assert_array_equal(store.y, y)
+        np.testing.assert_array_equal(store.y[:, 1], y[:, 1])
+        np.testing.assert_array_equal(store.parameter('V_c'),
+                                      parameters['V_c'])
+        self.assertEqual(store.names[9], 'run 9')
+
+    def test_write_runs(self):
+        configs = [{'model': 'iv_one_compartment', 'name': name,
+                    't_eval': np.linspace(0, 6, 13),
+                    'model_input': dict(pk.set_model_args(), dose_shape=1,
+                                        dose_spikes=1, dose_strength=1.0)}
+                   for name in ('a', 'b', 'c')]
+        del configs[1]['model_input']['CL']
+        with pk.ResultWriter(self.path, 1, 13) as writer:
+            failed = writer.write_runs(pk.iter_runs(configs, workers=1),
+                                       configs)
+        self.assertEqual([f.index for f in failed], [1])
+        store = pk.open_results(self.path)
+        self.assertEqual(store.names, ['a', 'c'])
+        np.testing.assert_array_equal(store.run(1).y,
+                                      pk.run_model(configs[2]).y)
+
+    def test_too_large(self):
+        with pk.ResultWriter(self.path, 1, 5) as writer:
+            with self.assertRaises(ValueError):
+                writer.append_many(np.arange(5), np.zeros((1, 2, 5)))
+        self.assertEqual(len(pk.open_results(self.path)), 0)
+
+    def test_cli_store(self):
+        config = os.path.join(os.path.dirname(self.path), 'models.csv')
+        with open(config, 'w') as f:
+            f.write('name,no_peripheral,dose_shape,dose_spikes,'
+                    'dose_strength\na,0,1,1,1.0\nb,2,0,2,1.0\n')
+        cli.main(['run', config, '-w', '1', '-f', 'store', '-o', self.path])
+        store = pk.open_results(self.path)
+        self.assertEqual(store.names, ['a', 'b'])
+        self.assertEqual(store.y.shape, (2, 3, 121))
+        self.assertEqual(store.run(0).y.shape, (1, 121))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+
+
+class SuperpositionTest(unittest.TestCase):
+    """
+    Tests regimens assembled from unit responses.
+    """
+    def setUp(self):
+        self.t_eval = np.linspace(0, 12, 121)
+        self.model_input = dict(pk.set_model_args(), CL=0.5, k_a=2.0,
+                                Q_p1=0.3, V_p1=2.0)
+        self.unit = pk.UnitResponse(self.t_eval, self.model_input,
+                                    dose_comp=True)
+
+    def test_grid_regimen(self):
+        rates, boluses = pk.grid_regimen(self.t_eval, [2.0, 0.5, 11.9],
+                                         [4.0, 1.0, 3.0], [1.0, 0.0, 0.5])
+        self.assertEqual(boluses[5], 1.0)
+        self.assertEqual(boluses.sum(), 1.0)
+        np.testing.assert_allclose(rates[20:30], 4.0)
+        np.testing.assert_allclose(rates[119:], 6.0)
+        self.assertEqual(rates[30], 0.0)
+        with self.assertRaises(ValueError):
+            pk.grid_regimen(self.t_eval, [0.05], [1.0])
+
+    def test_matches_solve(self):
+        dose = pk.create_dosis_function(self.t_eval, 0, 3, 5.0)
+        expected = pk.solve_exact(self.t_eval, np.zeros(3), self.model_input,
+                                  dose, dose_comp=True).y
+        starts = dose.starts
+        rates, _ = self.unit.regimen(starts, 5.0 * 0.1, 0.1)
+        for method in ('direct', 'fft'):
+            np.testing.assert_allclose(
+                self.unit.response(rates, method=method), expected,
+                atol=1e-10)
+
+    def test_bolus(self):
+        bolus = pk.solve_exact(self.t_eval, [2.0, 0, 0], self.model_input,
+                               pk.DoseSchedule([], [], 0.0),
+                               dose_comp=True).y
+        _, boluses = self.unit.regimen([0.0, 6.0], [2.0, 1.0])
+        y = self.unit.response(boluses=boluses)
+        np.testing.assert_allclose(y[:, :60], bolus[:, :60], atol=1e-12)
+        np.testing.assert_allclose(y[:, 60:], bolus[:, 60:]
+                                   + bolus[:, :61] / 2, atol=1e-12)
+
+    def test_many_regimens_and_models(self):
+        rng = np.random.default_rng(0)
+        rates = rng.uniform(size=(4, 1, 121)) * (rng.uniform(
+            size=(4, 1, 121)) < 0.1)
+        boluses = rng.uniform(size=(4, 1, 121)) * (rng.uniform(
+            size=(4, 1, 121)) < 0.05)
+        parameters = dict(self.model_input, CL=np.array([0.5, 1.0]),
+                          V_c=np.array([1.0, 3.0]))
+        unit = pk.UnitResponse(self.t_eval, parameters, dose_comp=True)
+        direct = unit.response(rates, boluses)
+        self.assertEqual(direct.shape, (4, 2, 3, 121))
+        np.testing.assert_allclose(unit.response(rates, boluses, 'fft'),
+                                   direct, atol=1e-10)
+        np.testing.assert_allclose(direct[:, 0], self.unit.response(
+            rates[:, 0], boluses[:, 0]), atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
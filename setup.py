@@ -56,7 +56,14 @@ setup(
     url='https://github.com/kallista-angeloff/pharmacokinetics',
 
     # Packages to include
-    packages=find_packages(include=('pkmodel-blank', 'pkmodel-blank.*')),
+    packages=find_packages(include=('pkmodel', 'pkmodel.*')),
+
+    # Command line entry points
+    entry_points={
+        'console_scripts': [
+            'pkmodel = pkmodel.cli:main',
+        ],
+    },
 
     # List of dependencies
     install_requires=[
@@ -64,6 +71,8 @@ setup(
         'numpy',
         'matplotlib',
         'scipy',
+        # TOML configurations of the command line on Python < 3.11
+        'tomli; python_version < "3.11"',
     ],
     extras_require={
         'docs': [
@@ -76,5 +85,10 @@ setup(
             # Flake8 for code style checking
             'flake8>=3',
         ],
+        'bench': [
+            # Benchmark suite in benchmarks/
+            'pytest',
+            'pytest-benchmark',
+        ],
     },
 )